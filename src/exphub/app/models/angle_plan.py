@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, computed_field, field_validator, model_validator
-from typing import List, Dict
+from typing import List, Dict, Optional
 import csv
 
 
@@ -55,6 +55,30 @@ class AnglePlanModel(BaseModel):
     
 
     plan_type_list: List[str] = Field(default=["Crystal Plan", "NeuXstalViz"])
+    # latest time-to-target estimate of the orientation being counted, from the Temporal Analysis tab
+    time_to_target: Dict[str, Optional[float]] = Field(default={}, title="Time to Target")
+    time_to_target_text: str = Field(default="", title="Current Orientation")
+
+    def set_time_to_target(self, estimate: Dict[str, Optional[float]]) -> None:
+        self.time_to_target = dict(estimate)
+        remaining_charge = self.remaining_proton_charge()
+        if not self.time_to_target:
+            self.time_to_target_text = ""
+        elif self.is_converged():
+            self.time_to_target_text = "Current orientation converged, its remaining beam time can go to the next angle"
+        elif remaining_charge is None:
+            self.time_to_target_text = "Current orientation does not reach the counting target"
+        else:
+            self.time_to_target_text = "Current orientation needs about %.3g C more proton charge" % remaining_charge
+
+    def is_converged(self) -> bool:
+        """True when the current orientation has reached the counting target."""
+        return bool(self.time_to_target.get("reached"))
+
+    def remaining_proton_charge(self) -> Optional[float]:
+        """Proton charge (C) still needed on the current orientation; None when the target is out of reach."""
+        return self.time_to_target.get("remaining_charge")
+
     def load_ap(self, file_path: str) -> None:
         print("load_ap")
         with open(file_path, mode='r') as apfile:
@@ -0,0 +1,200 @@
+"""Offline temporal analysis of finished runs.
+
+Every event file is loaded, filtered and calibrated once, and its events are sorted
+by pulse time, so the events up to any time edge (linear or log-spaced) are a
+prefix of every event list, found by bisection instead of reloading the file for
+every time step. The events up to each edge are integrated with IntegrateEllipsoids
+and the live reduction's settings (main peaks and satellites in one pass), so the
+batch intensities match what the live view showed at the same time. The ellipsoids
+and the adaptive background are fitted to the events, so integrations of disjoint
+slices would not add up to the integration of the whole range.
+"""
+
+import argparse
+import os
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from .workflow_config import WorkflowConfig
+
+if TYPE_CHECKING:
+    from .temporal_analysis import MantidWorkflow
+
+
+def time_edges(total_time: float, time_interval: float, multiplier: float = 1.0) -> np.ndarray:
+    """Stop times of the time steps: every time_interval, or growing by multiplier when it is > 1.
+
+    The last edge is always total_time, so the full run is included.
+    """
+    if total_time < time_interval:
+        return np.array([total_time], dtype=float)
+    if multiplier <= 1:
+        edges = np.arange(1, int(total_time // time_interval) + 1) * time_interval
+    else:
+        num_steps = int(np.log(total_time / time_interval) / np.log(multiplier)) + 1
+        edges = np.unique(time_interval * multiplier ** np.arange(num_steps))
+    edges = edges[edges < total_time]
+    return np.append(edges, total_time).astype(float)
+
+
+def load_sorted_events(workflow: "MantidWorkflow", filename: str, min_tof: float, max_tof: float) -> str:
+    """Load one event file once, calibrated and sorted by pulse time; returns the workspace name."""
+    import mantid.simpleapi as mtdapi
+
+    mtdapi.Load(Filename=filename, OutputWorkspace="batch_event_ws", FilterByTofMin=min_tof, FilterByTofMax=max_tof)
+    mtdapi.FilterBadPulses(InputWorkspace="batch_event_ws", OutputWorkspace="batch_event_ws", LowerCutoff=85)
+    mtdapi.LoadIsawDetCal(InputWorkspace="batch_event_ws", Filename=workflow.calib_fname)
+    mtdapi.SetGoniometer(Workspace="batch_event_ws", Goniometers="Universal")
+    mtdapi.SortEvents(InputWorkspace="batch_event_ws", SortBy="Pulse Time")
+    return "batch_event_ws"
+
+
+def prepare_peaks(
+    workflow: "MantidWorkflow", event_ws_name: str, ub_filename: str, peaks_filename: Optional[str]
+) -> int:
+    """Create batch_peaks_ws from a peaks file, or predict it (with satellites) from the UB.
+
+    Returns the number of main peaks, satellites follow them.
+    """
+    import mantid.simpleapi as mtdapi
+
+    if peaks_filename:
+        mtdapi.LoadIsawPeaks(Filename=peaks_filename, OutputWorkspace="batch_peaks_ws")
+        mtdapi.LoadIsawUB(InputWorkspace="batch_peaks_ws", Filename=ub_filename)
+        mtdapi.IndexPeaks(
+            PeaksWorkspace="batch_peaks_ws",
+            Tolerance=workflow.tolerance,
+            ToleranceForSatellite=workflow.tolerance_satellite,
+            RoundHKLs=False,
+            CommonUBForAll=True,
+        )
+        return mtdapi.mtd["batch_peaks_ws"].getNumberPeaks()
+    mtdapi.LoadIsawUB(InputWorkspace=event_ws_name, Filename=ub_filename)
+    mtdapi.PredictPeaks(
+        InputWorkspace=event_ws_name,
+        WavelengthMin=workflow.pred_min_wavelength,
+        WavelengthMax=workflow.pred_max_wavelength,
+        MinDSpacing=workflow.pred_min_d_spacing,
+        MaxDSpacing=workflow.pred_max_d_spacing,
+        OutputWorkspace="batch_peaks_ws",
+        EdgePixels=18,
+    )
+    num_main_peaks = mtdapi.mtd["batch_peaks_ws"].getNumberPeaks()
+    workflow.add_satellite_peaks("batch_peaks_ws")
+    return num_main_peaks
+
+
+def integrate_time_steps(workflow: "MantidWorkflow", event_ws_name: str, edges: np.ndarray) -> Dict[str, np.ndarray]:
+    """Integrate batch_peaks_ws on the events up to every edge; returns per-peak arrays, one row per edge."""
+    import mantid.simpleapi as mtdapi
+
+    from .beam_accounting import BeamAccounting
+
+    beam_accounting = BeamAccounting(workflow.min_monitor_tof, workflow.max_monitor_tof)
+    beam_accounting.update_proton_charge(mtdapi.mtd[event_ws_name].getRun())
+    num_peaks = mtdapi.mtd["batch_peaks_ws"].getNumberPeaks()
+    intensity = np.zeros((len(edges), num_peaks))
+    sigma = np.zeros((len(edges), num_peaks))
+    proton_charge = np.zeros(len(edges))
+
+    for step, stop_time in enumerate(edges):
+        # the events are pulse-sorted, so every step is found by bisection
+        mtdapi.FilterByTime(
+            InputWorkspace=event_ws_name, OutputWorkspace="batch_step_ws", StartTime=0.0, StopTime=stop_time
+        )
+        # the same stage and settings as the live intensity cycle
+        mtdapi.IntegrateEllipsoids(
+            InputWorkspace="batch_step_ws",
+            PeaksWorkspace="batch_peaks_ws",
+            OutputWorkspace="batch_step_peaks_ws",
+            **workflow.integration_properties(),
+        )
+        step_peaks = mtdapi.mtd["batch_step_peaks_ws"]
+        intensity[step] = np.array(step_peaks.column("Intens"))
+        sigma[step] = np.array(step_peaks.column("SigInt"))
+        proton_charge[step] = beam_accounting.charge_between(0.0, stop_time)
+        print(
+            "time step {:d}/{:d}: 0-{:0.0f} s, {:d} events".format(
+                step + 1, len(edges), stop_time, mtdapi.mtd["batch_step_ws"].getNumberEvents()
+            )
+        )
+
+    for name in ("batch_step_ws", "batch_step_peaks_ws"):
+        if mtdapi.mtd.doesExist(name):
+            mtdapi.DeleteWorkspace(name)
+    return {"intensity": intensity, "sigma": sigma, "proton_charge": proton_charge}
+
+
+def analyse_run(
+    workflow: "MantidWorkflow",
+    filename: str,
+    ub_filename: str,
+    peaks_filename: Optional[str],
+    output_directory: str,
+    multiplier: float = 1.0,
+    min_tof: float = 500,
+    max_tof: float = 16600,
+) -> str:
+    """Write the per-peak time series of one event file as .npy files; returns the output directory."""
+    import mantid.simpleapi as mtdapi
+
+    event_ws_name = load_sorted_events(workflow, filename, min_tof, max_tof)
+    event_ws = mtdapi.mtd[event_ws_name]
+    run_number = event_ws.getRunNumber()
+    total_time = event_ws.getRun()["duration"].value
+    edges = time_edges(total_time, workflow.time_interval, multiplier)
+    print("run {:d}: data collection time {:0.0f} seconds, {:d} time steps".format(run_number, total_time, len(edges)))
+
+    num_main_peaks = prepare_peaks(workflow, event_ws_name, ub_filename, peaks_filename)
+    series = integrate_time_steps(workflow, event_ws_name, edges)
+    hkl, _, _, d_spacing, q_sample = workflow.get_peak_arrays(mtdapi.mtd["batch_peaks_ws"])
+
+    run_directory = os.path.join(output_directory, "run_{:d}".format(run_number))
+    os.makedirs(run_directory, exist_ok=True)
+    arrays = dict(
+        series,
+        time_edges=edges,
+        hkl=hkl,
+        d_spacing=d_spacing,
+        q_sample=q_sample,
+        is_satellite=np.arange(len(hkl)) >= num_main_peaks,
+    )
+    for name, array in arrays.items():
+        np.save(os.path.join(run_directory, name + ".npy"), array)
+    mtdapi.DeleteWorkspace(event_ws_name)
+    mtdapi.DeleteWorkspace("batch_peaks_ws")
+    print(
+        "run {:d}: {:d} peaks x {:d} time steps written to {}".format(run_number, len(hkl), len(edges), run_directory)
+    )
+    return run_directory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-peak intensity time series of finished runs.")
+    parser.add_argument("files", nargs="+", help="event NeXus files, each is loaded once")
+    parser.add_argument("--ub", required=True, help="ISAW UB file")
+    parser.add_argument("--peaks", help="ISAW peaks file; peaks are predicted from the UB if omitted")
+    parser.add_argument("--output", required=True, help="output directory, one run_<number> folder per file")
+    parser.add_argument("--config", help="JSON WorkflowConfig with the calibration and time interval")
+    parser.add_argument("--time-interval", type=float, help="length of the first time step in seconds")
+    parser.add_argument(
+        "--multiplier", type=float, default=1.0, help="growth factor of log-spaced time steps; 1 gives linear steps"
+    )
+    parser.add_argument("--min-tof", type=float, default=500)
+    parser.add_argument("--max-tof", type=float, default=16600)
+    args = parser.parse_args()
+
+    config = WorkflowConfig()
+    if args.config:
+        with open(args.config) as config_file:
+            config = WorkflowConfig.model_validate_json(config_file.read())
+    # the integration radii, prediction limits and satellites are the live reduction's
+    from .temporal_analysis import MantidWorkflow
+
+    workflow = MantidWorkflow(config.time_interval)
+    workflow.apply_config(config)
+    if args.time_interval:
+        workflow.time_interval = args.time_interval
+    for filename in args.files:
+        analyse_run(workflow, filename, args.ub, args.peaks, args.output, args.multiplier, args.min_tof, args.max_tof)
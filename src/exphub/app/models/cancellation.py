@@ -0,0 +1,74 @@
+"""Cooperative cancellation of live reduction cycles.
+
+A cycle holds a CancelToken that is checked between stages. Cancelling also stops the
+Mantid algorithms the cycle is running, found by the workspaces they read or write,
+so the listener's own LoadLiveData and the other reduction path are left alone.
+"""
+
+import threading
+from typing import Any, Iterable
+
+# algorithms the live reduction runs that can take long enough to be worth interrupting
+PIPELINE_ALGORITHMS = (
+    "ConvertToMD",
+    "FindPeaksMD",
+    "FindUBUsingFFT",
+    "PredictPeaks",
+    "CentroidPeaksMD",
+    "IntegrateEllipsoids",
+    "FilterByTime",
+    "BinMD",
+    "PlusMD",
+    "CloneWorkspace",
+)
+
+WORKSPACE_PROPERTIES = ("InputWorkspace", "OutputWorkspace", "PeaksWorkspace")
+
+
+class CycleCancelledError(Exception):
+    """Raised at a stage boundary of a cancelled cycle."""
+
+
+class CancelToken:
+    """Flag shared between the thread running a cycle and whoever wants it stopped."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self.reason = ""
+
+    def cancel(self, reason: str = "") -> None:
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise CycleCancelledError(self.reason)
+
+
+def _touches(algorithm: Any, workspaces: set) -> bool:
+    for name in WORKSPACE_PROPERTIES:
+        try:
+            if algorithm.getPropertyValue(name) in workspaces:
+                return True
+        except RuntimeError:
+            # the algorithm has no such property
+            continue
+    return False
+
+
+def cancel_running_algorithms(workspaces: Iterable[str], algorithm_names: Iterable[str] = PIPELINE_ALGORITHMS) -> int:
+    """Cancel the running instances of algorithm_names that read or write one of workspaces."""
+    from mantid.api import AlgorithmManager
+
+    workspaces = set(workspaces)
+    cancelled = 0
+    for name in algorithm_names:
+        for algorithm in AlgorithmManager.runningInstancesOf(name):
+            if _touches(algorithm, workspaces):
+                algorithm.cancel()
+                cancelled += 1
+    return cancelled
@@ -0,0 +1,53 @@
+"""Reduce a long time series to the points a plot can show.
+
+A trace drawn over a few hundred pixels cannot show tens of thousands of points,
+but dropping points blindly hides spikes and dips. decimate() keeps the minimum and
+the maximum of every bucket of consecutive points (plus the first and last point),
+so the plotted envelope is the same as with the full data. Buckets hold a power of
+two points, so they stay the same while a run grows until the resolution halves.
+With an x range (the zoomed window) only the points inside it are decimated, so
+zooming in refines the trace down to the full resolution. The data itself is never
+modified.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .incremental_fit import Series
+
+
+def visible_slice(x: np.ndarray, x_range: Optional[Sequence[float]]) -> slice:
+    """Indices of the sorted x inside x_range, with one point beyond each edge so lines reach the border."""
+    if x_range is None:
+        return slice(0, len(x))
+    start = max(int(np.searchsorted(x, x_range[0], side="left")) - 1, 0)
+    stop = min(int(np.searchsorted(x, x_range[1], side="right")) + 1, len(x))
+    return slice(start, stop)
+
+
+def decimate(
+    x_values: Series, y_values: Series, budget: int, x_range: Optional[Sequence[float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Min/max decimation of (x, y) to at most about budget points; x must be sorted."""
+    size = min(len(x_values), len(y_values))
+    x = np.asarray(x_values, dtype=float)[:size]
+    y = np.asarray(y_values, dtype=float)[:size]
+    window = visible_slice(x, x_range)
+    x, y = x[window], y[window]
+    if len(x) <= budget:
+        return x, y
+
+    buckets = max(budget // 2, 1)
+    bucket_size = 1 << int(np.ceil(np.log2(len(x) / buckets)))
+    num_buckets = -(-len(x) // bucket_size)
+    padded = np.full(num_buckets * bucket_size, np.nan)
+    padded[: len(y)] = np.where(np.isfinite(y), y, np.nan)
+    rows = padded.reshape(num_buckets, bucket_size)
+    # a bucket of non-finite values keeps its first point
+    empty = np.all(np.isnan(rows), axis=1)
+    rows[empty, 0] = 0.0
+    offsets = np.arange(num_buckets) * bucket_size
+    keep = np.concatenate((offsets + np.nanargmin(rows, axis=1), offsets + np.nanargmax(rows, axis=1), [0, len(x) - 1]))
+    keep = np.unique(keep[keep < len(x)])
+    return x[keep], y[keep]
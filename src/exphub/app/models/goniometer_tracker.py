@@ -0,0 +1,81 @@
+"""Goniometer orientation tracking for the live run.
+
+Reads the latest omega, chi and phi log entries (O(1) per axis), tells whether the
+orientation actually moved, and splits the run into orientation segments so the
+temporal history never accumulates data from different angles.
+"""
+
+from bisect import bisect_right
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+
+class GoniometerTracker:
+    """Latest goniometer angles, rounded to precision degrees, and the segment start times."""
+
+    def __init__(self, axes: Tuple[str, ...] = ("omega", "chi", "phi"), precision: int = 3) -> None:
+        self.axes = axes
+        self.precision = precision
+        self.reset()
+
+    def reset(self) -> None:
+        self.angles: Optional[tuple] = None
+        self.applied_angles: Optional[tuple] = None
+        self.applied_r: Optional[np.ndarray] = None
+        self.segment_starts: List[float] = [0.0]
+        self.segment_angles: List[Optional[tuple]] = [None]
+
+    @property
+    def segment(self) -> int:
+        return len(self.segment_starts) - 1
+
+    def read(self, run: Any) -> Tuple[tuple, tuple]:
+        """Return the latest value and log time (ns) of every axis, None for a missing log."""
+        angles: List[Optional[float]] = []
+        times: List[Optional[int]] = []
+        for name in self.axes:
+            if not run.hasProperty(name):
+                angles.append(None)
+                times.append(None)
+                continue
+            log = run.getProperty(name)
+            last = log.size() - 1
+            angles.append(round(float(log.nthValue(last)), self.precision))
+            times.append(log.nthTime(last).totalNanoseconds())
+        return tuple(angles), tuple(times)
+
+    def update(self, run: Any) -> bool:
+        """Read the logs; returns True and starts a new segment when the orientation moved."""
+        angles, times = self.read(run)
+        if angles == self.angles:
+            return False
+        previous, self.angles = self.angles, angles
+        if previous is None:
+            self.segment_angles[0] = angles
+            return False
+        # an axis whose log disappeared has no time: the move is placed at the end of the data so far
+        moved_at = max(
+            (t for t, a, b in zip(times, angles, previous, strict=True) if a != b and t is not None),
+            default=run.endTime().totalNanoseconds(),
+        )
+        start = (moved_at - run.startTime().totalNanoseconds()) * 1e-9
+        self.segment_starts.append(max(start, self.segment_starts[-1]))
+        self.segment_angles.append(angles)
+        moved_to = dict(zip(self.axes, angles, strict=True))
+        print("goniometer moved to", moved_to, "segment", self.segment, "starts at", start, "s")
+        return True
+
+    def segment_of(self, time: float) -> int:
+        """Index of the orientation segment a time (seconds from run start) belongs to."""
+        return max(bisect_right(self.segment_starts, time) - 1, 0)
+
+    def needs_set_goniometer(self, ws: Any) -> bool:
+        """SetGoniometer is only needed for new angles or a workspace that lost the rotation."""
+        if self.applied_angles != self.angles or self.applied_r is None:
+            return True
+        return not np.allclose(ws.getRun().getGoniometer().getR(), self.applied_r)
+
+    def applied(self, ws: Any) -> None:
+        self.applied_angles = self.angles
+        self.applied_r = np.array(ws.getRun().getGoniometer().getR())
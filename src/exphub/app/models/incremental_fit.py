@@ -0,0 +1,203 @@
+"""Straight-line fits of the temporal history, updated one point at a time.
+
+The history plots fit I/σ(I) against t and the uncertainty against 1/√t. Both fits
+only need the (weighted) sums Σw, Σx, Σy, Σxy, Σx² and Σy² of their points, so each
+new point is an O(1) update and the slope, intercept and confidence band are
+closed-form. Refreshing a figure costs nothing, however long the run.
+
+BootstrapLinearFit keeps B resampled copies of the same sums. Each point enters every
+resample with a Poisson(1) multiplicity. A multinomial resample of n points would
+have to be redrawn whenever n grows, but these resamples grow point by point. Adding
+points is one (B x k) @ (k x 6) product, and the B fitted lines at T times are one
+(B x T) array.
+"""
+
+import math
+from typing import Callable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+# two-sided 95% normal quantile, used for the confidence band
+Z_95 = 1.959963984540054
+NUM_RESAMPLES = 200
+
+# a history series: the workflow's lists, or arrays
+Series = Union[Sequence[float], np.ndarray]
+
+
+class RunningLinearFit:
+    """Weighted least-squares fit of y = slope * x + intercept from running sums."""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.n = 0
+        self.sum_w = self.sum_x = self.sum_y = self.sum_xy = self.sum_xx = self.sum_yy = 0.0
+
+    def add(self, x: float, y: float, weight: float = 1.0) -> None:
+        self.n += 1
+        self.sum_w += weight
+        self.sum_x += weight * x
+        self.sum_y += weight * y
+        self.sum_xy += weight * x * y
+        self.sum_xx += weight * x * x
+        self.sum_yy += weight * y * y
+
+    def _centred(self) -> Tuple[float, float, float]:
+        """Sxx, Sxy and Syy about the means."""
+        sxx = self.sum_xx - self.sum_x * self.sum_x / self.sum_w
+        sxy = self.sum_xy - self.sum_x * self.sum_y / self.sum_w
+        syy = self.sum_yy - self.sum_y * self.sum_y / self.sum_w
+        return sxx, sxy, syy
+
+    def coefficients(self) -> Tuple[float, float]:
+        """Slope and intercept; a flat line through the mean while x has no spread."""
+        if self.n == 0 or self.sum_w <= 0:
+            return 0.0, 0.0
+        sxx, sxy, _ = self._centred()
+        slope = sxy / sxx if sxx > 1e-12 * max(self.sum_xx, 1.0) else 0.0
+        return slope, (self.sum_y - slope * self.sum_x) / self.sum_w
+
+    def predict(self, x: ArrayLike) -> np.ndarray:
+        slope, intercept = self.coefficients()
+        return slope * np.asarray(x, dtype=float) + intercept
+
+    def band(self, x: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        """Lower and upper confidence band of the fitted line at x; zero width below three points."""
+        x = np.asarray(x, dtype=float)
+        y = self.predict(x)
+        if self.n < 3:
+            return y, y
+        sxx, sxy, syy = self._centred()
+        if sxx <= 0:
+            return y, y
+        residual_variance = max(syy - sxy * sxy / sxx, 0.0) / (self.n - 2)
+        mean_x = self.sum_x / self.sum_w
+        half_width = z * np.sqrt(residual_variance * (1.0 / self.sum_w + (x - mean_x) ** 2 / sxx))
+        return y - half_width, y + half_width
+
+
+class BootstrapLinearFit:
+    """Poisson bootstrap of RunningLinearFit: the running sums of num_resamples resamples."""
+
+    def __init__(self, num_resamples: int = NUM_RESAMPLES, seed: int = 0) -> None:
+        self.num_resamples = num_resamples
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        self.rng = np.random.default_rng(self.seed)
+        # columns: Σw, Σx, Σy, Σxy, Σx², Σy² of every resample
+        self.sums = np.zeros((self.num_resamples, 6))
+
+    def add(self, x: np.ndarray, y: np.ndarray, weight: Optional[np.ndarray] = None) -> None:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if not len(x):
+            return
+        weight = np.ones_like(x) if weight is None else np.asarray(weight, dtype=float)
+        multiplicity = self.rng.poisson(1.0, (self.num_resamples, len(x))) * weight
+        self.sums += multiplicity @ np.column_stack((np.ones_like(x), x, y, x * y, x * x, y * y))
+
+    def coefficients(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Slopes and intercepts of all resamples; flat where a resample has no spread in x."""
+        sum_w, sum_x, sum_y, sum_xy, sum_xx, _ = self.sums.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sxx = sum_xx - sum_x * sum_x / sum_w
+            sxy = sum_xy - sum_x * sum_y / sum_w
+            slope = np.where(sxx > 1e-12 * np.maximum(sum_xx, 1.0), sxy / sxx, 0.0)
+            intercept = np.where(sum_w > 0, (sum_y - slope * sum_x) / sum_w, 0.0)
+        return slope, intercept
+
+    def proportional_coefficients(self) -> np.ndarray:
+        """Slope a of y = a * x through the origin, for all resamples."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.sums[:, 4] > 0, self.sums[:, 3] / self.sums[:, 4], 0.0)
+
+    def predict(self, x: ArrayLike) -> np.ndarray:
+        """(resamples x len(x)) fitted lines."""
+        slope, intercept = self.coefficients()
+        return slope[:, None] * np.asarray(x, dtype=float)[None, :] + intercept[:, None]
+
+
+def bootstrap_band(curves: np.ndarray, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+    """Two-sided band of (resamples x T) curves, the percentiles matching a normal band of z."""
+    tail = 50.0 * math.erfc(z / math.sqrt(2.0))
+    # no interpolation between resamples, so infinite curves do not give NaN
+    lower = np.percentile(curves, tail, axis=0, method="lower")
+    return lower, np.percentile(curves, 100.0 - tail, axis=0, method="higher")
+
+
+class HistoryFit:
+    """RunningLinearFit kept in step with an append-only history of (time, value) lists.
+
+    The fit is of value_transform(value) against transform(time), each point weighted
+    by weight(time, value), and bootstrapped alongside with num_resamples resamples.
+    sync() only adds the points appended since the last call.
+    When the history was reset or rewritten (new run, recomputed series) the fit is
+    rebuilt once.
+    """
+
+    def __init__(
+        self,
+        transform: Callable[[np.ndarray], np.ndarray] = lambda t: t,
+        value_transform: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        weight: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None,
+        num_resamples: int = NUM_RESAMPLES,
+    ) -> None:
+        self.transform = transform
+        self.value_transform = value_transform
+        self.weight = weight
+        self.fit = RunningLinearFit()
+        self.bootstrap = BootstrapLinearFit(num_resamples) if num_resamples else None
+        self.num_points = 0
+        self.last_point: Optional[Tuple[float, float]] = None
+
+    def sync(self, times: Series, values: Series) -> RunningLinearFit:
+        size = min(len(times), len(values))
+        if size < self.num_points or (
+            self.num_points and (times[self.num_points - 1], values[self.num_points - 1]) != self.last_point
+        ):
+            self.fit.reset()
+            if self.bootstrap is not None:
+                self.bootstrap.reset()
+            self.num_points = 0
+        if size > self.num_points:
+            t = np.asarray(times[self.num_points : size], dtype=float)
+            y = np.asarray(values[self.num_points : size], dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                x = self.transform(t)
+                w = np.ones_like(y) if self.weight is None else self.weight(t, y)
+                if self.value_transform is not None:
+                    y = self.value_transform(y)
+            # 1/√t is undefined at t = 0
+            valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(w) & (w > 0)
+            x, y, w = x[valid], y[valid], w[valid]
+            for xi, yi, wi in zip(x, y, w, strict=True):
+                self.fit.add(float(xi), float(yi), float(wi))
+            if self.bootstrap is not None:
+                self.bootstrap.add(x, y, w)
+            self.num_points = size
+            self.last_point = (times[size - 1], values[size - 1])
+        return self.fit
+
+    def predict(self, times: ArrayLike) -> np.ndarray:
+        with np.errstate(divide="ignore"):
+            return self.fit.predict(self.transform(np.asarray(times, dtype=float)))
+
+    def band(self, times: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        with np.errstate(divide="ignore"):
+            return self.fit.band(self.transform(np.asarray(times, dtype=float)), z)
+
+    def resampled(self, times: ArrayLike) -> Optional[np.ndarray]:
+        """(resamples x len(times)) bootstrap predictions in the fitted space, None without a bootstrap."""
+        if self.bootstrap is None:
+            return None
+        with np.errstate(divide="ignore"):
+            return self.bootstrap.predict(self.transform(np.asarray(times, dtype=float)))
+
+
+def inverse_sqrt(t: np.ndarray) -> np.ndarray:
+    return 1.0 / np.sqrt(t)
@@ -0,0 +1,247 @@
+"""Incremental merging statistics for the live peaks workspace.
+
+StatisticsOfPeaksWorkspace re-sorts and re-merges every peak each cycle. Here the
+HKL -> unique reflection map is precomputed once per point group, and running sums
+are kept per unique reflection, so a cycle only touches the peaks whose intensity
+changed.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# reflection conditions for the lattice centerings offered in ExperimentInfoModel:
+# a reflection is allowed when (coefficients . hkl) % modulus == 0 for every pair
+CENTERING_CONDITIONS: Dict[str, List[Tuple[Tuple[int, int, int], int]]] = {
+    "P": [],
+    "I": [((1, 1, 1), 2)],
+    "C": [((1, 1, 0), 2)],
+    "A": [((0, 1, 1), 2)],
+    "B": [((1, 0, 1), 2)],
+    "F": [((1, 1, 0), 2), ((1, 0, 1), 2), ((0, 1, 1), 2)],
+    "R": [((-1, 1, 1), 3)],
+    "Robv": [((-1, 1, 1), 3)],
+    "Rrev": [((1, -1, 1), 3)],
+}
+
+
+def point_group_operations(point_group: str) -> np.ndarray:
+    """Return the (M, 3, 3) integer HKL transformation matrices of a Mantid point group."""
+    from mantid.geometry import PointGroupFactory
+    from mantid.kernel import V3D
+
+    pg = PointGroupFactory.createPointGroup(point_group)
+    basis = [V3D(1, 0, 0), V3D(0, 1, 0), V3D(0, 0, 1)]
+    operations = []
+    for op in pg.getSymmetryOperations():
+        columns = [np.array(op.transformHKL(e)) for e in basis]
+        operations.append(np.rint(np.column_stack(columns)).astype(int))
+    return np.array(operations)
+
+
+class SymmetryEquivalenceIndex:
+    """Precomputed HKL -> unique reflection lookup table for one point group and centering."""
+
+    def __init__(self, operations: np.ndarray, centering: str = "P", max_index: int = 40) -> None:
+        self.operations = np.asarray(operations, dtype=int)
+        self.centering = centering
+        # the Mantid point group symbol, when the operations came from one
+        self.point_group: Optional[str] = None
+        self.max_index = 0
+        self.build(max_index)
+
+    @classmethod
+    def from_point_group(
+        cls, point_group: str, centering: str = "P", max_index: int = 40
+    ) -> "SymmetryEquivalenceIndex":
+        index = cls(point_group_operations(point_group), centering, max_index)
+        index.point_group = point_group
+        return index
+
+    def _encode(self, hkl: np.ndarray) -> np.ndarray:
+        n = 2 * self.max_index + 1
+        shifted = hkl + self.max_index
+        return (shifted[..., 0] * n + shifted[..., 1]) * n + shifted[..., 2]
+
+    def build(self, max_index: int) -> None:
+        """Build the lookup table for every HKL with |h|,|k|,|l| <= max_index."""
+        self.max_index = max_index
+        axis = np.arange(-max_index, max_index + 1)
+        grid = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+
+        # the representative of each reflection family is the equivalent with the largest code
+        representative = np.full(len(grid), -1, dtype=np.int64)
+        for op in self.operations:
+            equivalent = grid @ op.T
+            inside = np.all(np.abs(equivalent) <= max_index, axis=1)
+            code = np.where(inside, self._encode(np.clip(equivalent, -max_index, max_index)), -1)
+            np.maximum(representative, code, out=representative)
+
+        unique_codes, self.unique_id = np.unique(representative, return_inverse=True)
+        self.unique_id = self.unique_id.astype(np.int64)
+        n = 2 * max_index + 1
+        self.unique_hkl = np.column_stack(
+            (unique_codes // (n * n) - max_index, (unique_codes // n) % n - max_index, unique_codes % n - max_index)
+        )
+        self.num_unique = len(unique_codes)
+        self.grid = grid
+
+    def ensure(self, max_index: int) -> bool:
+        """Grow the table when observed indices exceed it; returns True if it was rebuilt."""
+        if max_index <= self.max_index:
+            return False
+        self.build(max_index + 5)
+        return True
+
+    def allowed(self, hkl: np.ndarray) -> np.ndarray:
+        allowed = np.ones(len(hkl), dtype=bool)
+        for coefficients, modulus in CENTERING_CONDITIONS.get(self.centering, []):
+            allowed &= hkl @ np.array(coefficients) % modulus == 0
+        return allowed
+
+    def lookup(self, hkl: np.ndarray) -> np.ndarray:
+        """Map integer HKL rows to unique reflection ids."""
+        return self.unique_id[self._encode(np.asarray(hkl, dtype=np.int64))]
+
+    def expected_unique(self, ub: np.ndarray, d_min: float, d_max: float) -> np.ndarray:
+        """Unique ids of all centering-allowed reflections with d_min <= d <= d_max."""
+        q = self.grid @ np.asarray(ub).T
+        with np.errstate(divide="ignore"):
+            d = 1.0 / np.linalg.norm(q, axis=1)
+        mask = (d >= d_min) & (d <= d_max) & self.allowed(self.grid)
+        return np.unique(self.unique_id[mask])
+
+
+class IncrementalMergingStatistics:
+    """Running per-unique-reflection sums giving Rmerge, Rpim, multiplicity, completeness and mean I/sigma.
+
+    Observations are identified by an integer key (a row index or a persistent peak id). Each
+    update only subtracts and re-adds the observations that are new, removed or changed.
+    """
+
+    def __init__(self, index: SymmetryEquivalenceIndex) -> None:
+        self.index = index
+        self.expected: Optional[np.ndarray] = None
+        self._expected_key: Optional[tuple] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.obs_key = np.array([], dtype=np.int64)
+        self.obs_unique = np.array([], dtype=np.int64)
+        self.obs_intensity = np.array([], dtype=float)
+        self.obs_sigma = np.array([], dtype=float)
+        self.obs_d = np.array([], dtype=float)
+        size = self.index.num_unique
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sum_intensity = np.zeros(size)
+        self.sum_abs_deviation = np.zeros(size)
+        self.sum_i_over_sigma = 0.0
+
+    def set_resolution_limits(self, ub: np.ndarray, d_min: float, d_max: float) -> None:
+        """Set the reflections completeness is measured against; cached per UB and d range."""
+        key = (np.asarray(ub).round(8).tobytes(), round(d_min, 6), round(d_max, 6), self.index.max_index)
+        if key != self._expected_key:
+            self.expected = self.index.expected_unique(ub, d_min, d_max)
+            self._expected_key = key
+
+    def _accumulate(self, unique: np.ndarray, intensity: np.ndarray, sigma: np.ndarray, sign: int) -> None:
+        size = self.index.num_unique
+        self.count += sign * np.bincount(unique, minlength=size)
+        self.sum_intensity += sign * np.bincount(unique, weights=intensity, minlength=size)
+        self.sum_i_over_sigma += sign * float(np.sum(intensity / sigma))
+
+    def update(
+        self,
+        keys: np.ndarray,
+        hkl: np.ndarray,
+        intensity: np.ndarray,
+        sigma: np.ndarray,
+        d_spacing: Optional[np.ndarray] = None,
+    ) -> int:
+        """Merge this cycle's peaks; returns the number of observations that changed."""
+        keys = np.asarray(keys, dtype=np.int64)
+        hkl = np.rint(np.asarray(hkl, dtype=float)).astype(np.int64)
+        intensity = np.asarray(intensity, dtype=float)
+        sigma = np.asarray(sigma, dtype=float)
+        d_spacing = np.zeros(len(keys)) if d_spacing is None else np.asarray(d_spacing, dtype=float)
+
+        valid = np.any(hkl != 0, axis=1) & (sigma > 0) & np.isfinite(intensity) & self.index.allowed(hkl)
+        keys, hkl, d_spacing = keys[valid], hkl[valid], d_spacing[valid]
+        intensity, sigma = intensity[valid], sigma[valid]
+        if len(hkl) and self.index.ensure(int(np.abs(hkl).max())):
+            # the lookup table grew, so unique ids moved: rebuild every sum from this cycle
+            self._expected_key = None
+            self.reset()
+        unique = self.index.lookup(hkl)
+
+        order = np.argsort(keys)
+        keys, unique, intensity, sigma, d_spacing = (
+            keys[order],
+            unique[order],
+            intensity[order],
+            sigma[order],
+            d_spacing[order],
+        )
+
+        # previous observations that disappeared or changed are taken out of the sums
+        position = np.clip(np.searchsorted(keys, self.obs_key), 0, max(len(keys) - 1, 0))
+        kept = (keys[position] == self.obs_key) if len(keys) else np.zeros(len(self.obs_key), dtype=bool)
+        same = kept.copy()
+        same[kept] = (
+            (unique[position[kept]] == self.obs_unique[kept])
+            & (intensity[position[kept]] == self.obs_intensity[kept])
+            & (sigma[position[kept]] == self.obs_sigma[kept])
+        )
+        stale = ~same
+        self._accumulate(self.obs_unique[stale], self.obs_intensity[stale], self.obs_sigma[stale], -1)
+
+        # new or changed observations are added back
+        unchanged = np.zeros(len(keys), dtype=bool)
+        unchanged[position[same]] = True
+        fresh = ~unchanged
+        self._accumulate(unique[fresh], intensity[fresh], sigma[fresh], +1)
+
+        dirty = np.union1d(self.obs_unique[stale], unique[fresh])
+        self.obs_key, self.obs_unique = keys, unique
+        self.obs_intensity, self.obs_sigma, self.obs_d = intensity, sigma, d_spacing
+
+        # sum |I - <I>| only changes for reflections whose mean changed
+        if len(dirty):
+            self.sum_abs_deviation[dirty] = 0.0
+            members = np.isin(self.obs_unique, dirty)
+            u = self.obs_unique[members]
+            mean = self.sum_intensity[u] / self.count[u]
+            np.add.at(self.sum_abs_deviation, u, np.abs(self.obs_intensity[members] - mean))
+        return int(np.count_nonzero(fresh) + np.count_nonzero(stale & ~kept))
+
+    def statistics(self) -> Dict[str, float]:
+        """Statistics keyed like the StatisticsOfPeaksWorkspace table."""
+        observed = self.count > 0
+        repeated = self.count > 1
+        num_observations = int(self.count.sum())
+        num_unique = int(np.count_nonzero(observed))
+        merged_intensity = float(self.sum_intensity[repeated].sum())
+        if merged_intensity > 0:
+            rmerge = 100.0 * float(self.sum_abs_deviation[repeated].sum()) / merged_intensity
+            rpim = (
+                100.0
+                * float(np.sum(np.sqrt(1.0 / (self.count[repeated] - 1)) * self.sum_abs_deviation[repeated]))
+                / merged_intensity
+            )
+        else:
+            rmerge = rpim = 0.0
+        if self.expected is not None and len(self.expected):
+            completeness = 100.0 * float(np.count_nonzero(observed[self.expected])) / len(self.expected)
+        else:
+            completeness = 0.0
+        d = self.obs_d[self.obs_d > 0]
+        return {
+            "No. of Unique Reflections": num_unique,
+            "Resolution Min": float(d.min()) if len(d) else 0.0,
+            "Resolution Max": float(d.max()) if len(d) else 0.0,
+            "Multiplicity": num_observations / num_unique if num_unique else 0.0,
+            "Mean ((I)/sd(I))": self.sum_i_over_sigma / num_observations if num_observations else 0.0,
+            "Rmerge": float(rmerge),
+            "Rpim": float(rpim),
+            "Data Completeness": completeness,
+        }
@@ -0,0 +1,153 @@
+"""Integrated intensity of every predicted peak at every reduction interval.
+
+Each intensity cycle integrates all predicted peaks on the events received so far.
+PeakIntervalMatrix keeps each cycle's intensity and variance (σ²) as one column of a
+sparse (peak id x interval) matrix. A peak only has entries in the intervals where
+it was predicted. The entries are appended to growing coordinate arrays.
+
+The fraction of peaks above nσ and the percentiles of I/σ are reduced from the new
+column only when it is added, and kept per interval, so a cycle costs the same
+however long the run is. The coordinate arrays are capped at max_entries: when they
+are full, the entries of the oldest intervals are dropped, so convergence curves and
+per-peak histories cover the most recent intervals while the per-interval summaries
+cover the whole run.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+from numpy.typing import ArrayLike
+from scipy import sparse
+
+
+class PeakIntervalMatrix:
+    """Sparse (peak id x interval) intensity and variance, grown one interval at a time."""
+
+    def __init__(
+        self,
+        levels: Sequence[float] = (2.0, 3.0, 5.0, 10.0),
+        percents: Sequence[float] = (10.0, 50.0, 90.0),
+        capacity: int = 4096,
+        max_entries: int = 2_000_000,
+    ) -> None:
+        self.levels = tuple(levels)
+        self.percents = tuple(percents)
+        self.max_entries = max_entries
+        self.reset(capacity)
+
+    def reset(self, capacity: int = 4096) -> None:
+        self.nnz = 0
+        self.peaks = np.empty(capacity, dtype=np.int64)
+        self.intervals = np.empty(capacity, dtype=np.int64)
+        self.intensity = np.empty(capacity)
+        self.variance = np.empty(capacity)
+        self.times: List[float] = []
+        self.num_peaks = 0
+        # intervals before this one were dropped from the coordinate arrays
+        self.first_interval = 0
+        # per interval: number of peaks, fraction above each level and I/σ percentiles
+        self.counts: List[int] = []
+        self.fractions: List[np.ndarray] = []
+        self.ratio_percentiles: List[np.ndarray] = []
+
+    @property
+    def num_intervals(self) -> int:
+        return len(self.times)
+
+    def add_interval(self, time: float, peak_ids: ArrayLike, intensity: ArrayLike, sigma: ArrayLike) -> int:
+        """Append the integration of one cycle and its summaries; returns its interval index."""
+        peak_ids = np.asarray(peak_ids, dtype=np.int64)
+        intensity = np.asarray(intensity, dtype=float)
+        sigma = np.asarray(sigma, dtype=float)
+        self._make_room(len(peak_ids))
+        needed = self.nnz + len(peak_ids)
+        if needed > len(self.peaks):
+            size = max(needed, 2 * len(self.peaks))
+            for name in ("peaks", "intervals", "intensity", "variance"):
+                setattr(self, name, np.resize(getattr(self, name), size))
+        interval = self.num_intervals
+        entries = slice(self.nnz, needed)
+        self.peaks[entries] = peak_ids
+        self.intervals[entries] = interval
+        self.intensity[entries] = intensity
+        self.variance[entries] = np.square(sigma)
+        self.nnz = needed
+        self.times.append(time)
+        if len(peak_ids):
+            self.num_peaks = max(self.num_peaks, int(peak_ids.max()) + 1)
+        self._summarize(_ratio(intensity, sigma))
+        return interval
+
+    def _make_room(self, count: int) -> None:
+        """Drop the oldest intervals so that count more entries fit under max_entries."""
+        excess = self.nnz + count - self.max_entries
+        if excess <= 0:
+            return
+        # drop at least a quarter of the cap at once, so the arrays are not shifted every cycle
+        drop = min(max(excess, self.max_entries // 4), self.nnz)
+        if drop < self.nnz:
+            # whole intervals only
+            drop = int(np.searchsorted(self.intervals[: self.nnz], self.intervals[drop - 1], side="right"))
+        kept = self.nnz - drop
+        for name in ("peaks", "intervals", "intensity", "variance"):
+            values = getattr(self, name)
+            values[:kept] = values[drop : self.nnz]
+        self.nnz = kept
+        self.first_interval = int(self.intervals[0]) if kept else self.num_intervals
+
+    def _summarize(self, ratio: np.ndarray) -> None:
+        self.counts.append(len(ratio))
+        if len(ratio):
+            self.fractions.append(np.array([np.mean(ratio > level) for level in self.levels]))
+            self.ratio_percentiles.append(np.percentile(ratio, self.percents))
+        else:
+            self.fractions.append(np.zeros(len(self.levels)))
+            self.ratio_percentiles.append(np.full(len(self.percents), np.nan))
+
+    def matrix(self, name: str = "intensity") -> sparse.csc_matrix:
+        """The (peak id x interval) matrix of intensity or variance; dropped intervals are empty."""
+        entries = slice(0, self.nnz)
+        return sparse.csc_matrix(
+            (getattr(self, name)[entries], (self.peaks[entries], self.intervals[entries])),
+            shape=(self.num_peaks, self.num_intervals),
+        )
+
+    def i_over_sigma(self) -> np.ndarray:
+        """I/σ of every kept entry, 0 where σ is 0."""
+        return _ratio(self.intensity[: self.nnz], np.sqrt(self.variance[: self.nnz]))
+
+    def peaks_per_interval(self) -> np.ndarray:
+        return np.array(self.counts, dtype=np.int64)
+
+    def fraction_above(self) -> np.ndarray:
+        """(levels x intervals) fraction of the predicted peaks with I > level * σ."""
+        return np.array(self.fractions).T.reshape(len(self.levels), self.num_intervals)
+
+    def percentiles(self) -> np.ndarray:
+        """(percents x intervals) percentiles of I/σ over the peaks of each interval, linearly interpolated."""
+        return np.array(self.ratio_percentiles).T.reshape(len(self.percents), self.num_intervals)
+
+    def convergence(self, peak_ids: ArrayLike) -> np.ndarray:
+        """(peaks x intervals) I/σ of the given peak ids, NaN where a peak was not predicted or was dropped."""
+        peak_ids = np.asarray(peak_ids, dtype=np.int64)
+        curves = np.full((len(peak_ids), self.num_intervals), np.nan)
+        position = np.full(max(self.num_peaks, 1), -1)
+        known = peak_ids < self.num_peaks
+        position[peak_ids[known]] = np.flatnonzero(known)
+        peaks = self.peaks[: self.nnz]
+        selected = position[peaks] >= 0
+        curves[position[peaks[selected]], self.intervals[: self.nnz][selected]] = self.i_over_sigma()[selected]
+        return curves
+
+    def history_of(self, peak_id: int) -> np.ndarray:
+        """(T, 3) array of time, intensity and sigma kept for one peak."""
+        entries = np.flatnonzero(self.peaks[: self.nnz] == peak_id)
+        times = np.asarray(self.times, dtype=float)
+        return np.column_stack(
+            (times[self.intervals[entries]], self.intensity[entries], np.sqrt(self.variance[entries]))
+        ).reshape(-1, 3)
+
+
+def _ratio(intensity: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+    """I/σ, 0 where σ is 0."""
+    return np.divide(intensity, sigma, out=np.zeros_like(intensity), where=sigma > 0)
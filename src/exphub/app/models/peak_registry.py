@@ -0,0 +1,79 @@
+"""Persistent peak identities across live reduction cycles.
+
+PredictPeaks rebuilds the peaks workspace every orientation update, so row indices
+are not stable. The registry matches each cycle's peaks to the known ones with a
+k-d tree in Q_sample and hands out ids that survive re-prediction. The intensity
+history of every id is kept in a sparse PeakIntervalMatrix.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+from numpy.typing import ArrayLike
+from scipy.spatial import cKDTree
+
+from .peak_matrix import PeakIntervalMatrix
+
+
+class PeakRegistry:
+    """Map peaks to persistent ids by nearest Q_sample and keep a per-id history."""
+
+    def __init__(
+        self,
+        tolerance: float = 0.05,
+        levels: Sequence[float] = (2.0, 3.0, 5.0, 10.0),
+        percents: Sequence[float] = (10.0, 50.0, 90.0),
+    ) -> None:
+        self.tolerance = tolerance
+        # summarized per interval by the history: fraction of peaks above level * sigma and I/sigma percentiles
+        self.levels = tuple(levels)
+        self.percents = tuple(percents)
+        self.reset()
+
+    def reset(self) -> None:
+        self.q_sample = np.empty((0, 3))
+        self.next_id = 0
+        self.history = PeakIntervalMatrix(self.levels, self.percents)
+        self._tree: Optional[cKDTree] = None
+
+    def __len__(self) -> int:
+        """Number of registered peaks."""
+        return len(self.q_sample)
+
+    def match(self, peaks_q_sample: ArrayLike) -> np.ndarray:
+        """Return the persistent id of every row in peaks_q_sample, registering unseen peaks."""
+        q_sample = np.asarray(peaks_q_sample, dtype=float).reshape(-1, 3)
+        ids = np.full(len(q_sample), -1, dtype=np.int64)
+        if len(self.q_sample) and len(q_sample):
+            tree = self._tree
+            if tree is None:
+                # the tree keeps its own copy, so moving rows below cannot corrupt it
+                tree = self._tree = cKDTree(self.q_sample, copy_data=True)
+            distance, nearest = tree.query(q_sample, distance_upper_bound=self.tolerance)
+            matched = np.isfinite(distance)
+            # if two peaks claim the same id, the closest one keeps it
+            order = np.argsort(distance)
+            order = order[matched[order]]
+            _, first = np.unique(nearest[order], return_index=True)
+            winners = order[first]
+            ids[winners] = nearest[winners]
+            # follow small centroid drifts; the tree is rebuilt on the next match when a row moved
+            if np.any(self.q_sample[ids[winners]] != q_sample[winners]):
+                self.q_sample[ids[winners]] = q_sample[winners]
+                self._tree = None
+
+        unseen = ids < 0
+        if np.any(unseen):
+            ids[unseen] = np.arange(self.next_id, self.next_id + np.count_nonzero(unseen))
+            self.next_id += int(np.count_nonzero(unseen))
+            self.q_sample = np.vstack([self.q_sample, q_sample[unseen]])
+            self._tree = None
+        return ids
+
+    def record(self, ids: ArrayLike, time: float, intensity: ArrayLike, sigma: ArrayLike) -> int:
+        """Add one interval with the intensity and sigma of each id; returns the interval index."""
+        return self.history.add_interval(time, ids, intensity, sigma)
+
+    def history_of(self, peak_id: int) -> np.ndarray:
+        """Return the (T, 3) array of time, intensity and sigma recorded for one peak."""
+        return self.history.history_of(peak_id)
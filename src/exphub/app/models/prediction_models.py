@@ -0,0 +1,225 @@
+"""Prediction models for the temporal analysis plots.
+
+A prediction model extrapolates the history of one plot: the intensity (I/σ, or the
+count rate of the tracked peak) or the uncertainty (%). It reads one of the
+workflow's series ("statistics" or "poisson"), updates its fit incrementally from
+the points added since the last data version, and gives predict(t) and a confidence
+band(t). Models register themselves by name. Only the model chosen in the tab is
+built and updated, so adding a model costs the others nothing.
+
+confidence_band() gives the analytic band or a bootstrap band. The bootstrap band
+comes from the (resamples x T) predictions of the model's bootstrapped fit. Both are
+cached per data version.
+"""
+
+from abc import ABC, abstractmethod
+from typing import ClassVar, Dict, Optional, Tuple, Type
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from .incremental_fit import Z_95, HistoryFit, Series, bootstrap_band, inverse_sqrt
+
+CONFIDENCE_BANDS = ["Analytic", "Bootstrap"]
+
+PREDICTION_MODELS: Dict[str, Type["PredictionModel"]] = {}
+
+
+def register_prediction_model(cls: Type["PredictionModel"]) -> Type["PredictionModel"]:
+    PREDICTION_MODELS[cls.name] = cls
+    return cls
+
+
+def create_prediction_model(name: str, plot: str) -> "PredictionModel":
+    if name not in PREDICTION_MODELS:
+        raise ValueError("unknown prediction model %r, choose one of %s" % (name, list(PREDICTION_MODELS)))
+    return PREDICTION_MODELS[name](plot)
+
+
+class PredictionModel(ABC):
+    """Extrapolation of the 'intensity' or 'uncertainty' history, fitted once per data version."""
+
+    name: ClassVar[str] = ""
+    # the workflow series the model is fitted to
+    series: ClassVar[str] = "statistics"
+
+    def __init__(self, plot: str) -> None:
+        if plot not in ("intensity", "uncertainty"):
+            raise ValueError("plot must be 'intensity' or 'uncertainty'")
+        self.plot = plot
+        self.version: Optional[int] = None
+        self.band_cache: Optional[tuple] = None
+
+    def update(self, times: Series, values: Series, version: Optional[int] = None) -> None:
+        """Bring the fit up to date; a version that was already fitted is skipped."""
+        if version is not None and version == self.version:
+            return
+        self.sync(times, values)
+        self.version = version
+
+    @abstractmethod
+    def sync(self, times: Series, values: Series) -> None:
+        """Add the points appended since the last sync, or refit a history that was rewritten."""
+
+    @abstractmethod
+    def predict(self, times: ArrayLike) -> np.ndarray:
+        """The extrapolated value at times."""
+
+    @abstractmethod
+    def band(self, times: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        """Lower and upper analytic confidence band at times."""
+
+    def bootstrap_curves(self, times: ArrayLike) -> Optional[np.ndarray]:
+        """(resamples x T) predictions of the bootstrap resamples, or None without a bootstrap."""
+        return None
+
+    def confidence_band(
+        self, times: ArrayLike, method: str = "Analytic", z: float = Z_95
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The analytic or bootstrap band at times, computed once per data version."""
+        times = np.asarray(times, dtype=float)
+        key = (self.version, method, z, times.tobytes())
+        if self.version is not None and self.band_cache is not None and self.band_cache[0] == key:
+            return self.band_cache[1]
+        curves = self.bootstrap_curves(times) if method == "Bootstrap" else None
+        band = self.band(times, z) if curves is None else bootstrap_band(curves, z)
+        self.band_cache = (key, band)
+        return band
+
+
+@register_prediction_model
+class PoissonModel(PredictionModel):
+    """Counting statistics of the tracked peak: a constant rate and an uncertainty of a / √t."""
+
+    name = "Poisson Model"
+    series = "poisson"
+
+    def __init__(self, plot: str) -> None:
+        super().__init__(plot)
+        self.history = HistoryFit(inverse_sqrt)
+        self.rate = 0.0
+        self.rate_time = 0.0
+
+    def sync(self, times: Series, values: Series) -> None:
+        if self.plot == "intensity":
+            size = min(len(times), len(values))
+            self.rate_time, self.rate = (float(times[size - 1]), float(values[size - 1])) if size else (0.0, 0.0)
+        else:
+            self.history.sync(times, values)
+
+    def coefficient(self) -> Tuple[float, float]:
+        """Coefficient a of the uncertainty a / √t, fitted through the origin, and its standard error."""
+        fit = self.history.fit
+        if fit.sum_xx <= 0:
+            return 0.0, 0.0
+        a = fit.sum_xy / fit.sum_xx
+        if fit.n < 2:
+            return a, 0.0
+        residual_variance = max(fit.sum_yy - a * fit.sum_xy, 0.0) / (fit.n - 1)
+        return a, float(np.sqrt(residual_variance / fit.sum_xx))
+
+    def predict(self, times: ArrayLike) -> np.ndarray:
+        times = np.asarray(times, dtype=float)
+        if self.plot == "intensity":
+            return np.full_like(times, self.rate)
+        with np.errstate(divide="ignore"):
+            return self.coefficient()[0] * inverse_sqrt(times)
+
+    def band(self, times: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        times = np.asarray(times, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.plot == "intensity":
+                # the running rate of n = rate * t counts has a Poisson error of sqrt(rate / t)
+                half_width = z * np.sqrt(np.maximum(self.rate, 0.0) / np.maximum(times, self.rate_time))
+                half_width = np.nan_to_num(half_width)
+                return self.rate - half_width, self.rate + half_width
+            a, error = self.coefficient()
+            x = inverse_sqrt(times)
+        return (a - z * error) * x, (a + z * error) * x
+
+    def bootstrap_curves(self, times: ArrayLike) -> Optional[np.ndarray]:
+        # the rate is a single running value, its band stays analytic
+        bootstrap = self.history.bootstrap
+        if self.plot == "intensity" or bootstrap is None:
+            return None
+        with np.errstate(divide="ignore"):
+            x = inverse_sqrt(np.asarray(times, dtype=float))
+        return bootstrap.proportional_coefficients()[:, None] * x[None, :]
+
+
+@register_prediction_model
+class LinearModel(PredictionModel):
+    """Straight line of I/σ against t, and of the uncertainty against 1/√t."""
+
+    name = "Linear Interpolation"
+
+    def __init__(self, plot: str) -> None:
+        super().__init__(plot)
+        self.history = HistoryFit(inverse_sqrt) if plot == "uncertainty" else HistoryFit()
+
+    def sync(self, times: Series, values: Series) -> None:
+        self.history.sync(times, values)
+
+    def offset(self) -> float:
+        # the uncertainty goes to zero for long counting, so the intercept is left out
+        return self.history.fit.coefficients()[1] if self.plot == "uncertainty" else 0.0
+
+    def predict(self, times: ArrayLike) -> np.ndarray:
+        return self.history.predict(times) - self.offset()
+
+    def band(self, times: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        lower, upper = self.history.band(times, z)
+        return lower - self.offset(), upper - self.offset()
+
+    def bootstrap_curves(self, times: ArrayLike) -> Optional[np.ndarray]:
+        curves, bootstrap = self.history.resampled(times), self.history.bootstrap
+        if curves is not None and bootstrap is not None and self.plot == "uncertainty":
+            curves = curves - bootstrap.coefficients()[1][:, None]
+        return curves
+
+
+@register_prediction_model
+class SaturationModel(PredictionModel):
+    """Counting statistics with a floor: 1/(I/σ)² and uncertainty² are both α/t + β.
+
+    β is the systematic part that longer counting does not reduce, so I/σ saturates
+    at 1/√β. The fit of y^p (p = -2 for I/σ, 2 for the uncertainty) against 1/t is
+    weighted by 1/(p y^(p-1))², which propagates equal errors of y to y^p.
+    """
+
+    name = "Saturation Fit"
+
+    def __init__(self, plot: str) -> None:
+        super().__init__(plot)
+        self.power = -2.0 if plot == "intensity" else 2.0
+        power = self.power
+        self.history = HistoryFit(
+            transform=lambda t: 1.0 / t,
+            value_transform=lambda y: np.abs(y) ** power,
+            weight=lambda t, y: np.abs(y) ** (2.0 - 2.0 * power),
+        )
+
+    def sync(self, times: Series, values: Series) -> None:
+        self.history.sync(times, values)
+
+    def _values(self, transformed: np.ndarray) -> np.ndarray:
+        # a non-positive y^p means the fit puts no bound on y there
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                transformed > 0, np.abs(transformed) ** (1.0 / self.power), np.inf if self.power < 0 else 0.0
+            )
+
+    def limit(self) -> float:
+        """The value for infinite counting time, 1/√β for I/σ and √β for the uncertainty."""
+        return float(self._values(np.array(self.history.fit.coefficients()[1])))
+
+    def predict(self, times: ArrayLike) -> np.ndarray:
+        return self._values(self.history.predict(times))
+
+    def band(self, times: ArrayLike, z: float = Z_95) -> Tuple[np.ndarray, np.ndarray]:
+        lower, upper = (self._values(bound) for bound in self.history.band(times, z))
+        return np.minimum(lower, upper), np.maximum(lower, upper)
+
+    def bootstrap_curves(self, times: ArrayLike) -> Optional[np.ndarray]:
+        curves = self.history.resampled(times)
+        return None if curves is None else self._values(curves)
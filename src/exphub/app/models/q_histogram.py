@@ -0,0 +1,64 @@
+"""Coarse Q_sample histogram for the first level of the live peak search.
+
+The histogram has a fixed grid and is grown from the BinMD of each new event chunk,
+so finding candidates costs the same whatever the length of the run. Candidates are
+local maxima above a density threshold; they are refined afterwards at event
+resolution (CentroidPeaksMD) in small neighbourhoods only.
+"""
+
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+
+class CoarseQHistogram:
+    """Cubic Q_sample histogram over [-max_q, max_q] with bins voxels per axis."""
+
+    def __init__(self, max_q: float = 12.0, bins: int = 160) -> None:
+        self.max_q = max_q
+        self.bins = bins
+        self.reset()
+
+    def reset(self) -> None:
+        self.signal = np.zeros((self.bins,) * 3)
+        self.chunks = 0
+
+    @property
+    def bin_width(self) -> float:
+        return 2.0 * self.max_q / self.bins
+
+    def binmd_dimensions(self) -> dict:
+        """AlignedDim properties for BinMD producing this grid from a Q_sample MD workspace."""
+        extent = "{},{},{}".format(-self.max_q, self.max_q, self.bins)
+        return {
+            "AlignedDim0": "Q_sample_x," + extent,
+            "AlignedDim1": "Q_sample_y," + extent,
+            "AlignedDim2": "Q_sample_z," + extent,
+        }
+
+    def add(self, signal: np.ndarray) -> None:
+        """Accumulate the binned signal of one event chunk."""
+        signal = np.nan_to_num(np.asarray(signal, dtype=float).reshape(self.signal.shape))
+        self.signal += signal
+        self.chunks += 1
+
+    def centres(self, index: np.ndarray) -> np.ndarray:
+        """Q_sample of the centres of voxel indices (N, 3)."""
+        return -self.max_q + (np.asarray(index) + 0.5) * self.bin_width
+
+    def find_candidates(
+        self, density_threshold_factor: float = 100, max_peaks: int = 1000, separation: float = 0.6
+    ) -> np.ndarray:
+        """Return the Q_sample (N, 3) of the strongest local maxima, strongest first.
+
+        Like FindPeaksMD, a voxel qualifies when its signal exceeds density_threshold_factor
+        times the mean signal, and maxima closer than separation are merged into one.
+        """
+        threshold = density_threshold_factor * self.signal.mean()
+        if threshold <= 0:
+            return np.empty((0, 3))
+        size = 2 * max(1, int(np.ceil(separation / self.bin_width))) + 1
+        local_max = maximum_filter(self.signal, size=size, mode="constant") == self.signal
+        mask = local_max & (self.signal > threshold)
+        index = np.argwhere(mask)
+        order = np.argsort(self.signal[mask])[::-1][:max_peaks]
+        return self.centres(index[order])
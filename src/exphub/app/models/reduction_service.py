@@ -0,0 +1,154 @@
+"""One live reduction per instrument, shared by every connected viewer.
+
+The service owns the orientation and intensity loops of a MantidWorkflow and runs
+them in its own threads. Viewers subscribe with a callback and receive the same
+snapshot after every intensity cycle that changed the results, on their own event loop.
+Pressing "Auto Update" again only subscribes. Anything derived from a snapshot (figures)
+can be cached per data version, so the work done per cycle does not grow with the
+number of viewers and a cycle without new data costs nothing.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+from typing import Any, Callable, ClassVar, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReductionService:
+    """Run one workflow's loops in background threads and publish its snapshots."""
+
+    _services: ClassVar[Dict[str, "ReductionService"]] = {}
+    _services_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, instrument: str, workflow: Any) -> None:
+        self.instrument = instrument
+        self.workflow = workflow
+        self.subscribers: Dict[int, Tuple[Optional[asyncio.AbstractEventLoop], Callable[[dict], None]]] = {}
+        self._ids = itertools.count()
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.threads: List[threading.Thread] = []
+        self.started = False
+        self.version = 0
+        self.latest: Optional[dict] = None
+        self._cache: Dict[Hashable, Tuple[int, Any]] = {}
+
+    @classmethod
+    def for_instrument(cls, instrument: str, create_workflow: Callable[[], Any]) -> "ReductionService":
+        """Return the service of an instrument, building its workflow with create_workflow the first time."""
+        with cls._services_lock:
+            service = cls._services.get(instrument)
+            if service is None:
+                service = cls(instrument, create_workflow())
+                cls._services[instrument] = service
+            return service
+
+    @classmethod
+    def stop_all(cls) -> None:
+        """Stop every instrument's reduction, at server shutdown."""
+        with cls._services_lock:
+            services = list(cls._services.values())
+        for service in services:
+            service.stop()
+
+    def subscribe(self, callback: Callable[[dict], None], loop: Optional[asyncio.AbstractEventLoop] = None) -> int:
+        """Register a viewer; callback(snapshot) is called on loop (or directly if loop is None)."""
+        with self.lock:
+            subscription = next(self._ids)
+            self.subscribers[subscription] = (loop, callback)
+            latest = self.latest
+        if latest is not None:
+            self._deliver(loop, callback, latest)
+        return subscription
+
+    def unsubscribe(self, subscription: int) -> None:
+        with self.lock:
+            self.subscribers.pop(subscription, None)
+
+    def start(self) -> bool:
+        """Start live data and the loops; returns False if they are already running."""
+        with self.lock:
+            if self.started:
+                return False
+            self.workflow.start_live_data_collection_instances()
+            self.stop_event.clear()
+            self.threads = [
+                threading.Thread(target=self._orientation_loop, name="%s-orientation" % self.instrument, daemon=True),
+                threading.Thread(target=self._intensity_loop, name="%s-intensity" % self.instrument, daemon=True),
+            ]
+            for thread in self.threads:
+                thread.start()
+            self.started = True
+            logger.info("live reduction service started for %s", self.instrument)
+            return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the loops, wait for their current cycle to end, then stop live data."""
+        with self.lock:
+            if not self.started:
+                return
+            self.stop_event.set()
+            threads, self.threads = self.threads, []
+        # the loops take self.lock to publish, so they are joined without holding it
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        with self.lock:
+            self.workflow.stop_live_data_collection_instances()
+            self.started = False
+
+    def publish(self, snapshot: dict) -> bool:
+        """Send snapshot to every viewer, unless its data_version was already published."""
+        with self.lock:
+            version = snapshot.get("data_version", self.version + 1)
+            if self.latest is not None and version == self.version:
+                return False
+            self.version = version
+            snapshot = dict(snapshot, version=self.version)
+            self.latest = snapshot
+            subscribers = list(self.subscribers.values())
+        for loop, callback in subscribers:
+            self._deliver(loop, callback, snapshot)
+        return True
+
+    def cached(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Build once per data version and key, then share the result between viewers."""
+        with self.lock:
+            version = self.version
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+        value = build()
+        with self.lock:
+            self._cache[key] = (version, value)
+        return value
+
+    @staticmethod
+    def _deliver(loop: Optional[asyncio.AbstractEventLoop], callback: Callable[[dict], None], snapshot: dict) -> None:
+        if loop is None:
+            callback(snapshot)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(callback, snapshot)
+
+    def _orientation_loop(self) -> None:
+        """Slow loop: peak search, UB and prediction, every few minutes or on a goniometer move."""
+        while not self.stop_event.is_set():
+            try:
+                if self.workflow.orientation_update_due():
+                    self.workflow.update_orientation()
+            except Exception:
+                logger.exception("orientation update of %s failed", self.instrument)
+            self.stop_event.wait(self.workflow.fast_update_interval)
+
+    def _intensity_loop(self) -> None:
+        """Fast loop: integration and statistics on the current predicted peaks, then publish."""
+        while not self.stop_event.is_set():
+            try:
+                self.workflow.update_intensity()
+                self.publish(self.workflow.snapshot())
+            except Exception:
+                logger.exception("intensity update of %s failed", self.instrument)
+            self.stop_event.wait(self.workflow.fast_update_interval)
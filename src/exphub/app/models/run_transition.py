@@ -0,0 +1,73 @@
+"""Run start/stop detection for the live workspace.
+
+StartLiveData is run with RunTransitionBehavior='Rename': at the end of a run the
+listener renames the accumulated workspace (the run number is appended) and starts a
+fresh one for the next run. Observing those ADS notifications replaces polling the
+run number every cycle.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from mantid.api import AnalysisDataServiceObserver
+
+
+class RunTransitionMonitor(AnalysisDataServiceObserver):
+    """Call on_run_stop(run, archived_name) and on_run_start(run) on the listener's run transitions.
+
+    The callbacks run on the MonitorLiveData thread, so they should only hand work off.
+    """
+
+    def __init__(
+        self,
+        workspace_name: str,
+        current_run: int,
+        on_run_start: Callable[[int], None],
+        on_run_stop: Optional[Callable[[int, str], None]] = None,
+    ) -> None:
+        super().__init__()
+        self.workspace_name = workspace_name
+        self.current_run = current_run
+        self.on_run_start = on_run_start
+        self.on_run_stop = on_run_stop
+        self.archived: Dict[int, str] = {}
+        self.lock = threading.Lock()
+        self.observeAdd(True)
+        self.observeReplace(True)
+        self.observeRename(True)
+
+    def archived_workspace(self, run: int) -> str:
+        """Name the listener gave to the workspace of a finished run."""
+        with self.lock:
+            return self.archived.get(run, "%s_%s" % (self.workspace_name, run))
+
+    # the handle names are the ones AnalysisDataServiceObserver calls
+    def renameHandle(self, ws_name: str, new_name: str) -> None:  # noqa: N802
+        if ws_name != self.workspace_name:
+            return
+        with self.lock:
+            run = self.current_run
+            self.archived[run] = new_name
+        print("run", run, "stopped, events kept in", new_name)
+        if self.on_run_stop is not None:
+            self.on_run_stop(run, new_name)
+
+    def addHandle(self, ws_name: str, ws: Any) -> None:  # noqa: N802
+        if ws_name == self.workspace_name:
+            self._check_run(ws)
+
+    def replaceHandle(self, ws_name: str, ws: Any) -> None:  # noqa: N802
+        if ws_name == self.workspace_name:
+            self._check_run(ws)
+
+    def _check_run(self, ws: Any) -> None:
+        run = ws.getRunNumber()
+        with self.lock:
+            if run == self.current_run:
+                return
+            self.current_run = run
+        print("run", run, "started")
+        self.on_run_start(run)
+
+    def stop(self) -> None:
+        self.observeAll(False)
@@ -0,0 +1,60 @@
+"""Satellite reflections of modulated structures for the live workflow.
+
+Offsets are generated once per modulation setting, and satellite HKLs are generated
+for all main peaks at once with numpy broadcasting. The result is filtered by
+d-spacing with the UB before any Mantid peak is created.
+"""
+
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+
+def parse_vector(vector: Union[str, Sequence[float]]) -> np.ndarray:
+    """Accept '0.5,0,0' strings (MantidWorkflow, reduction configs) as well as sequences."""
+    if isinstance(vector, str):
+        vector = [float(x) for x in vector.split(",")]
+    return np.asarray(vector, dtype=float).reshape(3)
+
+
+def satellite_offsets(
+    mod_vectors: Sequence, max_order: int, cross_terms: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the fractional HKL offsets (M, 3) and the integer orders (M, 3) of all satellites.
+
+    Without cross terms only one modulation vector is used at a time; with them every
+    combination of orders up to max_order is, as in IndexPeaks. Zero modulation
+    vectors and the zero order (the main peak) are left out.
+    """
+    vectors = np.array([parse_vector(v) for v in mod_vectors]).reshape(-1, 3)
+    active = np.any(vectors != 0, axis=1)
+    if max_order <= 0 or not np.any(active):
+        return np.empty((0, 3)), np.empty((0, 3), dtype=int)
+    steps = np.arange(-max_order, max_order + 1)
+    orders = np.stack(np.meshgrid(steps, steps, steps, indexing="ij"), axis=-1).reshape(-1, 3)
+    # inactive vectors only take order 0
+    orders = orders[np.all((orders == 0) | active[np.newaxis, :], axis=1)]
+    nonzero = np.count_nonzero(orders, axis=1)
+    orders = orders[(nonzero == 1) if not cross_terms else (nonzero >= 1)]
+    return orders @ vectors, orders
+
+
+def satellite_hkl(
+    main_hkl: np.ndarray, offsets: np.ndarray, orders: np.ndarray, ub: np.ndarray, d_min: float, d_max: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Satellites of every main peak within [d_min, d_max].
+
+    Returns the fractional HKL, the integer HKL of the parent and the modulation orders,
+    without duplicates (neighbouring parents can share a satellite position).
+    """
+    main_hkl = np.rint(np.asarray(main_hkl, dtype=float)).reshape(-1, 3)
+    hkl = (main_hkl[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(-1, 3)
+    parent = np.repeat(main_hkl, len(offsets), axis=0)
+    order = np.tile(orders, (len(main_hkl), 1))
+    with np.errstate(divide="ignore"):
+        d = 1.0 / np.linalg.norm(hkl @ np.asarray(ub).T, axis=1)
+    keep = (d >= d_min) & (d <= d_max)
+    hkl, parent, order = hkl[keep], parent[keep], order[keep]
+    _, first = np.unique(np.round(hkl, 6), axis=0, return_index=True)
+    first.sort()
+    return hkl[first], parent[first], order[first]
@@ -1,29 +1,54 @@
 from pydantic import BaseModel, Field, computed_field, field_validator, model_validator
-from typing import List, Dict
+from typing import List, Dict, Optional
 import plotly.graph_objects as go
 from plotly.data import iris
 from plotly.subplots import make_subplots
 
 #from mantid.simpleapi import *
 import mantid.simpleapi as mtdapi
+from mantid.kernel import V3D
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import time
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
 from typing import ClassVar
-from sklearn.linear_model import LinearRegression
+
+from .beam_accounting import BeamAccounting
+from .cancellation import CancelToken, CycleCancelledError, cancel_running_algorithms
+from .decimation import decimate
+from .goniometer_tracker import GoniometerTracker
+from .merging_statistics import IncrementalMergingStatistics, SymmetryEquivalenceIndex
+from .peak_registry import PeakRegistry
+from .prediction_models import CONFIDENCE_BANDS, PREDICTION_MODELS, PredictionModel, create_prediction_model
+from .q_histogram import CoarseQHistogram
+from .reduction_graph import ReductionGraph
+from .reduction_service import ReductionService
+from .run_transition import RunTransitionMonitor
+from .satellites import parse_vector, satellite_hkl, satellite_offsets
+from .temporal_store import TemporalCubeStore
+from .time_bins import HierarchicalTimeBins
+from .time_to_target import estimate_time_to_target, target_reached
+from .workspace_manager import WorkspaceLifecycleManager
 # import mantid algorithms, numpy and matplotlib
 #matplotlib.use("Qt5Agg")
 #sys.path.append('/SNS/TOPAZ/shared/PythonPrograms/Python3Library')
 #from SCDTools import recenter_peaks_workspace
 
+# seconds between time slices, until a config or the tab sets another
+DEFAULT_TIME_INTERVAL = 1.0
+
 class MantidWorkflow():
     def __init__(self,temporal_time_interval)->None:
     #def set_up_mantid_info(self)->None:
         print("initializing mtd workflow")
+        self.instrument = 'TOPAZ'
+        self.listener = 'SNSLiveEventDataListener'
         self.ipts=34069
         self.ipts=35078
         self.ipts=35036
@@ -39,6 +64,8 @@ class MantidWorkflow():
         self.centering  = 'P'
 
         self.tolerance = 0.12
+        # radius (1/A) CentroidPeaksMD searches around each predicted peak
+        self.centroid_peak_radius = 0.08
 
         #Specify ellipse integration control parameters for satellite peaks
         self.satellite_peak_size             = '0.07'
@@ -55,6 +82,11 @@ class MantidWorkflow():
         self.cross_terms = False
 
         self.tolerance_satellite = 0.10
+        # satellites are appended after the main peaks of live_predict_peaks_ws
+        self.num_main_peaks = 0
+        # num_main_peaks of the prediction the intensity path last integrated
+        self.integrated_num_main_peaks = 0
+        self.satellite_offsets_key = None
         #
         #User specified q-vector if save_mod_info is True
         self.save_mod_info = False
@@ -104,20 +136,25 @@ class MantidWorkflow():
         self.intensity_ratios: list[float] = []
         self.rsigs: list[float] = []
         self.measure_times: list[float] = []
-        self.sum = self.sig2 = self.sig3 = self.sig5 = self.sig10 = 0
-        # Initialize arrays as empty lists
-        self.sig2s = np.array([])
-        self.sig3s = np.array([])
-        self.sig5s = np.array([])
-        self.sig10s = np.array([])
+        # (levels x intervals) fraction of the predicted peaks above level * sigma, and
+        # (percents x intervals) percentiles of I/sigma, summarized by the peak registry's matrix
+        self.significance_levels = (2.0, 3.0, 5.0, 10.0)
+        self.isigma_percents = (10.0, 50.0, 90.0)
+        self.peak_fractions = np.zeros((len(self.significance_levels), 0))
+        self.isigma_percentiles = np.zeros((len(self.isigma_percents), 0))
         self.missing_ub_number=0
 
         self.current_run_end_time = 0
         self.measure_time = 0
         self.proton_charge = 0       
         self.maxpeak_idx = -1
+        self.maxpeak_id = -1
+        self.peak_registry = PeakRegistry(tolerance=0.05, levels=self.significance_levels, percents=self.isigma_percents)
+        # (target uncertainty in %, series it is read from) at which counting stops, None to count on,
+        # and the orientation segments that reached it
+        self.counting_target = None
+        self.converged_segments = set()
         self.timeseries = np.array([])
-        self.timeseries_data = []#np.array([])
     # Check if live data is already running
 
         self.maxpeak_intI=0
@@ -128,10 +165,109 @@ class MantidWorkflow():
         self.time_of_poissonprocess=0
         self.hkl=[]
         self.timeseries_plt=[]
-        self.timeseries_data_plt=[]
+        self.temporal_poisson_times=[0]
         self.temporal_poisson_intensity=[0]
         self.temporal_poisson_uncertainty=[0]
+        # binned counts around each tracked peak, per time slice; memory-mapped when a directory is set
+        self.temporal_stores = {}
+        self.temporal_store_directory = None
+        # time_interval bins at the start of the run, then each bin time_bin_multiplier times wider
+        self.time_bin_multiplier = 1.1
+        self.time_bin_head = 60
+        self.time_bins = HierarchicalTimeBins(self.time_interval, self.time_bin_multiplier, self.time_bin_head)
+
+        # dual-rate pipeline: the fast path integrates the current predicted peaks,
+        # the slow path re-runs peak search, UB and prediction
+        self.fast_update_interval = 3
+        self.slow_update_interval = 180
+        self.last_orientation_update = 0
+        self.orientation_epoch = 0
+        # bumped whenever the plotted results change, so viewers can skip unchanged snapshots
+        self.data_version = 0
+        self.workspace_lock = threading.RLock()
+
+        # integration resolution, also used to size the event compression
+        self.region_radius = 0.2
+        self.peak_size = 0.09
+        self.background_inner_size = 0.11
+        self.background_outer_size = 0.14
+        self.max_q = 12
+
+        # coarse-to-fine peak search: a fixed Q grid and the event MD workspace are grown
+        # from the events received since peak_search_time (seconds from run start), within one
+        # goniometer segment so that peaks of different orientations are never mixed
+        self.coarse_q_histogram = CoarseQHistogram(max_q=self.max_q, bins=160)
+        self.peak_search_time = 0
+        self.peak_search_segment = 0
+
+        # bounded live accumulation: CompressEvents on each chunk, and an optional
+        # sliding window in seconds (0 keeps the whole run)
+        self.compress_events = False
+        self.compress_resolution_fraction = 0.1
+        self.compress_wall_clock_fraction = 0.1
+        self.event_window = 0
+        self.event_window_start = 0
+
+        # intermediates are deleted from the ADS once their last consumer has run
+        self.workspace_manager = WorkspaceLifecycleManager(mtdapi.mtd, mtdapi.DeleteWorkspace)
+        self.workspace_manager.produced('live_event_ws', persistent=True)
+        self.memory_report = {}
+
+        # monitor counts and proton charge are accumulated from the new pulses only
+        self.beam_accounting = BeamAccounting(self.min_monitor_tof, self.max_monitor_tof)
+
+        # SetGoniometer and the orientation stages only rerun when the angles move;
+        # each move starts a new segment of the temporal history
+        self.goniometer_tracker = GoniometerTracker()
+
+        # run transitions come from the listener; finished runs are archived off the reduction threads
+        self.run_transition = None
+        self.archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='run-archive')
+
+        # each path's running cycle can be cancelled; these are the workspaces its algorithms write
+        self.cycle_tokens = {'orientation': CancelToken(), 'intensity': CancelToken()}
+        self.cycle_workspaces = {
+            'orientation': ('live_event_ws_ub', 'peak_search_chunk_ws', 'peak_search_chunk_md', 'live_event_md_Qsample',
+                'live_peaks_ws', 'live_predict_peaks_ws_next', 'live_satellite_peaks_ws'),
+            'intensity': ('live_event_ws_peak', 'live_predict_peaks_ws_peak', 'live_integrated_peaks_ws',
+                'timestep_event_ws', 'timestep_event_ws_md', 'timestep_HKL_ws'),
+        }
+
+        # merging statistics, point group follows ExperimentInfoModel.pointGroup
+        self.point_group = '2/m'
+        self.lattice_centering = 'P'
+        self.pred_min_d_spacing = 0.6
+        self.pred_max_d_spacing = 11
+        self.pred_min_wavelength = 0.4
+        self.pred_max_wavelength = 3.5
+        self.merging_statistics = None
+
+        # stages only rerun when one of their inputs changed
+        self.reduction_graph = self.build_reduction_graph()
             # Run the SortHKL algorithm
+    def apply_config(self, config)->None:
+        """Take the experiment settings from a WorkflowConfig instead of the built-in defaults."""
+        self.instrument = config.instrument
+        self.ipts = config.ipts
+        self.output_path = config.output_path
+        self.calib_fname = config.calib_fname
+        if config.ub_failsafe:
+            self.ub_failsafe = config.ub_failsafe
+        self.time_interval = config.time_interval
+        self.fast_update_interval = config.fast_update_interval
+        self.slow_update_interval = config.slow_update_interval
+        self.time_bin_multiplier = config.time_bin_multiplier
+        self.time_bins = HierarchicalTimeBins(self.time_interval, self.time_bin_multiplier, self.time_bin_head)
+        if config.persist_time_series:
+            self.temporal_store_directory = os.path.join(config.output_path, 'time_series')
+        if config.is_replay:
+            # FileEventDataListener reads its file and chunking from the (per-process) Mantid config
+            mtdapi.config['fileeventdatalistener.filename'] = config.replay_file
+            mtdapi.config['fileeventdatalistener.chunks'] = str(config.replay_chunks)
+            self.listener = 'FileEventDataListener'
+        else:
+            self.listener = 'SNSLiveEventDataListener'
+
     def update_peak_output_filenames(self):
         if not self.cell_type is None:
             self.live_peaks_fname = 'live_topaz-ipts-%s_%s_%s_%s.integrate'%(str(self.ipts),str(self.current_run),self.cell_type,self.centering)
@@ -141,21 +277,52 @@ class MantidWorkflow():
             self.live_peaks_ub_fname = 'live_topaz-ipts-%s_%s_Niggli.mat'%(str(self.ipts), str(self.current_run))
 
 
+    def get_compress_tolerance(self)->float:
+        """Logarithmic TOF tolerance for CompressEvents, tied to the integration peak size.
+
+        dTOF/TOF = dQ/Q, so a fraction of the peak size at the largest Q bounds the
+        blurring of every peak below that fraction of its integration radius.
+        """
+        return -self.compress_resolution_fraction*self.peak_size/self.max_q
+
+    def apply_event_window(self)->None:
+        """Drop events older than event_window seconds from live_event_ws."""
+        if self.event_window <= 0:
+            return
+        window_start = self.measure_time - self.event_window
+        # trim in steps of a quarter window so the copy is not paid every cycle
+        if window_start - self.event_window_start < 0.25*self.event_window:
+            return
+        print("trimming live events before", window_start, "s")
+        monitor_ws = mtdapi.mtd['live_event_ws'].getMonitorWorkspace()
+        mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws', StartTime=window_start)
+        mtdapi.mtd['live_event_ws'].setMonitorWorkspace(monitor_ws)
+        self.event_window_start = window_start
+
     def start_live_data_collection_instances(self):
 
         """Start live data instances: worksapce mtd['live_event_wc], self.currentrun,self.run."""
+        processing = {}
+        if self.compress_events:
+            # compress each chunk before it is added, pulse times are kept for FilterByTime
+            processing = dict(ProcessingAlgorithm='CompressEvents',
+                    ProcessingProperties='Tolerance={};WallClockTolerance={}'.format(
+                        self.get_compress_tolerance(), self.time_interval*self.compress_wall_clock_fraction))
+            print("compressing live events with", processing['ProcessingProperties'])
         try:
             mtdapi.StartLiveData(
-                    Instrument='TOPAZ',
-                    Listener='SNSLiveEventDataListener',
+                    Instrument=self.instrument,
+                    Listener=self.listener,
                     UpdateEvery=10,
                     #UpdateEvery=self.time_interval,
                     AccumulationMethod='Add',
                     PreserveEvents=True,
-                    OutputWorkspace='live_event_ws')    
+                    # at a run boundary the finished run is renamed to live_event_ws_<run>
+                    # and accumulation restarts, so its last chunk can still be flushed
+                    RunTransitionBehavior='Rename',
+                    OutputWorkspace='live_event_ws',
+                    **processing)    
             self.monitor_start_time = mtdapi.mtd['live_event_ws'].getRun().startTime().totalNanoseconds() * 1e-9
-            time.sleep(1)
-            #time.sleep(60)
         except RuntimeError as e:
             if 'Another MonitorLiveData thread is running' in str(e):
                 conflict_current_run=mtdapi.mtd['live_event_ws'].getRunNumber()
@@ -179,6 +346,15 @@ class MantidWorkflow():
         self.current_run = self.initial_run
         self.current_run_start_time = self.initial_run_start_time
         self.update_peak_output_filenames()
+        self.run_transition = RunTransitionMonitor('live_event_ws', self.current_run, self.on_run_start)
+
+    def stop_live_data_collection_instances(self):
+        """Stop the MonitorLiveData thread feeding live_event_ws and the run transition monitor."""
+        if self.run_transition is not None:
+            self.run_transition.stop()
+            self.run_transition = None
+        stopped = cancel_running_algorithms(['live_event_ws'], ('MonitorLiveData',))
+        print("stopped live data collection (%d MonitorLiveData instances cancelled)"%stopped)
 
 
        # self.run = self.current_run
@@ -192,311 +368,434 @@ class MantidWorkflow():
     #'''   
 
 
-    def live_data_reduction(self):
-        #while True:
-        def get_and_update_run_info_of_current_run():
-            #############################################################################################################################################################
-            # ''' check if the run number has changed, if so, save the results and clear the existing data , and update the run infos'''
-            #############################################################################################################################################################
-            current_run=mtdapi.mtd['live_event_ws'].getRunNumber()
-
-            # Get the first event list
-            print("====================================================================================================")
-            print("Getting the first event list")
-            #evList = mtdapi.mtd['live_event_ws'].getSpectrum(0)
-
-            # Add an offset to the pulsetime (wall-clock time) of each event in the list.
-            #print("First pulse time before addPulsetime: {}".format(evList.getPulseTimes()[0]))
-            current_run_start_time = mtdapi.mtd['live_event_ws'].getRun().startTime().totalNanoseconds() * 1e-9
-
-            if current_run != self.current_run:
-                # Save the results
-                results = np.column_stack((self.measure_times, self.proton_charges, self.intensity_ratios, self.rsigs))
-                np.savetxt(self.output_path + 'live_data_%s_results.csv'%(str(self.current_run)), results, delimiter=',', header='', comments='')
-                # save results
-                mtdapi.SaveIsawPeaks(Inputworkspace='live_predict_peaks_ws', 
-                        Filename= self.output_path + self.live_peaks_fname )
-                mtdapi.SaveIsawUB(Inputworkspace='live_predict_peaks_ws',  
-                        Filename= self.output_path + self.live_peaks_fname )
-
-                # Clear the existing data and plot if run changes
-                self.current_run = current_run
-                self.current_run_start_time = current_run_start_time
-                self.proton_charges.clear()
-                self.intensity_ratios.clear()
-                self.rsigs.clear()
-                self.measure_times.clear()
-                self.timeseries_plt=[]
-                self.timeseries_data_plt=[]
-                time.sleep(1)
-                #time.sleep(60)
-                #plt.clf()  # Clear the plot
+    def get_and_update_run_info_of_current_run(self):
+        #############################################################################################################################################################
+        # ''' check if the run number has changed, if so, save the results and clear the existing data , and update the run infos'''
+        #############################################################################################################################################################
+        if self.run_transition is not None:
+            self.roll_over_run()
+        elif mtdapi.mtd['live_event_ws'].getRunNumber() != self.current_run:
+            print("run changed without a run transition monitor, results of run", self.current_run, "are not archived")
+        self.update_peak_output_filenames()
 
+    def on_run_start(self, run_number:int)->None:
+        """Listener callback: roll over as soon as the running cycle releases the workspace lock."""
+        self.cancel_cycles('run %s started'%(str(run_number)))
+        self.archive_executor.submit(self.roll_over_run)
+
+    def roll_over_run(self)->bool:
+        """Hand the finished run's state to the archiver and start empty accumulators for the new run."""
+        with self.workspace_lock:
+            new_run = self.run_transition.current_run
+            if new_run == self.current_run:
+                return False
+            print("rolling over from run", self.current_run, "to run", new_run)
+            # the published peaks move with the old run; the archiver owns them from here
+            predict_peaks_ws = None
+            if mtdapi.mtd.doesExist('live_predict_peaks_ws'):
+                predict_peaks_ws = 'live_predict_peaks_ws_%s'%(str(self.current_run))
+                mtdapi.RenameWorkspace(InputWorkspace='live_predict_peaks_ws', OutputWorkspace=predict_peaks_ws)
+            snapshot = dict(
+                run=self.current_run,
+                run_start_time=self.current_run_start_time,
+                results=[list(self.measure_times), list(self.proton_charges), list(self.intensity_ratios), list(self.rsigs)],
+                predict_peaks_ws=predict_peaks_ws,
+                num_main_peaks=self.num_main_peaks,
+                peaks_fname=self.live_peaks_fname,
+                peaks_ub_fname=self.live_peaks_ub_fname,
+            )
+
+            self.current_run = new_run
+            if mtdapi.mtd.doesExist('live_event_ws'):
+                self.current_run_start_time = mtdapi.mtd['live_event_ws'].getRun().startTime().totalNanoseconds() * 1e-9
+            self.proton_charges.clear()
+            self.intensity_ratios.clear()
+            self.rsigs.clear()
+            self.measure_times.clear()
+            self.timeseries_plt=[]
+            for temporal_store in self.temporal_stores.values():
+                temporal_store.flush()
+            self.temporal_stores = {}
+            self.time_bins = HierarchicalTimeBins(self.time_interval, self.time_bin_multiplier, self.time_bin_head)
+            self.temporal_poisson_times=[0]
+            self.temporal_poisson_intensity=[0]
+            self.temporal_poisson_uncertainty=[0]
+            self.beam_accounting.reset()
+            self.goniometer_tracker.reset()
+            self.converged_segments = set()
+            if self.merging_statistics is not None:
+                self.merging_statistics.reset()
+            self.peak_registry.reset()
+            self.peak_fractions = np.zeros((len(self.significance_levels), 0))
+            self.isigma_percentiles = np.zeros((len(self.isigma_percents), 0))
+            self.maxpeak_id = -1
+            self.event_window_start = 0
+            # nothing computed for the previous run is valid any more
+            self.workspace_manager.release_all(extra=('live_peaks_ws', 'live_integrated_peaks_ws'))
+            self.reset_peak_search()
+            self.reduction_graph.reset()
             self.update_peak_output_filenames()
-       
-        def load_config_of_current_run():
-            #############################################################################################################################################################
-            #''' Load the calibration file and monitor data, and integrate the peaks'''
-            #############################################################################################################################################################
-            #mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws')
-            print("====================================================================================================")
-            print("Loading the calibration file and monitor data, and integrating the peaks")   
-            print("first filterbytime")
-            print("====================================================================================================")
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            mtdapi.LoadIsawDetCal(InputWorkspace='live_event_ws', Filename=self.calib_fname)
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("second filterbytime")
-            print("====================================================================================================")
-            monitor_ws=mtdapi.mtd['live_event_ws'].getMonitorWorkspace()
-            print("monitorws")
-            print("====================================================================================================")
-            integrated_monitor_ws = mtdapi.Integration( InputWorkspace=monitor_ws, 
-                              RangeLower=self.min_monitor_tof, RangeUpper=self.max_monitor_tof, 
-                              StartWorkspaceIndex=0, 
-                              EndWorkspaceIndex=0 )
-            print("int filterbytime")
-            print("====================================================================================================")
-            monitor_count = integrated_monitor_ws.dataY(0)[0]
-            print("\n", self.current_run, " has integrated monitor count", monitor_count, "\n")
-
-            #
-            mtdapi.SetGoniometer(Workspace='live_event_ws', Goniometers='Universal')
-            print("getgonio filterbytime")
-            print("====================================================================================================")
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("3rd filterbytime")
-            print("====================================================================================================")
-
-        def refine_ub_of_current_run():
-            #############################################################################################################################################################
-            #''' Refine the UB matrix'''
-            #############################################################################################################################################################
-            #TODO: why convert to md
-            mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws_peak')
-            mtdapi.ConvertToMD(InputWorkspace='live_event_ws_peak', 
-                QDimensions="Q3D", dEAnalysisMode="Elastic", 
-                Q3DFrames='Q_sample',
-                QConversionScales="Q in A^-1", 
-                LorentzCorrection='1',
-                Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
-                OutputWorkspace='live_event_md_Qsample', MinValues='-12,-12,-12', MaxValues='12,12,12')
-            
-            #mtdapi.ConvertToMD(InputWorkspace='live_event_ws', 
-            #    QDimensions="Q3D", dEAnalysisMode="Elastic", 
-            #    Q3DFrames='Q_sample',
-            #    QConversionScales="Q in A^-1", 
-            #    LorentzCorrection='1',
-            #    Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
-            #    OutputWorkspace='live_event_md_Qsample', MinValues='-12,-12,-12', MaxValues='12,12,12')
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("4 filterbytime")
-            print("====================================================================================================")
-            
-            mtdapi.FindPeaksMD(InputWorkspace='live_event_md_Qsample', PeakDistanceThreshold=0.6, 
-                MaxPeaks=1000, DensityThresholdFactor=100, OutputWorkspace='live_peaks_ws', EdgePixels=18)
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("5 filterbytime")
-            print("====================================================================================================")
-            
-            try:
-                mtdapi.FindUBUsingFFT(PeaksWorkspace='live_peaks_ws', MinD=self.min_d, MaxD=self.max_d, Tolerance=0.12,Iterations=100)
-            except ValueError as ub_error:
-                print("Warning: FindUBUsingFFT error - Four or more indexed peaks needed to find UB")
-                print("Error message: ", ub_error)
-                #TODO: should use next two commands or not?
-                #mtdapi.LoadIsawUB(InputWorkspace='live_peaks_ws',Filename='/SNS/TOPAZ/IPTS-33641/shared/S5-1_5K/S5-1_5K_Monoclinic_P.mat')
-                #mtdapi.IndexPeaks(PeaksWorkspace='live_peaks_ws', Tolerance=0.12, ToleranceForSatellite=0.10000000000000001, RoundHKLs=False, CommonUBForAll=True)
-                self.current_run_end_time = mtdapi.mtd['live_event_ws'].getRun().endTime().totalNanoseconds() * 1e-9  # Convert nanoseconds to seconds
-
-                self.measure_time = self.current_run_end_time -self.initial_run_start_time
-                if self.measure_time >100000: 
-                    print("Please check if neutron beam is on, or if the crystal is diffracting.")
-            #        exit()
-                #continue
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("6 filterbytime")
-            print("====================================================================================================")
-            
-
-
-        def integrate_peaks_of_current_run():
-            #############################################################################################################################################################
-            #''' Integrate the peaks and predict the peaks'''
-            #############################################################################################################################################################
-            mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws_peak')
-            
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            #print("7 filterbytime")
-            #print("====================================================================================================")
-            
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("7.0 filterbytime")
-            print("====================================================================================================")
-            
-            ## cause error in filter by time
-            mtdapi.IndexPeaks(PeaksWorkspace='live_peaks_ws', Tolerance=0.12, ToleranceForSatellite=0.10000000000000001, RoundHKLs=False, CommonUBForAll=True)
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("7.1 filterbytime")
-            print("====================================================================================================")
-            
-            mtdapi.IntegrateEllipsoids(InputWorkspace='live_event_ws_peak', PeaksWorkspace='live_peaks_ws', 
-                RegionRadius=0.18, SpecifySize=True, PeakSize=0.09, BackgroundInnerSize=0.11, BackgroundOuterSize=0.14, 
-                OutputWorkspace='live_peaks_ws', CutoffIsigI=5, 
-                AdaptiveQBackground=True, 
-                AdaptiveQMultiplier=0.001, UseOnePercentBackgroundCorrection=False)
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("7.2 filterbytime")
-            print("====================================================================================================")
-            
-            mtdapi.PredictPeaks(InputWorkspace='live_peaks_ws', 
-                WavelengthMin=0.4, 
-                WavelengthMax=3.5, 
-                MinDSpacing=0.6, 
-                MaxDSpacing=11, 
-                OutputWorkspace='live_predict_peaks_ws', EdgePixels=18)
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("7 filterbytime")
-            print("====================================================================================================")
-            
-            #TODO: local variables to be taken out
-            peak_radius = 0.08
-            search_radius = 0.8*float(peak_radius)
-            mtdapi.CentroidPeaksMD(InputWorkspace='live_event_md_Qsample', PeakRadius=search_radius, 
-                PeaksWorkspace='live_predict_peaks_ws', OutputWorkspace='live_predict_peaks_ws')
-            mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws', Tolerance=0.12, CommonUBForAll=True)
-            mtdapi.FindUBUsingIndexedPeaks(PeaksWorkspace='live_predict_peaks_ws', Tolerance=0.12, CommonUBForAll=True)
-            mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws', Tolerance=0.12, RoundHKLs=False, CommonUBForAll=True)
-
-            #TODO: protoncharge not updated for live ws
-            self.proton_charge = mtdapi.mtd['live_event_ws'].getRun().getProtonCharge() * 0.0036
-            print("\n", self.current_run, " has integrated proton charge x 0.0036 of", self.proton_charge, "C \n")
+            self.data_version += 1
+        self.archive_executor.submit(self.archive_run, snapshot)
+        return True
+
+    def archive_run(self, snapshot:dict)->None:
+        """Integrate the events received since the last cycle of a finished run, then save its results."""
+        run = snapshot['run']
+        results = snapshot['results']
+        predict_peaks_ws = snapshot['predict_peaks_ws']
+        events_ws = self.run_transition.archived_workspace(run)
+        try:
+            if predict_peaks_ws is not None and mtdapi.mtd.doesExist(events_ws):
+                mtdapi.LoadIsawDetCal(InputWorkspace=events_ws, Filename=self.calib_fname)
+                mtdapi.SetGoniometer(Workspace=events_ws, Goniometers='Universal')
+                mtdapi.IntegrateEllipsoids(InputWorkspace=events_ws, PeaksWorkspace=predict_peaks_ws,
+                    OutputWorkspace=predict_peaks_ws, **self.integration_properties())
+                run_info = mtdapi.mtd[events_ws].getRun()
+                measure_time = run_info.endTime().totalNanoseconds() * 1e-9 - snapshot['run_start_time']
+                if not results[0] or measure_time > results[0][-1]:
+                    _, intensity, sigma, _, _ = self.get_peak_arrays(mtdapi.mtd[predict_peaks_ws], snapshot['num_main_peaks'])
+                    valid = sigma > 0
+                    if np.any(valid):
+                        intensity_ratio = float(np.mean(intensity[valid]/sigma[valid]))
+                        proton_charge = BeamAccounting(self.min_monitor_tof, self.max_monitor_tof).update_proton_charge(run_info)
+                        for column, value in zip(results, (measure_time, proton_charge, intensity_ratio, 100.0/intensity_ratio)):
+                            column.append(value)
+            np.savetxt(self.output_path + 'live_data_%s_results.csv'%(str(run)), np.column_stack(results), delimiter=',', header='', comments='')
+            if predict_peaks_ws is not None:
+                mtdapi.SaveIsawPeaks(Inputworkspace=predict_peaks_ws,
+                        Filename= self.output_path + snapshot['peaks_fname'] )
+                mtdapi.SaveIsawUB(Inputworkspace=predict_peaks_ws,
+                        Filename= self.output_path + snapshot['peaks_ub_fname'] )
+            print("run", run, "archived with", len(results[0]), "intervals")
+        except Exception as archive_error:
+            print("Warning: archiving run", run, "failed:", archive_error)
+        finally:
+            for name in (events_ws, predict_peaks_ws):
+                if name is not None and mtdapi.mtd.doesExist(name):
+                    mtdapi.DeleteWorkspace(name)
+
+    def load_config_of_current_run(self):
+        #############################################################################################################################################################
+        #''' Load the calibration file and monitor data, and integrate the peaks'''
+        #############################################################################################################################################################
+        #mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws')
+        print("Loading the calibration file and monitor data")
+        #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
+        #                    StartTime=0, StopTime=1)
+        mtdapi.LoadIsawDetCal(InputWorkspace='live_event_ws', Filename=self.calib_fname)
+        #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
+        #                    StartTime=0, StopTime=1)
+        monitor_ws=mtdapi.mtd['live_event_ws'].getMonitorWorkspace()
+        monitor_count, monitor_delta = self.beam_accounting.update_monitor(monitor_ws)
+        print("\n", self.current_run, " has integrated monitor count", monitor_count, "(+%s)"%monitor_delta, "\n")
 
+        #
+        if self.goniometer_tracker.needs_set_goniometer(mtdapi.mtd['live_event_ws']):
+            mtdapi.SetGoniometer(Workspace='live_event_ws', Goniometers='Universal')
+            self.goniometer_tracker.applied(mtdapi.mtd['live_event_ws'])
+        else:
+            print("goniometer unchanged, SetGoniometer skipped")
+        #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
+        #                    StartTime=0, StopTime=1)
+
+    def reset_peak_search(self)->None:
+        """Start the coarse histogram and the event MD workspace over from the oldest kept event of the current orientation."""
+        self.coarse_q_histogram.reset()
+        self.peak_search_segment = self.goniometer_tracker.segment
+        self.peak_search_time = max(self.event_window_start, self.goniometer_tracker.segment_starts[-1])
+        self.workspace_manager.release('live_event_md_Qsample')
+
+    def update_coarse_q_histogram(self)->None:
+        """Convert only the events received since the last peak search and add them to the grid and the MD workspace."""
+        if self.peak_search_time < self.event_window_start:
+            # the sliding window dropped events that are still in the accumulated search data
+            self.reset_peak_search()
+        elif self.peak_search_segment != self.goniometer_tracker.segment:
+            # the goniometer moved: the accumulated Q_sample belongs to the previous orientation
+            print("goniometer segment", self.goniometer_tracker.segment, "started, peak search restarts")
+            self.reset_peak_search()
+        live_event_ws_ub = mtdapi.mtd['live_event_ws_ub']
+        run_info = live_event_ws_ub.getRun()
+        chunk_end_time = (run_info.endTime().totalNanoseconds() - run_info.startTime().totalNanoseconds()) * 1e-9
+        mtdapi.FilterByTime(InputWorkspace='live_event_ws_ub', OutputWorkspace='peak_search_chunk_ws',
+            StartTime=self.peak_search_time)
+        self.workspace_manager.consumed('live_event_ws_ub', 'convert_to_md')
+        mtdapi.ConvertToMD(InputWorkspace='peak_search_chunk_ws', 
+            QDimensions="Q3D", dEAnalysisMode="Elastic", 
+            Q3DFrames='Q_sample',
+            QConversionScales="Q in A^-1", 
+            LorentzCorrection='1',
+            Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
+            OutputWorkspace='peak_search_chunk_md', MinValues='-12,-12,-12', MaxValues='12,12,12')
+        mtdapi.DeleteWorkspace('peak_search_chunk_ws')
+        mtdapi.BinMD(InputWorkspace='peak_search_chunk_md', AxisAligned=True,
+            OutputWorkspace='peak_search_chunk_hist', **self.coarse_q_histogram.binmd_dimensions())
+        self.coarse_q_histogram.add(mtdapi.mtd['peak_search_chunk_hist'].getSignalArray())
+        mtdapi.DeleteWorkspace('peak_search_chunk_hist')
+        if mtdapi.mtd.doesExist('live_event_md_Qsample'):
+            mtdapi.PlusMD(LHSWorkspace='live_event_md_Qsample', RHSWorkspace='peak_search_chunk_md', OutputWorkspace='live_event_md_Qsample')
+            mtdapi.DeleteWorkspace('peak_search_chunk_md')
+        else:
+            mtdapi.RenameWorkspace(InputWorkspace='peak_search_chunk_md', OutputWorkspace='live_event_md_Qsample')
+        # kept for the whole run: centroiding reads it every orientation update
+        self.workspace_manager.produced('live_event_md_Qsample', persistent=True)
+        self.peak_search_time = chunk_end_time
+
+    def refine_ub_of_current_run(self):
+        #############################################################################################################################################################
+        #''' Refine the UB matrix'''
+        #############################################################################################################################################################
+        # peak search works in Q_sample: the new events are converted to MD for the coarse grid,
+        # and CentroidPeaksMD refines the candidates on the accumulated MD events
+        # live_event_ws_ub is the slow path's own snapshot, so the fast path can keep cloning live_event_ws_peak
+        with self.workspace_lock:
+            mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws_ub')
+            self.workspace_manager.produced('live_event_ws_ub', consumers=('convert_to_md', 'integrate_found_peaks'))
+        self.update_coarse_q_histogram()
+
+        # local maxima of the coarse grid stand in for FindPeaksMD; only their neighbourhoods
+        # are looked at with the events
+        candidates = self.coarse_q_histogram.find_candidates(density_threshold_factor=100, max_peaks=1000, separation=0.6)
+        print("coarse peak search found", len(candidates), "candidates")
+        mtdapi.CreatePeaksWorkspace(InstrumentWorkspace='live_event_ws_ub', NumberOfPeaks=0, OutputWorkspace='live_peaks_ws')
+        live_peaks_ws = mtdapi.mtd['live_peaks_ws']
+        for q_sample in candidates:
+            live_peaks_ws.addPeak(live_peaks_ws.createPeakQSample(V3D(*q_sample)))
+        mtdapi.CentroidPeaksMD(InputWorkspace='live_event_md_Qsample', PeakRadius=self.coarse_q_histogram.bin_width,
+            PeaksWorkspace='live_peaks_ws', OutputWorkspace='live_peaks_ws')
+        self.workspace_manager.produced('live_peaks_ws', consumers=('predict',))
+        
+        try:
+            mtdapi.FindUBUsingFFT(PeaksWorkspace='live_peaks_ws', MinD=self.min_d, MaxD=self.max_d, Tolerance=0.12,Iterations=100)
+        except ValueError as ub_error:
+            print("Warning: FindUBUsingFFT error - Four or more indexed peaks needed to find UB")
+            print("Error message: ", ub_error)
+            #TODO: should use next two commands or not?
+            #mtdapi.LoadIsawUB(InputWorkspace='live_peaks_ws',Filename='/SNS/TOPAZ/IPTS-33641/shared/S5-1_5K/S5-1_5K_Monoclinic_P.mat')
+            #mtdapi.IndexPeaks(PeaksWorkspace='live_peaks_ws', Tolerance=0.12, ToleranceForSatellite=0.10000000000000001, RoundHKLs=False, CommonUBForAll=True)
             self.current_run_end_time = mtdapi.mtd['live_event_ws'].getRun().endTime().totalNanoseconds() * 1e-9  # Convert nanoseconds to seconds
 
-            self.measure_time = self.current_run_end_time -self.current_run_start_time
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("8 filterbytime")
-            print("====================================================================================================")
-            
-            mtdapi.IntegrateEllipsoids(InputWorkspace='live_event_ws_peak', 
-                PeaksWorkspace='live_predict_peaks_ws', 
-                RegionRadius=0.2, SpecifySize=True, 
-                PeakSize=0.09, BackgroundInnerSize=0.11, BackgroundOuterSize=0.14, 
-                OutputWorkspace='live_predict_peaks_ws', 
-                CutoffIsigI=5, 
-                AdaptiveQBackground=True, 
-                AdaptiveQMultiplier=0.001, UseOnePercentBackgroundCorrection=False)
-
-            if not self.cell_type is None:
-                mtdapi.SelectCellOfType(PeaksWorkspace='live_predict_peaks_ws', 
-                    CellType=self.cell_type, Centering=self.centering, Tolerance = self.tolerance, Apply=True, )
-                mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws', 
-                    Tolerance=self.tolerance, ToleranceForSatellite=self.tolerance_satellite, RoundHKLs=False, CommonUBForAll=True)
-
-            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-            #                    StartTime=0, StopTime=1)
-            print("9 filterbytime")
-            print("====================================================================================================")
-            
-
-        def check_peaks_of_current_run():
-            live_predict_peaks_ws=mtdapi.mtd['live_predict_peaks_ws']
-
-            #peaks_fname = 'live_%s_Niggli.integrate'%(str(current_run))
-            #peaks_ub_fname = 'live_%s_Niggli.mat'%(str(current_run))
-
-            # Set the monitor counts for all the peaks that will be integrated
-
-            num_peaks = live_predict_peaks_ws.getNumberPeaks()
-            intIlist=np.zeros(num_peaks)
-            for i in range(num_peaks):
-              peak = live_predict_peaks_ws.getPeak(i)
-              intI = peak.getIntensity()
-              intIlist[i]=intI
-              sigI = peak.getSigmaIntensity()
-              self.sum = self.sum + 1
-              if intI > (2.0 * sigI):
-                self.sig2 = self.sig2 + 1
-              if intI > (3.0 * sigI):
-                self.sig3 = self.sig3 + 1
-              if intI > (5.0 * sigI):
-                self.sig5 = self.sig5 + 1
-              if intI > (10.0 * sigI):
-                self.sig10 = self.sig10 + 1
-            #TODO peaks update
-            if self.maxpeak_idx >-1 and self.maxpeak_idx != np.argmax(intIlist):
-              print("Warning: Max peak index has changed from ", self.maxpeak_idx, " to ", np.argmax(intIlist))
-              self.maxpeak_idx=np.argmax(intIlist)
-           
-            if self.maxpeak_idx==-1:
-              self.maxpeak_idx=np.argmax(intIlist)
-           
-            #self.maxpeak_idx=np.argmax(intIlist)
-
-            self.maxpeak_intI=intIlist[self.maxpeak_idx]
-            
-            peak = live_predict_peaks_ws.getPeak(int(self.maxpeak_idx))
-            
-            #peak = live_predict_peaks_ws.getPeak(int(0))
-            self.hkl=peak.getHKL()
-            
-            # Run the SortHKL algorithm
-
-            sorted, statistics_table, equivI = mtdapi.StatisticsOfPeaksWorkspace(InputWorkspace='live_predict_peaks_ws', 
-                PointGroup='2/m', LatticeCentering='P', SortBy='Overall', WeightedZScore=True)
+            self.measure_time = self.current_run_end_time -self.initial_run_start_time
+            if self.measure_time >100000: 
+                print("Please check if neutron beam is on, or if the crystal is diffracting.")
+        #        exit()
+            #continue
+        # the UB identifies the output: prediction is skipped if peak search found the same cell
+        live_peaks_ws = mtdapi.mtd['live_peaks_ws']
+        if live_peaks_ws.sample().hasOrientedLattice():
+            return np.round(live_peaks_ws.sample().getOrientedLattice().getUB(), 4)
+        return None
+        
 
-            statistics = statistics_table.row(0)
+    def integration_properties(self)->dict:
+        """IntegrateEllipsoids settings for main peaks and, in the same pass, satellites."""
+        return dict(RegionRadius=self.region_radius, SpecifySize=True,
+            PeakSize=self.peak_size, BackgroundInnerSize=self.background_inner_size, BackgroundOuterSize=self.background_outer_size,
+            SatelliteRegionRadius=float(self.satellite_region_radius), SatellitePeakSize=float(self.satellite_peak_size),
+            SatelliteBackgroundInnerSize=float(self.satellite_background_inner_size),
+            SatelliteBackgroundOuterSize=float(self.satellite_background_outer_size),
+            CutoffIsigI=5,
+            AdaptiveQBackground=True,
+            AdaptiveQMultiplier=0.001, UseOnePercentBackgroundCorrection=False)
+
+    def get_satellite_offsets(self):
+        """Satellite offsets and orders, regenerated only when the modulation settings change."""
+        key = (self.mod_vector1, self.mod_vector2, self.mod_vector3, int(self.max_order), bool(self.cross_terms))
+        if key != self.satellite_offsets_key:
+            self.satellite_offsets = satellite_offsets(key[:3], key[3], key[4])
+            self.satellite_offsets_key = key
+        return self.satellite_offsets
+
+    def add_satellite_peaks(self, peaks_ws_name:str)->int:
+        """Append the satellites of every predicted main peak to peaks_ws_name; returns how many."""
+        offsets, orders = self.get_satellite_offsets()
+        if not len(offsets):
+            return 0
+        peaks_ws = mtdapi.mtd[peaks_ws_name]
+        lattice = peaks_ws.sample().getOrientedLattice()
+        lattice.setModVec1(V3D(*parse_vector(self.mod_vector1)))
+        lattice.setModVec2(V3D(*parse_vector(self.mod_vector2)))
+        lattice.setModVec3(V3D(*parse_vector(self.mod_vector3)))
+        lattice.setMaxOrder(int(self.max_order))
+        lattice.setCrossTerm(bool(self.cross_terms))
+        main_hkl = np.column_stack([np.array(peaks_ws.column(c)) for c in ('h', 'k', 'l')])
+        hkl, parent, order = satellite_hkl(main_hkl, offsets, orders, lattice.getUB(), self.pred_min_d_spacing, self.pred_max_d_spacing)
+
+        mtdapi.CreatePeaksWorkspace(InstrumentWorkspace=peaks_ws_name, NumberOfPeaks=0, OutputWorkspace='live_satellite_peaks_ws')
+        mtdapi.CopySample(InputWorkspace=peaks_ws_name, OutputWorkspace='live_satellite_peaks_ws',
+            CopyName=False, CopyMaterial=False, CopyEnvironment=False, CopyShape=False, CopyLattice=True)
+        satellite_ws = mtdapi.mtd['live_satellite_peaks_ws']
+        for fractional, integer, mnp in zip(hkl, parent, order):
+            peak = satellite_ws.createPeakHKL(V3D(*fractional))
+            # keep only satellites that hit a detector inside the predicted wavelength band
+            if peak.getDetectorID() < 0 or not self.pred_min_wavelength <= peak.getWavelength() <= self.pred_max_wavelength:
+                continue
+            peak.setIntHKL(V3D(*integer))
+            peak.setIntMNP(V3D(*mnp))
+            satellite_ws.addPeak(peak)
+        num_satellites = satellite_ws.getNumberPeaks()
+        mtdapi.CombinePeaksWorkspaces(LHSWorkspace=peaks_ws_name, RHSWorkspace='live_satellite_peaks_ws', OutputWorkspace=peaks_ws_name)
+        mtdapi.DeleteWorkspace('live_satellite_peaks_ws')
+        print("predicted", num_satellites, "satellite peaks")
+        return num_satellites
+
+    def predict_peaks_of_current_run(self):
+        #############################################################################################################################################################
+        #''' Predict the peaks from the refined UB, then publish them for the intensity path'''
+        #############################################################################################################################################################
+        ## cause error in filter by time
+        mtdapi.IndexPeaks(PeaksWorkspace='live_peaks_ws', Tolerance=0.12, ToleranceForSatellite=0.10000000000000001, RoundHKLs=False, CommonUBForAll=True)
+
+        mtdapi.IntegrateEllipsoids(InputWorkspace='live_event_ws_ub', PeaksWorkspace='live_peaks_ws', 
+            RegionRadius=0.18, SpecifySize=True, PeakSize=0.09, BackgroundInnerSize=0.11, BackgroundOuterSize=0.14, 
+            OutputWorkspace='live_peaks_ws', CutoffIsigI=5, 
+            AdaptiveQBackground=True, 
+            AdaptiveQMultiplier=0.001, UseOnePercentBackgroundCorrection=False)
+        self.workspace_manager.consumed('live_event_ws_ub', 'integrate_found_peaks')
+
+        mtdapi.PredictPeaks(InputWorkspace='live_peaks_ws', 
+            WavelengthMin=self.pred_min_wavelength, 
+            WavelengthMax=self.pred_max_wavelength, 
+            MinDSpacing=self.pred_min_d_spacing, 
+            MaxDSpacing=self.pred_max_d_spacing, 
+            OutputWorkspace='live_predict_peaks_ws_next', EdgePixels=18)
+        self.workspace_manager.consumed('live_peaks_ws', 'predict')
+
+        mtdapi.CentroidPeaksMD(InputWorkspace='live_event_md_Qsample', PeakRadius=0.8*self.centroid_peak_radius, 
+            PeaksWorkspace='live_predict_peaks_ws_next', OutputWorkspace='live_predict_peaks_ws_next')
+        mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws_next', Tolerance=0.12, CommonUBForAll=True)
+        mtdapi.FindUBUsingIndexedPeaks(PeaksWorkspace='live_predict_peaks_ws_next', Tolerance=0.12, CommonUBForAll=True)
+        mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws_next', Tolerance=0.12, RoundHKLs=False, CommonUBForAll=True)
 
-            peak = sorted.getPeak(0)
-            print("HKL of first peak in table {} {} {}".format(peak.getH(),peak.getK(),peak.getL()))
-            print("Multiplicity = %.2f" % statistics['Multiplicity'])
-            print("Resolution Min = %.2f" % statistics['Resolution Min'])
-            print("Resolution Max = %.2f" % statistics['Resolution Max'])
-            print("No. of Unique Reflections = %i" % statistics['No. of Unique Reflections'])
-            print("Mean ((I)/sd(I)) = %.2f" % statistics['Mean ((I)/sd(I))'])
-            print("Rmerge = %.2f" % statistics['Rmerge'])
-            print("Rpim = %.2f" % statistics['Rpim'])
+        if not self.cell_type is None:
+            mtdapi.SelectCellOfType(PeaksWorkspace='live_predict_peaks_ws_next', 
+                CellType=self.cell_type, Centering=self.centering, Tolerance = self.tolerance, Apply=True, )
+            mtdapi.IndexPeaks(PeaksWorkspace='live_predict_peaks_ws_next', 
+                Tolerance=self.tolerance, ToleranceForSatellite=self.tolerance_satellite, RoundHKLs=False, CommonUBForAll=True)
+
+        num_main_peaks = mtdapi.mtd['live_predict_peaks_ws_next'].getNumberPeaks()
+        self.add_satellite_peaks('live_predict_peaks_ws_next')
+
+        # swap the new prediction in while the intensity path is not using it
+        with self.workspace_lock:
+            mtdapi.RenameWorkspace(InputWorkspace='live_predict_peaks_ws_next', OutputWorkspace='live_predict_peaks_ws')
+            self.num_main_peaks = num_main_peaks
+            self.workspace_manager.produced('live_predict_peaks_ws', persistent=True)
+
+
+    def integrate_peaks_of_current_run(self):
+        #############################################################################################################################################################
+        #''' Integrate the current predicted peaks'''
+        #############################################################################################################################################################
+        # the lock is only held for the snapshot: the listener and the orientation path can replace
+        # live_event_ws and live_predict_peaks_ws while this cycle integrates and slices its copies
+        with self.workspace_lock:
+            mtdapi.CloneWorkspace(InputWorkspace='live_event_ws', OutputWorkspace='live_event_ws_peak')
+            self.workspace_manager.produced('live_event_ws_peak', consumers=('integrate', 'time_slices'))
+            mtdapi.CloneWorkspace(InputWorkspace='live_predict_peaks_ws', OutputWorkspace='live_predict_peaks_ws_peak')
+            self.workspace_manager.produced('live_predict_peaks_ws_peak', consumers=('integrate',))
+            self.integrated_num_main_peaks = self.num_main_peaks
 
-            mtdapi.SaveIsawPeaks(Inputworkspace='live_predict_peaks_ws', 
-                Filename= self.output_path + self.live_peaks_fname)
-            mtdapi.SaveIsawUB(Inputworkspace='live_predict_peaks_ws',  
-                Filename= self.output_path + self.live_peaks_ub_fname)
+        # getProtonCharge() is not updated for live workspaces, the proton_charge log is
+        run_info = mtdapi.mtd['live_event_ws_peak'].getRun()
+        self.proton_charge = self.beam_accounting.update_proton_charge(run_info)
+        print("\n", self.current_run, " has integrated proton charge of", self.proton_charge, "C \n")
 
-            # Check the overall peak intensity in live_peaks_ws
-            self.intensity_ratio =statistics['Mean ((I)/sd(I))']
+        self.current_run_end_time = run_info.endTime().totalNanoseconds() * 1e-9  # Convert nanoseconds to seconds
 
-            self.Rsig = 100.0/self.intensity_ratio
-            print("Rsig = %.2f" % self.Rsig)
+        self.measure_time = self.current_run_end_time -self.current_run_start_time
+        
+        # main and satellite peaks share one event pass
+        mtdapi.IntegrateEllipsoids(InputWorkspace='live_event_ws_peak', 
+            PeaksWorkspace='live_predict_peaks_ws_peak', 
+            OutputWorkspace='live_integrated_peaks_ws', 
+            **self.integration_properties())
+        self.workspace_manager.consumed('live_event_ws_peak', 'integrate')
+        self.workspace_manager.consumed('live_predict_peaks_ws_peak', 'integrate')
+        # the intensity path's result, kept until the next integration replaces it
+        self.workspace_manager.produced('live_integrated_peaks_ws', persistent=True)
+
+
+
+    def check_peaks_of_current_run(self):
+        live_predict_peaks_ws=mtdapi.mtd['live_integrated_peaks_ws']
+
+        #peaks_fname = 'live_%s_Niggli.integrate'%(str(current_run))
+        #peaks_ub_fname = 'live_%s_Niggli.mat'%(str(current_run))
+
+        # Set the monitor counts for all the peaks that will be integrated
+
+        # statistics and tracking use the main peaks; satellites follow them in the workspace
+        num_peaks = self.integrated_num_main_peaks or live_predict_peaks_ws.getNumberPeaks()
+        # row indices move whenever PredictPeaks rebuilds the workspace, so peaks are
+        # followed by their persistent id from the Q-space registry
+        hkl, intensity, sigma, d_spacing, q_sample = self.get_peak_arrays(live_predict_peaks_ws, num_peaks)
+        num_satellites = live_predict_peaks_ws.getNumberPeaks() - num_peaks
+        if num_satellites > 0:
+            satellite_intensity = np.array(live_predict_peaks_ws.column('Intens')[num_peaks:])
+            satellite_sigma = np.array(live_predict_peaks_ws.column('SigInt')[num_peaks:])
+            print("satellites with I/sig > 3:", int(np.count_nonzero(satellite_intensity > 3.0*satellite_sigma)), "of", num_satellites)
+        peak_ids = self.peak_registry.match(q_sample)
+        self.peak_registry.record(peak_ids, self.measure_time, intensity, sigma)
+        if self.maxpeak_id not in peak_ids:
+          if self.maxpeak_id > -1:
+            print("Warning: tracked peak ", self.maxpeak_id, " is no longer predicted")
+          self.maxpeak_id = int(peak_ids[np.argmax(intensity)])
+        self.maxpeak_idx = int(np.flatnonzero(peak_ids == self.maxpeak_id)[0])
+       
+        #self.maxpeak_idx=np.argmax(intIlist)
 
+        self.maxpeak_intI=intensity[self.maxpeak_idx]
+        
+        peak = live_predict_peaks_ws.getPeak(int(self.maxpeak_idx))
+        
+        #peak = live_predict_peaks_ws.getPeak(int(0))
+        self.hkl=peak.getHKL()
+        
+        # Merge with the incremental engine instead of re-running StatisticsOfPeaksWorkspace
+        statistics = self.update_merging_statistics(live_predict_peaks_ws, peak_ids, hkl, intensity, sigma, d_spacing)
+
+        print("Multiplicity = %.2f" % statistics['Multiplicity'])
+        print("Resolution Min = %.2f" % statistics['Resolution Min'])
+        print("Resolution Max = %.2f" % statistics['Resolution Max'])
+        print("No. of Unique Reflections = %i" % statistics['No. of Unique Reflections'])
+        print("Mean ((I)/sd(I)) = %.2f" % statistics['Mean ((I)/sd(I))'])
+        print("Rmerge = %.2f" % statistics['Rmerge'])
+        print("Rpim = %.2f" % statistics['Rpim'])
+        print("Completeness = %.2f" % statistics['Data Completeness'])
+
+        mtdapi.SaveIsawPeaks(Inputworkspace='live_integrated_peaks_ws', 
+            Filename= self.output_path + self.live_peaks_fname)
+        mtdapi.SaveIsawUB(Inputworkspace='live_integrated_peaks_ws',  
+            Filename= self.output_path + self.live_peaks_ub_fname)
+
+        # Check the overall peak intensity in live_peaks_ws
+        self.intensity_ratio =statistics['Mean ((I)/sd(I))']
+
+        self.Rsig = 100.0/self.intensity_ratio
+        print("Rsig = %.2f" % self.Rsig)
+
+        peak_history = self.peak_registry.history
+        # the viewers' snapshot reads these under the workspace lock
+        with self.workspace_lock:
             if self.intensity_ratio is not None and self.Rsig is not None and self.proton_charge is not None:
                 self.proton_charges.append(self.proton_charge)
                 self.intensity_ratios.append(self.intensity_ratio)
                 self.rsigs.append(self.Rsig)
                 self.measure_times.append(self.measure_time)  # Only append if all other values exist
+                self.beam_accounting.record_interval(self.measure_time)
             else:
                 print("Skipping entry due to missing data.")
-            self.sig2s  = np.append(self.sig2s , self.sig2 )
-            self.sig3s  = np.append(self.sig3s , self.sig3 )
-            self.sig5s  = np.append(self.sig5s , self.sig5 )
-            self.sig10s = np.append(self.sig10s, self.sig10)
-            # Save the plot data
-            print('measure_times, proton_charges, intensity_ratios, rsigs')
-            print(self.measure_times, self.proton_charges, self.intensity_ratios, self.rsigs)
-            results = np.column_stack((self.measure_times, self.proton_charges, self.intensity_ratios, self.rsigs))
-            np.savetxt(self.output_path + 'live_data_%s_results.csv'%(str(self.current_run)), results, delimiter=',', header='', comments='')
+            # summaries kept per interval as each one was recorded, not reduced again over the whole history
+            self.peak_fractions = peak_history.fraction_above()
+            self.isigma_percentiles = peak_history.percentiles()
+        print("fraction of peaks above", self.significance_levels, "sigma:", self.peak_fractions[:, -1])
+        # Save the plot data
+        print('measure_times, proton_charges, intensity_ratios, rsigs')
+        print(self.measure_times, self.proton_charges, self.intensity_ratios, self.rsigs)
+        results = np.column_stack((self.measure_times, self.proton_charges, self.intensity_ratios, self.rsigs))
+        np.savetxt(self.output_path + 'live_data_%s_results.csv'%(str(self.current_run)), results, delimiter=',', header='', comments='')
 
 
 #        def get_time_series_data(start_record_time:float)->np.array:
@@ -562,286 +861,517 @@ class MantidWorkflow():
 #                    raise
 #            #self.run_start_time = mtdapi.mtd['live_event_ws'].getRun().startTime().totalNanoseconds() * 1e-9
 # 
-            
-            #self.time_interval=10
-            self.total_time_of_run=self.measure_time*1e-0
-            self.total_numberof_time_intervals=int(self.total_time_of_run/self.time_interval)-len(self.timeseries_plt)
-            #TODO: copy in init
-            time_of_poissonprocess_start=self.time_interval*len(self.timeseries_plt)
-            self.time_of_poissonprocess=self.time_interval*self.total_numberof_time_intervals
-            time_of_poissonprocess_stop=time_of_poissonprocess_start+self.time_of_poissonprocess
-            self.timeseries = list(np.linspace(start=time_of_poissonprocess_start, stop= time_of_poissonprocess_stop,num=self.total_numberof_time_intervals+1,endpoint=True))
-#            self.timeseries_data = 
-
-
-            print("self.time_interval",self.time_interval)
-            print("self.measure_time",self.measure_time)
-            print("self.total_time_of_run",self.total_time_of_run)
-            print("self.total_numberof_time_intervals",self.total_numberof_time_intervals)
-            print("self.timeseries",self.timeseries)    
-
-            q_frame = 'lab' 
-            Q_box = 'Q_' + q_frame            
-
-            Q_box = 'HKL'            
-            ## get hkl limits
-            #cell = peaks_ws.mutableSample().getOrientedLattice()
-
-            #max_h = math.ceil(cell.a()*(float(Qmax)/2.0/math.pi))
-            #max_k = math.ceil(cell.b()*(float(Qmax)/2.0/math.pi))
-            #max_l = math.ceil(cell.c()*(float(Qmax)/2.0/math.pi))
-            #max_HKL ='%s,%s,%s'%(max_h,max_k,max_l)
-            #min_HKL ='-%s,-%s,-%s'%(max_h,max_k,max_l)
-
-            bin_size = [32, 32, 32]
-            bin_size = [3, 3, 3]
-            box_size_inhkl=[0.05,0.05,0.05]
-            h_box_len,k_box_len,l_box_len = box_size_inhkl
-            
-            h_bin_num = bin_size[0]
-            k_bin_num = bin_size[1]
-            l_bin_num = bin_size[2]
         
-            peak = live_predict_peaks_ws.getPeak(int(self.maxpeak_idx))
-            
-            #peak = live_predict_peaks_ws.getPeak(int(0))
-            h,k,l=peak.getHKL()
-            h,k,l=self.hkl
-
-            print("self.maxpeak_idx",self.maxpeak_idx)
-            print('peak,hkl',h,k,l,peak.getIntensity())
-            print('peakint',self.maxpeak_intI)
-            max_h = 20           
-            max_k = 20
-            max_l = 20
-            max_HKL ='%s,%s,%s'%(max_h,max_k,max_l)
-            min_HKL ='-%s,-%s,-%s'%(max_h,max_k,max_l)
-            self.timeseries_data   = []#np.array([])
-            mtdapi.LoadIsawUB(Inputworkspace='live_event_ws',  
-                    Filename= self.output_path + self.live_peaks_ub_fname)
-            if len(self.timeseries_plt)==0:
-                timeseries_loop=self.timeseries.copy()
+        #self.time_interval=10
+        self.total_time_of_run=self.measure_time*1e-0
+
+        print("self.time_interval",self.time_interval)
+        print("self.measure_time",self.measure_time)
+        print("self.total_time_of_run",self.total_time_of_run)
+
+        q_frame = 'lab' 
+        Q_box = 'Q_' + q_frame            
+
+        Q_box = 'HKL'            
+        ## get hkl limits
+        #cell = peaks_ws.mutableSample().getOrientedLattice()
+
+        #max_h = math.ceil(cell.a()*(float(Qmax)/2.0/math.pi))
+        #max_k = math.ceil(cell.b()*(float(Qmax)/2.0/math.pi))
+        #max_l = math.ceil(cell.c()*(float(Qmax)/2.0/math.pi))
+        #max_HKL ='%s,%s,%s'%(max_h,max_k,max_l)
+        #min_HKL ='-%s,-%s,-%s'%(max_h,max_k,max_l)
+
+        bin_size = [32, 32, 32]
+        bin_size = [3, 3, 3]
+        box_size_inhkl=[0.05,0.05,0.05]
+        h_box_len,k_box_len,l_box_len = box_size_inhkl
+        
+        h_bin_num = bin_size[0]
+        k_bin_num = bin_size[1]
+        l_bin_num = bin_size[2]
+    
+        peak = live_predict_peaks_ws.getPeak(int(self.maxpeak_idx))
+        
+        #peak = live_predict_peaks_ws.getPeak(int(0))
+        h,k,l=peak.getHKL()
+        h,k,l=self.hkl
+
+        print("self.maxpeak_idx",self.maxpeak_idx)
+        print('peak,hkl',h,k,l,peak.getIntensity())
+        print('peakint',self.maxpeak_intI)
+        max_h = 20           
+        max_k = 20
+        max_l = 20
+        max_HKL ='%s,%s,%s'%(max_h,max_k,max_l)
+        min_HKL ='-%s,-%s,-%s'%(max_h,max_k,max_l)
+        temporal_store = self.get_temporal_store(self.maxpeak_id, (h_bin_num, k_bin_num, l_bin_num))
+        mtdapi.LoadIsawUB(Inputworkspace='live_event_ws_peak',  
+                Filename= self.output_path + self.live_peaks_ub_fname)
+        # only the events since the tracked peak's last slice are binned, cut at the time bin edges;
+        # a newly tracked peak gets its whole history in O(log T) slices
+        stored_times = temporal_store.view('times')
+        sliced_time = float(stored_times[-1]) if len(stored_times) else 0.0
+        time_slices = self.time_bins.split(sliced_time, self.total_time_of_run)
+        print("time bins", len(self.time_bins.edges) - 1, ", new slices", len(time_slices))
+
+        for bin_index, slice_start, slice_stop in time_slices:
+            self.cycle_tokens['intensity'].check()
+            start_time = slice_start
+            stop_time = slice_stop
+
+            if self.run_transition is not None and self.current_run != self.run_transition.current_run:
+                print("run finished")
+                break
+            slice_proton_charge = self.beam_accounting.charge_between(start_time, stop_time)
+            # only the events of this interval are converted; the cumulative signal is
+            # carried over from the previous interval, so a sliding event window stays exact
+            mtdapi.FilterByTime(InputWorkspace='live_event_ws_peak', OutputWorkspace='timestep_event_ws',
+                            StartTime=start_time, StopTime=stop_time)
+            self.workspace_manager.produced('timestep_event_ws', consumers=('convert_to_md',))
+
+            mtdapi.ConvertToMD(InputWorkspace='timestep_event_ws', 
+                            QDimensions='Q3D', dEAnalysisMode='Elastic', 
+                            Q3DFrames=Q_box, QConversionScales='HKL', 
+                            Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
+                            MinValues=min_HKL, MaxValues=max_HKL
+                ,OutputWorkspace='timestep_event_ws_md')
+            self.workspace_manager.consumed('timestep_event_ws', 'convert_to_md')
+            self.workspace_manager.produced('timestep_event_ws_md', consumers=('bin_md',))
+            #mtdapi.BinMD(InputWorkspace='timestep_event_ws', AlignedDim0='Q_sample_x,-0.5,0.5,1',
+            #    AlignedDim1='Q_sample_y,-0.5,0.5,1', AlignedDim2='Q_sample_z,-0.5,0.5,1',
+            #    OutputWorkspace='timestep_HKL_ws')
+
+
+            mtdapi.BinMD(InputWorkspace='timestep_event_ws_md', 
+                                        AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), 
+                                         AlignedDim1='[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num),
+                                         AlignedDim2='[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num),
+                                        OutputWorkspace='timestep_HKL_ws')
+            self.workspace_manager.consumed('timestep_event_ws_md', 'bin_md')
+            self.workspace_manager.produced('timestep_HKL_ws', consumers=('signal',))
+                #                         OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
+            data = mtdapi.mtd['timestep_HKL_ws']
+            # a slice joins the open bin unless it starts a new bin or a new orientation segment,
+            # cumulative views restart with every segment
+            slice_segment = self.goniometer_tracker.segment_of(slice_start)
+            segments = temporal_store.view('segments')
+            if (not len(temporal_store) or slice_start == self.time_bins.bounds(bin_index)[0]
+                    or segments[-1] != slice_segment):
+                temporal_store.append(slice_stop, data.getSignalArray(), slice_proton_charge, slice_segment,
+                    data.getErrorSquaredArray())
             else:
-                timeseries_loop=[self.timeseries_plt[-1]]+self.timeseries
-
-            for i in range(len(timeseries_loop)-1):
-                st=mtdapi.mtd['live_event_ws'].getRun().startTime()
-                print("start time:",st)
-                
-                start_time = timeseries_loop[i+0]*1.0
-                stop_time = timeseries_loop[i+1]*1.0
-
-                if self.current_run!=mtdapi.mtd['live_event_ws'].getRunNumber():
-                    print("run finished")
-                    break
-                print("filter 10.0",start_time,stop_time)
-                #TODO: if starttime is >10, all steps other than first are 0, including same time range second part
-                mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-                                StartTime=0, StopTime=stop_time)
-                start_time = st+int(timeseries_loop[i])*1000000000
-                stop_time = st+int(timeseries_loop[i+1])*1000000000
-                
-                mtdapi.ConvertToMD(InputWorkspace='timestep_event_ws', 
-                                QDimensions='Q3D', dEAnalysisMode='Elastic', 
-                                Q3DFrames=Q_box, QConversionScales='HKL', 
-                                Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
-                                MinValues=min_HKL, MaxValues=max_HKL
-                    ,OutputWorkspace='timestep_event_ws_md')
-                #mtdapi.BinMD(InputWorkspace='timestep_event_ws', AlignedDim0='Q_sample_x,-0.5,0.5,1',
-                #    AlignedDim1='Q_sample_y,-0.5,0.5,1', AlignedDim2='Q_sample_z,-0.5,0.5,1',
-                #    OutputWorkspace='timestep_HKL_ws')
-
-
-                mtdapi.BinMD(InputWorkspace='timestep_event_ws_md', 
-                                            AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), 
-                                             AlignedDim1='[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num),
-                                             AlignedDim2='[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num),
-                                            OutputWorkspace='timestep_HKL_ws')
-                    #                         OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
-                print("AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), ")
-                print('[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num))
-                print(" AlignedDim1=",'[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num))
-                                            
-                print("AlignedDim2=",'[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num))
-                data = mtdapi.mtd['timestep_HKL_ws']
-                signal_array = data.getSignalArray().copy()
-                #self.timeseries_data = np.append(self.timeseries_data,signal_array)
-                self.timeseries_data.append(signal_array)
-                print(signal_array)
-                print(signal_array.shape)
-                print("==========================")
-                '''
-                print("filter 10.0",start_time,stop_time)
-                mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-                                AbsoluteStartTime=str(start_time), AbsoluteStopTime=str(stop_time))
-                #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
-                #                StartTime=start_time, StopTime=stop_time)
-                #print("filter 10.1")
-                
-                #start_record_time=self.current_run_start_time+self.time_interval
-
-                #mtdapi.StartLiveData(
-                #        Instrument='TOPAZ',
-                #        Listener='SNSLiveEventDataListener',
-                #        FromTime=True,
-                #        StartTime=start_time,
-                #        LastTimeStamp=stop_time,
-                #        UpdateEvery=0,
-                #        AccumulationMethod='Add',
-                #        PreserveEvents=True,
-                #        OutputWorkspace='timestep_event_ws')
-
-                mtdapi.ConvertToMD(InputWorkspace='timestep_event_ws', 
-                                QDimensions='Q3D', dEAnalysisMode='Elastic', 
-                                Q3DFrames=Q_box, QConversionScales='HKL', 
-                                Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
-                                MinValues=min_HKL, MaxValues=max_HKL
-                    ,OutputWorkspace='timestep_event_ws_md')
-                #mtdapi.BinMD(InputWorkspace='timestep_event_ws', AlignedDim0='Q_sample_x,-0.5,0.5,1',
-                #    AlignedDim1='Q_sample_y,-0.5,0.5,1', AlignedDim2='Q_sample_z,-0.5,0.5,1',
-                #    OutputWorkspace='timestep_HKL_ws')
-
-
-                mtdapi.BinMD(InputWorkspace='timestep_event_ws_md', 
-                                            AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), 
-                                             AlignedDim1='[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num),
-                                             AlignedDim2='[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num),
-                                            OutputWorkspace='timestep_HKL_ws')
-                    #                         OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
-                print("AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), ")
-                print('[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num))
-                print(" AlignedDim1=",'[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num))
-                                            
-                print("AlignedDim2=",'[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num))
-                data = mtdapi.mtd['timestep_HKL_ws']
-                signal_array = data.getSignalArray().copy()
-                #self.timeseries_data = np.append(self.timeseries_data,signal_array)
-                self.timeseries_data.append(signal_array)
-                print(signal_array)
-                print(signal_array.shape)
-                '''
-            print("====================================")
-            print("self.timeseries_data") 
-            print(len(self.timeseries_data))
-            print(len(self.timeseries))
-#            print(self.timeseries_data)
-            print(len(self.timeseries_data_plt))
-
-            print(len(self.timeseries_plt))
-
-            self.timeseries_plt=self.timeseries_plt+self.timeseries
-            self.timeseries_data_plt=self.timeseries_data_plt+self.timeseries_data
-
-            #print(len(self.timeseries_data))
-
-            print(len(self.timeseries_plt))
-
-            print(len(self.timeseries_data_plt))
-
-
-
-            print(self.timeseries_plt)
-
-            print(self.timeseries_data_plt)
-            self.temporal_poisson_intensity=[0,self.timeseries_data_plt[0]]+[ (self.timeseries_data_plt[i][1,1,1]-self.timeseries_data_plt[i-1])/self.time_interval for i in range(1,len(self.timeseries_data_plt))]
-            self.temporal_poisson_intensity=[0]+[np.mean(np.array(self.temporal_poisson_intensity[:i])) for i in range(1,len(self.temporal_poisson_intensity))]
-            self.temporal_poisson_uncertainty=[0]+[np.var(np.array(self.temporal_poisson_intensity[:i])) for i in range(1,len(self.temporal_poisson_intensity))]
-            self.temporal_poisson_uncertainty=np.array(self.temporal_poisson_uncertainty)**-0.5**np.array(self.timeseries)**-0.5*100
-
-
-        def get_time_series_data_0()->np.array:
+                temporal_store.merge_last(slice_stop, data.getSignalArray(), slice_proton_charge,
+                    data.getErrorSquaredArray())
+            self.workspace_manager.consumed('timestep_HKL_ws', 'signal')
+            print("bin", bin_index, "of peak", self.maxpeak_id, "has", temporal_store.center_counts()[-1], "central counts")
+            '''
+            print("filter 10.0",start_time,stop_time)
+            mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
+                            AbsoluteStartTime=str(start_time), AbsoluteStopTime=str(stop_time))
+            #mtdapi.FilterByTime(InputWorkspace='live_event_ws', OutputWorkspace='timestep_event_ws',
+            #                StartTime=start_time, StopTime=stop_time)
+            #print("filter 10.1")
             
-
-            peaks_ws=mtdapi.LoadIsawPeaks(Filename=peaks_filename)
-            mtdapi.LoadIsawUB(InputWorkspace='peaks_ws', Filename=UB_filename)
-            mtdapi.IndexPeaks(PeaksWorkspace='peaks_ws', Tolerance=tolerance, ToleranceForSatellite=tolerance_satellite, 
-                    RoundHKLs=False, CommonUBForAll=True)
-
-            MDEW=mtdapi.ConvertToMD(InputWorkspace='event_ws', 
+            #start_record_time=self.current_run_start_time+self.time_interval
+
+            #mtdapi.StartLiveData(
+            #        Instrument='TOPAZ',
+            #        Listener='SNSLiveEventDataListener',
+            #        FromTime=True,
+            #        StartTime=start_time,
+            #        LastTimeStamp=stop_time,
+            #        UpdateEvery=0,
+            #        AccumulationMethod='Add',
+            #        PreserveEvents=True,
+            #        OutputWorkspace='timestep_event_ws')
+
+            mtdapi.ConvertToMD(InputWorkspace='timestep_event_ws', 
                             QDimensions='Q3D', dEAnalysisMode='Elastic', 
                             Q3DFrames=Q_box, QConversionScales='HKL', 
                             Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
-                            MinValues=min_HKL, MaxValues=max_HKL)
-
-            # if not os.path.exists(plot_folder):
-            #     os.makedirs(plot_folder)
-
-            UB = peaks_ws.sample().getOrientedLattice().getUB()
-            banks = mtd['peaks_ws'].column(13)
-
-            peak_numbers = [1]
-            #peak_numbers = [167,168,169,170,171,172,173,174,175,176]
-            print(len(peak_numbers))
+                            MinValues=min_HKL, MaxValues=max_HKL
+                ,OutputWorkspace='timestep_event_ws_md')
+            #mtdapi.BinMD(InputWorkspace='timestep_event_ws', AlignedDim0='Q_sample_x,-0.5,0.5,1',
+            #    AlignedDim1='Q_sample_y,-0.5,0.5,1', AlignedDim2='Q_sample_z,-0.5,0.5,1',
+            #    OutputWorkspace='timestep_HKL_ws')
+
+
+            mtdapi.BinMD(InputWorkspace='timestep_event_ws_md', 
+                                        AlignedDim0='[H,0,0],{},{},{}'.format(h-h_box_len,h+h_box_len,h_bin_num), 
+                                         AlignedDim1='[0,K,0],{},{},{}'.format(k-k_box_len,k+k_box_len,k_bin_num),
+                                         AlignedDim2='[0,0,L],{},{},{}'.format(l-l_box_len,l+l_box_len,l_bin_num),
+                                        OutputWorkspace='timestep_HKL_ws')
+                #                         OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
+            data = mtdapi.mtd['timestep_HKL_ws']
+            signal_array = data.getSignalArray().copy()
+            #self.timeseries_data = np.append(self.timeseries_data,signal_array)
+            self.timeseries_data.append(signal_array)
+            print(signal_array)
+            print(signal_array.shape)
+            '''
+        self.workspace_manager.consumed('live_event_ws_peak', 'time_slices')
+        print("time slices of peak", self.maxpeak_id, ":", len(temporal_store))
+
+        self.timeseries_plt=list(temporal_store.view('times'))
+        temporal_store.flush()
+        self.update_poisson_estimate(temporal_store)
+
+    def get_temporal_store(self, peak_id:int, bin_shape)->TemporalCubeStore:
+        """The time series store of a tracked peak, memory-mapped under temporal_store_directory if it is set."""
+        store = self.temporal_stores.get(peak_id)
+        if store is None:
+            path = None
+            if self.temporal_store_directory:
+                os.makedirs(self.temporal_store_directory, exist_ok=True)
+                path = os.path.join(self.temporal_store_directory, 'live_%s_peak_%d'%(str(self.current_run), peak_id))
+            store = TemporalCubeStore(bin_shape, path)
+            self.temporal_stores[peak_id] = store
+        return store
+
+    def update_poisson_estimate(self, temporal_store:TemporalCubeStore)->None:
+        """Running mean count rate of the tracked peak's central bin and its relative Poisson uncertainty (%).
+
+        Both restart with every goniometer segment, so they never mix orientations.
+        """
+        total = temporal_store.cumulative_counts(center=True)
+        variance = temporal_store.cumulative_counts('variances', center=True)
+        times = temporal_store.view('times')
+        elapsed = temporal_store.segment_elapsed()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uncertainty = np.where(total > 0, 100.0*np.sqrt(variance)/total, 0.0)
+            rate = np.where(elapsed > 0, total/elapsed, 0.0)
+        self.temporal_poisson_times = np.r_[0.0, times]
+        self.temporal_poisson_intensity = np.r_[0.0, rate]
+        self.temporal_poisson_uncertainty = np.r_[0.0, uncertainty]
+
+
+    def get_time_series_data_0(self)->np.array:
+        
 
-            for i in peak_numbers:
-            #for i in range(peaks_ws.getNumberPeaks()):
-                signal_array = []
-                H_array = []
-                K_array = []
-                L_array = []
+        peaks_ws=mtdapi.LoadIsawPeaks(Filename=peaks_filename)
+        mtdapi.LoadIsawUB(InputWorkspace='peaks_ws', Filename=UB_filename)
+        mtdapi.IndexPeaks(PeaksWorkspace='peaks_ws', Tolerance=tolerance, ToleranceForSatellite=tolerance_satellite, 
+                RoundHKLs=False, CommonUBForAll=True)
 
-                peak =peaks_ws.getPeak(i)
-                peak_index=peak.getPeakNumber()
-                h,k,l=peak.getHKL()
-                col=peak.getCol()
-                row=peak.getRow()
-                dn = int(banks[i].strip('bank'))
+        MDEW=mtdapi.ConvertToMD(InputWorkspace='event_ws', 
+                        QDimensions='Q3D', dEAnalysisMode='Elastic', 
+                        Q3DFrames=Q_box, QConversionScales='HKL', 
+                        Uproj='1,0,0', Vproj='0,1,0', Wproj='0,0,1',
+                        MinValues=min_HKL, MaxValues=max_HKL)
 
-                # l_min = l-fracHKL[2]
-                # l_max = l+fracHKL[2]
-
-                # l_step = (l_max-l_min)/(l_bins-1)
+        # if not os.path.exists(plot_folder):
+        #     os.makedirs(plot_folder)
 
-                # BinMD(InputWorkspace='MDEW', AlignedDim0='[H,0,0],{},{},{}'.format(h-0.5,h+0.5,h_bin_num), 
-                #                              AlignedDim1='[0,K,0],{},{},{}'.format(k-0.5,k+0.5,k_bin_num),
-                #                              AlignedDim2='[0,0,L],{},{},1'.format(l-l_step,l+l_step), 
-                #                              OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l)) 
+        UB = peaks_ws.sample().getOrientedLattice().getUB()
+        banks = mtd['peaks_ws'].column(13)
 
-                BinMD(InputWorkspace='MDEW', AlignedDim0='[H,0,0],{},{},{}'.format(h-0.5,h+0.5,h_bin_num), 
-                                             AlignedDim1='[0,K,0],{},{},{}'.format(k-0.5,k+0.5,k_bin_num),
-                                             AlignedDim2='[0,0,L],{},{},{}'.format(l-0.5,l+0.5,l_bin_num),
-                                             OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
+        peak_numbers = [1]
+        #peak_numbers = [167,168,169,170,171,172,173,174,175,176]
+        print(len(peak_numbers))
 
-                data = mtd['HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l)]
+        for i in peak_numbers:
+        #for i in range(peaks_ws.getNumberPeaks()):
+            signal_array = []
+            H_array = []
+            K_array = []
+            L_array = []
 
-                signal_array = data.getSignalArray().copy()
-            return signal_array
+            peak =peaks_ws.getPeak(i)
+            peak_index=peak.getPeakNumber()
+            h,k,l=peak.getHKL()
+            col=peak.getCol()
+            row=peak.getRow()
+            dn = int(banks[i].strip('bank'))
+
+            # l_min = l-fracHKL[2]
+            # l_max = l+fracHKL[2]
+
+            # l_step = (l_max-l_min)/(l_bins-1)
+
+            # BinMD(InputWorkspace='MDEW', AlignedDim0='[H,0,0],{},{},{}'.format(h-0.5,h+0.5,h_bin_num), 
+            #                              AlignedDim1='[0,K,0],{},{},{}'.format(k-0.5,k+0.5,k_bin_num),
+            #                              AlignedDim2='[0,0,L],{},{},1'.format(l-l_step,l+l_step), 
+            #                              OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l)) 
+
+            BinMD(InputWorkspace='MDEW', AlignedDim0='[H,0,0],{},{},{}'.format(h-0.5,h+0.5,h_bin_num), 
+                                         AlignedDim1='[0,K,0],{},{},{}'.format(k-0.5,k+0.5,k_bin_num),
+                                         AlignedDim2='[0,0,L],{},{},{}'.format(l-0.5,l+0.5,l_bin_num),
+                                         OutputWorkspace='HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l))
+
+            data = mtd['HKL=({:.2f},{:.2f},{:.2f})_binslice'.format(h,k,l)]
+
+            signal_array = data.getSignalArray().copy()
+        return signal_array
+
+
+    def orientation_converged(self)->bool:
+        """True when counting stopped on the current orientation because it reached the counting target."""
+        return self.goniometer_tracker.segment in self.converged_segments
+
+    def set_counting_target(self, target_uncertainty:Optional[float], series:str='statistics')->None:
+        """Stop counting on an orientation once the uncertainty (%) of series ('statistics' or 'poisson') reaches target_uncertainty.
+
+        One setting for the shared reduction: None counts on whatever the viewers show.
+        """
+        with self.workspace_lock:
+            self.counting_target = None if target_uncertainty is None else (float(target_uncertainty), series)
+        print("counting target:", self.counting_target)
+
+    def check_counting_target(self)->bool:
+        """Stop counting on the current orientation when it reached the counting target; fires once per orientation."""
+        with self.workspace_lock:
+            if self.counting_target is None:
+                return False
+            target, series = self.counting_target
+            uncertainty = self.temporal_poisson_uncertainty if series == 'poisson' else self.rsigs
+            segment = self.goniometer_tracker.segment
+            if segment in self.converged_segments or not target_reached(uncertainty, target):
+                return False
+            self.converged_segments.add(segment)
+        self.clear_data_after_data_saturation('counting target reached on orientation segment %d'%segment)
+        return True
+
+    def clear_data_after_data_saturation(self, reason:str='counting target reached'):
+        """Save the peaks and UB of a converged orientation and stop reducing it until the goniometer moves."""
+        # This will cancel both algorithms
+        self.cancel_cycles(reason)
+        with self.workspace_lock:
+            # save results
+            mtdapi.SaveIsawPeaks(Inputworkspace='live_integrated_peaks_ws', 
+                    Filename= self.output_path + self.live_peaks_fname )
+            mtdapi.SaveIsawUB(Inputworkspace='live_integrated_peaks_ws',  
+                    Filename= self.output_path + self.live_peaks_ub_fname )
+
+            # Clear the lists to start plotting fresh data points
+            self.proton_charges.clear()
+            self.intensity_ratios.clear()
+            self.rsigs.clear()
+            self.measure_times.clear()
+            self.data_version += 1
+
+    def set_point_group(self, point_group:str, lattice_centering:str)->None:
+        """Select the symmetry used for merging; the equivalence index is rebuilt on the next cycle."""
+        if point_group != self.point_group or lattice_centering != self.lattice_centering:
+            print("merging statistics point group set to", point_group, lattice_centering)
+            self.point_group = point_group
+            self.lattice_centering = lattice_centering
+            self.merging_statistics = None
+
+    def get_peak_arrays(self, peaks_ws, num_peaks=None):
+        """Return hkl, intensity, sigma, d-spacing and Q_sample of the first num_peaks rows as numpy arrays."""
+        rows = slice(num_peaks or None)
+        hkl = np.column_stack([np.array(peaks_ws.column(c))[rows] for c in ('h', 'k', 'l')])
+        intensity = np.array(peaks_ws.column('Intens'))[rows]
+        sigma = np.array(peaks_ws.column('SigInt'))[rows]
+        d_spacing = np.array(peaks_ws.column('DSpacing'))[rows]
+        q_sample = np.array([[q.X(), q.Y(), q.Z()] for q in peaks_ws.column('QSample')[rows]]).reshape(-1, 3)
+        return hkl, intensity, sigma, d_spacing, q_sample
+
+    def update_merging_statistics(self, peaks_ws, peak_ids, hkl, intensity, sigma, d_spacing)->dict:
+        if self.merging_statistics is None:
+            index = SymmetryEquivalenceIndex.from_point_group(self.point_group, self.lattice_centering)
+            self.merging_statistics = IncrementalMergingStatistics(index)
+        ub = peaks_ws.sample().getOrientedLattice().getUB()
+        self.merging_statistics.set_resolution_limits(ub, self.pred_min_d_spacing, self.pred_max_d_spacing)
+        changed = self.merging_statistics.update(peak_ids, hkl, intensity, sigma, d_spacing)
+        print("merging statistics updated for", changed, "changed peaks")
+        return self.merging_statistics.statistics()
+
+    def set_prediction_limits(self, min_wavelength:float, max_wavelength:float, min_d_spacing:float, max_d_spacing:float)->None:
+        self.pred_min_wavelength = min_wavelength
+        self.pred_max_wavelength = max_wavelength
+        self.pred_min_d_spacing = min_d_spacing
+        self.pred_max_d_spacing = max_d_spacing
+        if self.reduction_graph.set_input('prediction_limits', (min_wavelength, max_wavelength, min_d_spacing, max_d_spacing)):
+            print("prediction limits changed to", min_wavelength, max_wavelength, min_d_spacing, max_d_spacing)
+            self.cancel_cycles('prediction limits changed', paths=('orientation',))
+
+    def set_integration_radii(self, peak_size:float, background_inner_size:float, background_outer_size:float)->None:
+        self.peak_size = peak_size
+        self.background_inner_size = background_inner_size
+        self.background_outer_size = background_outer_size
+        self.region_radius = max(self.region_radius, background_outer_size)
+        if self.reduction_graph.set_input('integration_radii', (peak_size, background_inner_size, background_outer_size, self.region_radius)):
+            print("integration radii changed to", peak_size, background_inner_size, background_outer_size)
+            self.cancel_cycles('integration radii changed', paths=('intensity',))
+
+    def begin_cycle(self, path:str)->CancelToken:
+        token = CancelToken()
+        self.cycle_tokens[path] = token
+        return token
+
+    def cancel_cycles(self, reason:str, paths=('orientation', 'intensity'))->None:
+        """Abandon the running cycles of paths: stop at the next stage and cancel their running algorithms."""
+        workspaces = []
+        for path in paths:
+            self.cycle_tokens[path].cancel(reason)
+            workspaces.extend(self.cycle_workspaces[path])
+        cancelled = cancel_running_algorithms(workspaces)
+        print("cancelling", ', '.join(paths), "cycle:", reason, "(%d running algorithms stopped)"%cancelled)
+
+    def abandon_cycle(self, path:str, token:CancelToken)->None:
+        """Free the intermediates a cancelled cycle left behind."""
+        print(path, "cycle abandoned:", token.reason)
+        if path == 'orientation':
+            # a half-added chunk would leave the grid and the MD workspace out of step
+            self.reset_peak_search()
+        for name in self.cycle_workspaces[path]:
+            if name != 'live_integrated_peaks_ws':
+                self.workspace_manager.release(name)
+
+    def build_reduction_graph(self)->ReductionGraph:
+        """Declare the reduction stages and the inputs each of them reads."""
+        graph = ReductionGraph()
+        graph.add_stage('load_config', ('events', 'calibration', 'goniometer'), self.load_config_of_current_run)
+        graph.add_stage('peak_search', ('orientation_events', 'calibration', 'goniometer'), self.refine_ub_of_current_run)
+        graph.add_stage('prediction', ('peak_search', 'prediction_limits', 'modulation'), self.predict_peaks_of_current_run)
+        graph.add_stage('integration', ('events', 'prediction', 'integration_radii', 'satellite_radii'), self.integrate_peaks_of_current_run)
+        graph.add_stage('statistics', ('integration',), self.check_peaks_of_current_run)
+        graph.set_input('prediction_limits', (self.pred_min_wavelength, self.pred_max_wavelength, self.pred_min_d_spacing, self.pred_max_d_spacing))
+        graph.set_input('integration_radii', (self.peak_size, self.background_inner_size, self.background_outer_size, self.region_radius))
+        graph.set_input('modulation', (self.mod_vector1, self.mod_vector2, self.mod_vector3, int(self.max_order), bool(self.cross_terms)))
+        graph.set_input('satellite_radii', (self.satellite_peak_size, self.satellite_region_radius,
+            self.satellite_background_inner_size, self.satellite_background_outer_size))
+        return graph
+
+    def set_modulation(self, mod_vectors, max_order:int, cross_terms:bool, satellite_peak_size:float,
+            satellite_region_radius:float, satellite_background_inner_size:float, satellite_background_outer_size:float)->None:
+        """Set the modulation used to predict satellites and their integration sizes."""
+        self.mod_vector1, self.mod_vector2, self.mod_vector3 = [','.join(str(float(x)) for x in parse_vector(v)) for v in mod_vectors]
+        self.max_order = int(max_order)
+        self.cross_terms = bool(cross_terms)
+        self.satellite_peak_size = satellite_peak_size
+        self.satellite_region_radius = satellite_region_radius
+        self.satellite_background_inner_size = satellite_background_inner_size
+        self.satellite_background_outer_size = satellite_background_outer_size
+        if self.reduction_graph.set_input('modulation', (self.mod_vector1, self.mod_vector2, self.mod_vector3, self.max_order, self.cross_terms)):
+            print("modulation changed to", self.mod_vector1, self.mod_vector2, self.mod_vector3, "max order", self.max_order)
+            self.cancel_cycles('modulation changed', paths=('orientation',))
+        if self.reduction_graph.set_input('satellite_radii', (satellite_peak_size, satellite_region_radius,
+                satellite_background_inner_size, satellite_background_outer_size)):
+            self.cancel_cycles('satellite radii changed', paths=('intensity',))
+
+    def set_reduction_inputs(self)->None:
+        """Fingerprint the current live_event_ws; call with the workspace lock held."""
+        live_event_ws = mtdapi.mtd['live_event_ws']
+        self.reduction_graph.set_input('events', (live_event_ws.getRunNumber(), live_event_ws.getNumberEvents(),
+                live_event_ws.getRun().endTime().totalNanoseconds()))
+        self.reduction_graph.set_input('calibration', self.calib_fname)
+        self.reduction_graph.set_input('orientation_events', (self.current_run, self.orientation_epoch))
+        self.goniometer_tracker.update(live_event_ws.getRun())
+        self.reduction_graph.set_input('goniometer', self.goniometer_tracker.angles)
+
+    def orientation_update_due(self)->bool:
+        """Return True when the slow orientation path (peak search, UB, prediction) should run."""
+        if not mtdapi.mtd.doesExist('live_event_ws'):
+            # between the listener renaming a finished run and adding the next one
+            return False
+        if not mtdapi.mtd.doesExist('live_predict_peaks_ws'):
+            return True
+        if time.time() - self.last_orientation_update >= self.slow_update_interval:
+            # a new epoch makes peak search dirty even if nothing else changed
+            self.orientation_epoch += 1
+        with self.workspace_lock:
+            self.set_reduction_inputs()
+        return self.reduction_graph.is_dirty('peak_search') or self.reduction_graph.is_dirty('prediction')
+
+    def update_orientation(self):
+        """Slow path: FindPeaksMD/FindUBUsingFFT/PredictPeaks, published under the workspace lock."""
+        if not mtdapi.mtd.doesExist('live_event_ws'):
+            return
+        print("orientation update started")
+        token = self.begin_cycle('orientation')
+        try:
+            with self.workspace_lock:
+                self.get_and_update_run_info_of_current_run()
+                self.set_reduction_inputs()
+                if self.orientation_converged():
+                    print("orientation reached the counting target, waiting for the goniometer to move")
+                    return
+                self.reduction_graph.run(('load_config',), token)
+            # prediction reads the MD workspace of the last peak search, which is freed once used
+            if self.reduction_graph.is_dirty('prediction') and not mtdapi.mtd.doesExist('live_event_md_Qsample'):
+                self.reduction_graph.invalidate('peak_search')
+            ran = self.reduction_graph.run(('peak_search', 'prediction'), token)
+        except (CycleCancelledError, RuntimeError):
+            # a cancelled Mantid algorithm surfaces as a RuntimeError
+            if not token.cancelled:
+                raise
+            self.abandon_cycle('orientation', token)
+            return
+        print("orientation stages recomputed:", ran)
+        # when peak search found the same UB, prediction was skipped and never read the snapshot:
+        # free the event clone now instead of keeping it until the next cycle
+        if 'peak_search' in ran and 'prediction' not in ran:
+            self.workspace_manager.consumed('live_event_ws_ub', 'integrate_found_peaks')
+        if 'peak_search' in ran:
+            self.last_orientation_update = time.time()
+        self.memory_report = self.workspace_manager.report('orientation')
+
+    def update_intensity(self):
+        """Fast path: integrate the current predicted peaks and update the statistics."""
+        if not mtdapi.mtd.doesExist('live_event_ws'):
+            return
+        if not mtdapi.mtd.doesExist('live_predict_peaks_ws'):
+            print("No predicted peaks yet, waiting for the orientation path")
+            return
+        print("intensity update started")
+        token = self.begin_cycle('intensity')
+        try:
+            # calibration and goniometer are applied to live_event_ws itself, under the lock;
+            # integration snapshots it and the rest of the cycle works on the copies
+            with self.workspace_lock:
+                self.get_and_update_run_info_of_current_run()
+                if not mtdapi.mtd.doesExist('live_predict_peaks_ws'):
+                    print("Run changed, waiting for the orientation path")
+                    return
+                self.apply_event_window()
+                self.set_reduction_inputs()
+                if self.orientation_converged():
+                    print("orientation reached the counting target, waiting for the goniometer to move")
+                    return
+                ran = self.reduction_graph.run(('load_config',), token)
+            ran += self.reduction_graph.run(('integration', 'statistics'), token)
+            if 'statistics' in ran:
+                with self.workspace_lock:
+                    self.data_version += 1
+        except (CycleCancelledError, RuntimeError):
+            if not token.cancelled:
+                raise
+            self.abandon_cycle('intensity', token)
+            return
+        if not ran:
+            print("No new events or parameter changes, nothing to recompute")
+            return
+        print("intensity stages recomputed:", ran)
+        self.memory_report = self.workspace_manager.report('intensity')
+        if 'statistics' in ran:
+            self.check_counting_target()
+
+    def snapshot(self)->dict:
+        """Copy of the results the viewers display, taken under the workspace lock."""
+        with self.workspace_lock:
+            return dict(
+                data_version=self.data_version,
+                run=getattr(self, 'current_run', None),
+                measure_times=list(self.measure_times),
+                proton_charges=list(self.proton_charges),
+                intensity_ratios=list(self.intensity_ratios),
+                rsigs=list(self.rsigs),
+                time_steps=list(self.timeseries_plt),
+                peak_times=list(self.peak_registry.history.times),
+                peak_fractions=dict(zip(self.significance_levels, self.peak_fractions.tolist())),
+                isigma_percentiles=dict(zip(self.isigma_percents, self.isigma_percentiles.tolist())),
+                memory=dict(self.memory_report),
+            )
 
-    
-        def clear_data_after_data_saturation():
-            #TODO: to be taken out
-            self.cancel_threshold =30 
-
-            if self.intensity_ratio > self.cancel_threshold:
-                time.sleep(2)
-                # This will cancel both algorithms
-                #AlgorithmManager.cancelAll()
-                # save results
-                mtdapi.SaveIsawPeaks(Inputworkspace='live_predict_peaks_ws', 
-                        Filename= self.output_path + self.live_peaks_fname )
-                mtdapi.SaveIsawUB(Inputworkspace='live_predict_peaks_ws',  
-                        Filename= self.output_path + self.live_peaks_fname )
-
-                # Clear the lists to start plotting fresh data points
-                self.proton_charges.clear()
-                self.intensity_ratios.clear()
-                self.rsigs.clear()
-                self.measure_times.clear()
-
-                # Pause briefly to let the plots be updated
-                time.sleep(1)
-                #print("Intensity ratio exceeds the cancel threshold. Exiting...")
-
-            # Pause briefly to let the plots be updated
-            #time.sleep(15)
+    def live_data_reduction(self):
         print("============================================================================================")
         print("live data reduction started")
         print("============================================================================================")
-        get_and_update_run_info_of_current_run()
-        load_config_of_current_run()
-        refine_ub_of_current_run()
-        integrate_peaks_of_current_run()
-        check_peaks_of_current_run()
+        self.update_orientation()
+        self.update_intensity()
 
 #class TemporalData(BaseModel):
 #    time: float
@@ -1024,7 +1554,9 @@ class TemporalAnalysisModel(BaseModel):
     #headers: List[str] = Field(default=["Title", "Comment", "BL12:Mot:goniokm:phi", "BL12:Mot:goniokm:omega", "Wait For", "Value", "Or Time"])
     table_test: List[Dict] = Field(default=[{"title":"1","header":"h"}])
     prediction_model_type: str = Field(default="Poisson Model", title="Prediction Model")
-    prediction_model_type_options: List[str] = ["Poisson Model", "Linear Interpolation"]
+    prediction_model_type_options: List[str] = list(PREDICTION_MODELS)
+    confidence_band_type: str = Field(default="Analytic", title="Confidence Band")
+    confidence_band_type_options: List[str] = CONFIDENCE_BANDS
     time_steps: List[float] = Field(default=[0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0], title="Time Steps")
     intensity_data: List[float] = Field(default=[0.0, 1.0, 4.0, 9.0, 16.0, 25.0, 36.0, 49.0, 64.0, 81.0], title="Intensity Data")
     variance_data: List[float] = Field(default=[0.0, 0.1, 0.4, 0.9, 1.6, 2.5, 3.6, 4.9, 6.4, 8.1], title="Variance Data")
@@ -1033,107 +1565,144 @@ class TemporalAnalysisModel(BaseModel):
     timestamp: float=Field(default=0.0,title="timestamp")
     all_time: List[float] = Field(default=[0.0, 10000], title="All Time")
     #mtd_workflow: MantidWorkflow = Field(default=MantidWorkflow(), title="Mantid Workflow")
-    time_interval : float=Field(default=1.0,title="Time Interval")
-    mtd_workflow: ClassVar[MantidWorkflow] = MantidWorkflow(time_interval)
+    time_interval : float=Field(default=DEFAULT_TIME_INTERVAL,title="Time Interval")
+    fast_update_interval: float = Field(default=3.0, title="Intensity Update Interval (s)")
+    slow_update_interval: float = Field(default=180.0, title="Orientation Update Interval (s)")
+    # history traces are decimated to this many points, over the zoomed time range of each plot
+    plot_point_budget: int = Field(default=1000, title="Points per Plot")
+    intensity_time_range: Optional[List[float]] = Field(default=None, title="Zoomed Intensity Time Range")
+    uncertainty_time_range: Optional[List[float]] = Field(default=None, title="Zoomed Uncertainty Time Range")
+    # counting goal of the measured peaks; I/sigma targets are converted to Rsig = 100 / (I/sigma)
+    target_type: str = Field(default="I/sigma", title="Target")
+    target_type_options: List[str] = ["I/sigma", "Rsig (%)"]
+    target_value: float = Field(default=30.0, title="Target Value")
+    stop_at_target: bool = Field(default=False, title="Stop Counting at Target")
+    time_to_target: Dict[str, Optional[float]] = Field(default={}, title="Time to Target")
+    time_to_target_text: str = Field(default="", title="Time to Target")
+    instrument: ClassVar[str] = 'TOPAZ'
+    # fitted prediction models, per (plot, prediction model); built when first chosen
+    prediction_models: ClassVar[Dict[tuple, PredictionModel]] = {}
+    prediction_models_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def get_history(self, plot: str, series: str) -> tuple:
+        """Times and values of the intensity or uncertainty history in the workflow's statistics or poisson series."""
+        workflow = self.mtd_workflow
+        if series == 'poisson':
+            values = workflow.temporal_poisson_intensity if plot == 'intensity' else workflow.temporal_poisson_uncertainty
+            return workflow.temporal_poisson_times, values
+        return workflow.measure_times, workflow.intensity_ratios if plot == 'intensity' else workflow.rsigs
+
+    def get_prediction_model(self, plot: str) -> tuple:
+        """The chosen prediction model of one plot, fitted to the current data version, and the history it was fitted to."""
+        key = (plot, self.prediction_model_type)
+        with self.prediction_models_lock:
+            model = self.prediction_models.get(key)
+            if model is None:
+                model = create_prediction_model(self.prediction_model_type, plot)
+                self.prediction_models[key] = model
+            time_steps, values = self.get_history(plot, model.series)
+            model.update(time_steps, values, self.mtd_workflow.data_version)
+        return model, time_steps, values
+
+    def prediction_range(self, time_steps) -> np.ndarray:
+        start = float(time_steps[-1]) if len(time_steps) else 0.0
+        return np.linspace(start, start+2000, 100)
+
+    @staticmethod
+    def add_confidence_band(fig: go.Figure, x_range, y_lower, y_upper) -> None:
+        fig.add_trace(go.Scatter(x=x_range, y=y_upper, mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=x_range, y=y_lower, mode='lines', line=dict(width=0), fill='tonexty',
+            fillcolor='rgba(99,110,250,0.2)', name='95% Confidence Band', hoverinfo='skip'))
 
     def get_figure_intensity(self) -> go.Figure:
         #self.timestamp = time.time()
         fig = go.Figure()
-        #self.time_steps=self.mtd_workflow.measure_times
-        if self.prediction_model_type=='Linear Interpolation':
-            time_steps=self.mtd_workflow.measure_times
-            intensity_data = self.mtd_workflow.intensity_ratios
-        if self.prediction_model_type=='Poisson Model':
-            time_steps=self.mtd_workflow.timeseries_plt
-            intensity_data=self.mtd_workflow.temporal_poisson_intensity
+        # only the points added since the last data version go into the fit
+        model, time_steps, intensity_data = self.get_prediction_model('intensity')
         print("============================================================================================")
-        print("time_steps = self.mtd_workflow.measure_times")
-        print(time_steps , self.mtd_workflow.measure_times )
-        print("intensity_data = self.mtd_workflow.intensity_ratios")
-        print(intensity_data , self.mtd_workflow.intensity_ratios )
+        print("intensity history of", model.name, "with", len(time_steps), "points")
         print("============================================================================================")
-        #self.intensity_data = self.mtd_workflow.intensity_ratios
-        # Reshape the data for sklearn
-        X = np.array(time_steps).reshape(-1, 1)
-        y = np.array(intensity_data)
 
-        # Create and fit the model
-        model = LinearRegression()
-        model.fit(X, y)
-
-        # Get the slope (coefficient) and intercept
-        slope = model.coef_[0]
-        intercept = model.intercept_
-
-        print(f"Slope: {slope}, Intercept: {intercept}")
-
-    #    ax_intensity.plot(measure_times, intensity_ratios, '-o', label='Peak I/σ(I)')
-    #    ax_rsig.plot(measure_times, rsigs, '-o', label='Rsig')
-    #    ax_intensity.set_ylabel('Peak I/σ(I)')
-    #    ax_rsig.set_ylabel('Rsig')
-    #    ax_rsig.set_xlabel('Run time, seconds')
-    #    ax_intensity.grid(True)
-    # Add a dashed line with the slope and intercept
-        if self.prediction_model_type=='Linear Interpolation':
-            x_range = np.linspace(max(time_steps), max(time_steps)+2000, 100)
-            y_range = slope * x_range + intercept
-        if self.prediction_model_type=='Poisson Model':
-            x_range= np.linspace(max(time_steps), max(time_steps)+2000, 100)
-            y_range= np.zeros_like(x_range)+intensity_data[-1]
+        # Add a dashed line with the prediction
+        x_range = self.prediction_range(time_steps)
+        y_range = model.predict(x_range)
+        y_lower, y_upper = model.confidence_band(x_range, self.confidence_band_type)
         fig.add_trace(go.Scatter(x=x_range, y=y_range, mode='lines', name='Prediction Line', line=dict(dash='dash')))
-        fig.add_trace(go.Scatter(x=time_steps, y=intensity_data, mode='lines+markers', name='History Data'))
+        self.add_confidence_band(fig, x_range, y_lower, y_upper)
+        history_x, history_y = decimate(time_steps, intensity_data, self.plot_point_budget, self.intensity_time_range)
+        fig.add_trace(go.Scatter(x=history_x, y=history_y, mode='lines+markers', name='History Data'))
         #fig.add_trace(go.Scatter(x=self.time_steps, y=intensity_data, mode='lines+markers', name='History Data'))
         #fig.add_trace(go.Scatter(x=self.time_steps, y=self.intensity_data, mode='lines+markers', name='Intensity Data'))
-        fig.update_layout(title='Prediction of Intensity with '+self.prediction_model_type, xaxis_title='Time Steps (s)', yaxis_title='Intensity')
+        # uirevision keeps the user's zoom when the data is refreshed
+        fig.update_layout(title='Prediction of Intensity with '+self.prediction_model_type, xaxis_title='Time Steps (s)', yaxis_title='Intensity',
+            uirevision='intensity')
         #time.sleep(7)
         return fig
     def get_figure_uncertainty(self) -> go.Figure:
         #self.timestamp = time.time()
         fig = go.Figure()
 
-        if self.prediction_model_type=='Linear Interpolation':
-            time_steps=self.mtd_workflow.measure_times
-            uncertainty_data = self.mtd_workflow.rsigs
-        if self.prediction_model_type=='Poisson Model':
-            time_steps=self.mtd_workflow.timeseries_plt
-            uncertainty_data=self.mtd_workflow.temporal_poisson_uncertainty
-
         #self.time_steps=self.mtd_workflow.measure_times
         #self.uncertainty_data = self.mtd_workflow.rsigs
-        # Fit the data with 1/x
-        X = np.array(time_steps).reshape(-1, 1)
-        y = np.array(uncertainty_data)
+        model, time_steps, uncertainty_data = self.get_prediction_model('uncertainty')
 
-        # Transform X to 1/X
-        X_transformed = 1 / X**0.5
-
-        # Create and fit the model
-        model = LinearRegression()
-        model.fit(X_transformed, y)
-
-        # Get the slope (coefficient) and intercept
-        slope = model.coef_[0]
-        intercept = model.intercept_
-
-        print(f"Slope: {slope}, Intercept: {intercept}")
-
-        # Add a dashed line with the slope and intercept
-        x_range = np.linspace(max(time_steps), max(time_steps)+2000, 100)
-        y_range = slope * (1 / x_range) +0* intercept
+        # Add a dashed line with the prediction
+        x_range = self.prediction_range(time_steps)
+        y_range = model.predict(x_range)
+        y_lower, y_upper = model.confidence_band(x_range, self.confidence_band_type)
         fig.add_trace(go.Scatter(x=x_range, y=y_range, mode='lines', name='Fitted Line', line=dict(dash='dash')))
+        self.add_confidence_band(fig, x_range, y_lower, y_upper)
         print("============================================================================================")
-        print("time_steps = self.mtd_workflow.measure_times")
-        print(time_steps , self.mtd_workflow.measure_times )
-        print("uncertainty_data = self.mtd_workflow.rsigs")
-        print(uncertainty_data , self.mtd_workflow.rsigs )
+        print("uncertainty history of", model.name, "with", len(time_steps), "points")
         print("============================================================================================")
-        fig.add_trace(go.Scatter(x=time_steps, y=uncertainty_data, mode='lines+markers', name='Uncertainty Data'))
+        history_x, history_y = decimate(time_steps, uncertainty_data, self.plot_point_budget, self.uncertainty_time_range)
+        fig.add_trace(go.Scatter(x=history_x, y=history_y, mode='lines+markers', name='Uncertainty Data'))
         #fig.add_trace(go.Scatter(x=self.time_steps, y=self.uncertainty_data, mode='lines+markers', name='Uncertainty Data'))
-        fig.update_layout(title='Prediction of Uncertainty with '+self.prediction_model_type, xaxis_title='Time Steps (s)', yaxis_title='Uncertainty (%)')
+        fig.update_layout(title='Prediction of Uncertainty with '+self.prediction_model_type, xaxis_title='Time Steps (s)', yaxis_title='Uncertainty (%)',
+            uirevision='uncertainty')
         #fig.update_layout(title='Prediction of Uncertainty'+str(self.timestamp)+str(time.time()), xaxis_title='Time Steps', yaxis_title='Uncertainty')
         #time.sleep(7)
         return fig
 
+    def target_uncertainty(self) -> float:
+        """The target as an uncertainty in %, the quantity the prediction models extrapolate."""
+        if self.target_type == 'I/sigma':
+            return 100.0/self.target_value if self.target_value > 0 else 0.0
+        return self.target_value
+
+    def estimate_time_to_target(self) -> Dict[str, float]:
+        """Remaining beam time and proton charge until the target, from the uncertainty prediction."""
+        model, time_steps, uncertainty_data = self.get_prediction_model('uncertainty')
+        workflow = self.mtd_workflow
+        charge_rate = workflow.proton_charges[-1]/workflow.measure_times[-1] if workflow.measure_times and workflow.measure_times[-1] > 0 else 0.0
+        return estimate_time_to_target(model, time_steps, uncertainty_data, self.target_uncertainty(), charge_rate)
+
+    def apply_counting_target(self) -> None:
+        """Make this viewer's target the shared reduction's counting target, or clear it when stop at target is off."""
+        series = PREDICTION_MODELS[self.prediction_model_type].series
+        self.mtd_workflow.set_counting_target(self.target_uncertainty() if self.stop_at_target else None, series)
+
+    def update_time_to_target(self) -> Dict[str, Optional[float]]:
+        """Show the time-to-target estimate of this viewer's prediction model and target."""
+        estimate = self.estimate_time_to_target()
+        # infinite times (target out of reach) become None, which the view can show
+        self.time_to_target = {key: (float(value) if np.isfinite(value) else None) for key, value in estimate.items()}
+        target = '%s %g' % (self.target_type, self.target_value)
+        if self.mtd_workflow.orientation_converged():
+            self.time_to_target_text = '%s reached, counting stopped on this orientation' % target
+        elif estimate['reached']:
+            self.time_to_target_text = '%s reached' % target
+        elif not np.isfinite(estimate['remaining_time']):
+            self.time_to_target_text = '%s not reached within the prediction horizon of the %s' % (target, self.prediction_model_type)
+        else:
+            self.time_to_target_text = '%s in about %.0f s (%.0f s at 95%%), %.3g C of proton charge' % (
+                target, estimate['remaining_time'], estimate['remaining_time_95'], estimate['remaining_charge'])
+        print(self.time_to_target_text)
+        return self.time_to_target
+
+    def time_to_target_settings(self) -> tuple:
+        return (self.prediction_model_type, self.target_type, self.target_value, self.stop_at_target)
+
     def get_live_data(self) -> None:
         pass
         
@@ -1142,6 +1711,36 @@ class TemporalAnalysisModel(BaseModel):
         y_data = [i**2 for i in x_data]
         fig = make_subplots(rows=1, cols=2)
         return fig
+    def set_time_range(self, plot: str, relayout: Dict) -> bool:
+        """Follow a plotly relayout event of the intensity or uncertainty plot; returns True if the range changed."""
+        if relayout.get('xaxis.autorange'):
+            time_range = None
+        elif 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+            time_range = [float(relayout['xaxis.range[0]']), float(relayout['xaxis.range[1]'])]
+        elif 'xaxis.range' in relayout:
+            time_range = [float(t) for t in relayout['xaxis.range']]
+        else:
+            return False
+        field = plot + '_time_range'
+        if getattr(self, field) == time_range:
+            return False
+        setattr(self, field, time_range)
+        return True
+
+    def figure_settings(self) -> tuple:
+        """Everything besides the data that the figures depend on, used to memoize them."""
+        return (self.prediction_model_type, self.confidence_band_type, self.time_interval, self.plot_point_budget,
+            tuple(self.intensity_time_range or ()), tuple(self.uncertainty_time_range or ()))
+
+    def get_reduction_service(self) -> ReductionService:
+        """The instrument's shared live reduction; its workflow is built when the first viewer asks for it."""
+        return ReductionService.for_instrument(self.instrument, lambda: MantidWorkflow(self.time_interval))
+
+    @property
+    def mtd_workflow(self) -> MantidWorkflow:
+        """The workflow of the shared live reduction, the same for every viewer."""
+        return self.get_reduction_service().workflow
+
     def start_reading_live_mtd_data(self) -> None:
     #def start_reading_live_mtd_data(self) -> MantidWorkflow:
         
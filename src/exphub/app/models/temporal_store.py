@@ -0,0 +1,158 @@
+"""Dense per-peak time series of binned counts.
+
+Every time slice of the live run bins the events around the tracked peak into a
+small HKL box. TemporalCubeStore keeps these boxes as one (time x bins) array of
+counts and one of variances, with the stop time, proton charge and goniometer
+segment of each row. A row is one time bin, and the open bin grows in place
+(merge_last). The arrays start at one chunk and double their capacity when full,
+so the copies on growth cost a constant time per slice on average however long the
+run is. Readers get views, not copies. With a directory the arrays
+are memory-mapped .npy files. Unfilled rows keep a NaN time, so a restarted
+reduction reopens the files and continues after the last complete row.
+"""
+
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+CHUNK_ROWS = 256
+
+
+class TemporalCubeStore:
+    """Growable (time x bins) counts of one tracked peak, in memory or memory-mapped."""
+
+    def __init__(self, bin_shape: Sequence[int], path: Optional[str] = None, chunk_rows: int = CHUNK_ROWS) -> None:
+        self.bin_shape = tuple(int(n) for n in bin_shape)
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.size = 0
+        if path is not None and os.path.exists(self._file("times")):
+            self._open_existing()
+        else:
+            self._allocate(chunk_rows)
+
+    def _file(self, name: str) -> str:
+        return "%s_%s.npy" % (self.path, name)
+
+    def _new_array(self, name: str, shape: Tuple[int, ...], fill: float) -> np.ndarray:
+        if self.path is None:
+            return np.full(shape, fill)
+        array = np.lib.format.open_memmap(self._file(name) + ".tmp", mode="w+", dtype=float, shape=shape)
+        array[...] = fill
+        return array
+
+    def _allocate(self, capacity: int) -> None:
+        arrays = {
+            "counts": self._new_array("counts", (capacity,) + self.bin_shape, 0.0),
+            "variances": self._new_array("variances", (capacity,) + self.bin_shape, 0.0),
+            "times": self._new_array("times", (capacity,), np.nan),
+            "proton_charge": self._new_array("proton_charge", (capacity,), 0.0),
+            "segments": self._new_array("segments", (capacity,), -1.0),
+        }
+        for name, array in arrays.items():
+            if self.size:
+                array[: self.size] = getattr(self, name)[: self.size]
+            if isinstance(array, np.memmap):
+                array.flush()
+                del array
+                # the complete file replaces the old one, a crash never leaves a half-copied store
+                os.replace(self._file(name) + ".tmp", self._file(name))
+                array = np.load(self._file(name), mmap_mode="r+")
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def _open_existing(self) -> None:
+        self.counts = np.load(self._file("counts"), mmap_mode="r+")
+        self.variances = np.load(self._file("variances"), mmap_mode="r+")
+        self.times = np.load(self._file("times"), mmap_mode="r+")
+        self.proton_charge = np.load(self._file("proton_charge"), mmap_mode="r+")
+        self.segments = np.load(self._file("segments"), mmap_mode="r+")
+        if self.counts.shape[1:] != self.bin_shape:
+            raise ValueError("stored bins %s do not match %s" % (self.counts.shape[1:], self.bin_shape))
+        self.capacity = len(self.times)
+        filled = np.flatnonzero(np.isfinite(self.times))
+        self.size = int(filled[-1]) + 1 if len(filled) else 0
+        print("reopened time series store", self.path, "with", self.size, "slices")
+
+    def append(
+        self,
+        time: float,
+        counts: np.ndarray,
+        proton_charge: float = 0.0,
+        segment: int = 0,
+        variances: Optional[np.ndarray] = None,
+    ) -> None:
+        """Add the counts of the slice ending at time (seconds from run start); variances default to Poisson."""
+        if self.size == self.capacity:
+            # geometric growth: every row is copied a bounded number of times over the run
+            self._allocate(max(2 * self.capacity, self.chunk_rows))
+        row = self.size
+        self.counts[row] = counts
+        self.variances[row] = counts if variances is None else variances
+        self.proton_charge[row] = proton_charge
+        self.segments[row] = segment
+        # the time is written last: a row only counts once it is complete
+        self.times[row] = time
+        self.size += 1
+
+    def merge_last(
+        self, time: float, counts: np.ndarray, proton_charge: float = 0.0, variances: Optional[np.ndarray] = None
+    ) -> None:
+        """Add a slice to the last row, which then ends at time; sums keep counts and variances exact."""
+        if not self.size:
+            raise IndexError("no row to merge into")
+        row = self.size - 1
+        self.counts[row] += counts
+        self.variances[row] += counts if variances is None else variances
+        self.proton_charge[row] += proton_charge
+        self.times[row] = time
+
+    def flush(self) -> None:
+        if self.path is not None:
+            for array in (self.counts, self.variances, self.times, self.proton_charge, self.segments):
+                array.flush()
+
+    def __len__(self) -> int:
+        """Number of filled rows."""
+        return self.size
+
+    def view(self, name: str = "counts", start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Read-only view of the filled rows [start, stop) of counts, variances, times, proton_charge or segments."""
+        stop = self.size if stop is None else min(stop, self.size)
+        view = getattr(self, name)[start:stop].view()
+        view.flags.writeable = False
+        return view
+
+    def center_counts(self, name: str = "counts") -> np.ndarray:
+        """Counts (or variances) of the central bin of every row."""
+        center = tuple(n // 2 for n in self.bin_shape)
+        return self.view(name)[(slice(None),) + center]
+
+    def segment_index(self) -> np.ndarray:
+        """For every row, the index of the goniometer segment run it belongs to, counted from 0."""
+        segments = self.view("segments")
+        return np.cumsum(np.r_[True, segments[1:] != segments[:-1]]) - 1 if len(segments) else np.array([], int)
+
+    def cumulative_counts(self, name: str = "counts", center: bool = False) -> np.ndarray:
+        """Counts (or variances) summed since the start of each goniometer segment, of all bins or the central one."""
+        values = self.center_counts(name) if center else self.view(name)
+        cumulative = np.cumsum(values, axis=0)
+        segment_index = self.segment_index()
+        if not len(segment_index):
+            return cumulative
+        starts = np.flatnonzero(np.r_[True, np.diff(segment_index) > 0])
+        # the sum before each segment's first row is taken off all of its rows
+        before = np.concatenate((np.zeros((1,) + cumulative.shape[1:]), cumulative[starts[1:] - 1]))
+        return cumulative - before[segment_index]
+
+    def segment_elapsed(self) -> np.ndarray:
+        """Seconds from the start of each row's goniometer segment to the row's stop time."""
+        times = self.view("times")
+        segment_index = self.segment_index()
+        if not len(times):
+            return times.copy()
+        starts = np.flatnonzero(np.r_[True, np.diff(segment_index) > 0])
+        # a segment starts where the last row of the previous one stopped, the first at the run start
+        start_times = np.r_[0.0, times[starts[1:] - 1]]
+        return times - start_times[segment_index]
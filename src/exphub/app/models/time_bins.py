@@ -0,0 +1,57 @@
+"""Time bins that are fine at the start of a run and geometrically wider later.
+
+Uniform time_interval bins make the number of slices, and the work to compute them,
+grow linearly with the run. HierarchicalTimeBins keeps head_bins bins of
+time_interval at the start of the run, where I/σ changes fastest. After that, each
+bin is multiplier times wider than the one before, so a run of length T needs
+O(log T) bins. A bin is filled by the slices that fall into it, and merging slices is
+exact because counts and variances add. A multiplier of 1 gives the uniform bins.
+"""
+
+import bisect
+from typing import List, Tuple
+
+
+class HierarchicalTimeBins:
+    """Bin edges in seconds from run start, generated as far as they are needed."""
+
+    def __init__(self, time_interval: float, multiplier: float = 1.1, head_bins: int = 60) -> None:
+        try:
+            time_interval, multiplier = float(time_interval), float(multiplier)
+        except (TypeError, ValueError):
+            raise TypeError(
+                "time_interval and multiplier must be numbers, got %r and %r" % (time_interval, multiplier)
+            ) from None
+        if not time_interval > 0:
+            raise ValueError("time_interval must be positive, got %r" % time_interval)
+        self.time_interval = time_interval
+        self.multiplier = max(multiplier, 1.0)
+        self.head_bins = max(int(head_bins), 1)
+        self.edges: List[float] = [0.0]
+        self.width = self.time_interval
+
+    def _extend_to(self, time: float) -> None:
+        while self.edges[-1] <= time:
+            if len(self.edges) > self.head_bins:
+                self.width *= self.multiplier
+            self.edges.append(self.edges[-1] + self.width)
+
+    def bin_of(self, time: float) -> int:
+        """Index of the bin [edges[i], edges[i + 1]) holding time."""
+        self._extend_to(time)
+        return bisect.bisect_right(self.edges, time) - 1
+
+    def bounds(self, index: int) -> Tuple[float, float]:
+        while len(self.edges) <= index + 1:
+            self._extend_to(self.edges[-1])
+        return self.edges[index], self.edges[index + 1]
+
+    def split(self, start: float, stop: float) -> List[Tuple[int, float, float]]:
+        """Cut [start, stop) at the bin edges into (bin index, slice start, slice stop)."""
+        slices = []
+        while start < stop:
+            index = self.bin_of(start)
+            end = min(self.edges[index + 1], stop)
+            slices.append((index, start, end))
+            start = end
+        return slices
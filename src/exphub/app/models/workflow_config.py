@@ -0,0 +1,42 @@
+"""Per-experiment settings of a live or replayed reduction workflow."""
+
+from typing import Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class WorkflowConfig(BaseModel):
+    """Settings of one workflow, validated before a worker builds its MantidWorkflow from them."""
+
+    name: str = Field(default="live", title="Workflow Name")
+    instrument: str = Field(default="TOPAZ", title="Instrument")
+    ipts: int = Field(default=35036, title="IPTS")
+    output_path: Optional[str] = Field(default=None, title="Output Directory")
+    calib_fname: Optional[str] = Field(default=None, title="Calibration File")
+    ub_failsafe: Optional[str] = Field(default=None, title="Fallback UB File")
+    replay_file: Optional[str] = Field(default=None, title="Event File to Replay", description="Empty for live data")
+    replay_chunks: int = Field(default=10, title="Replay Chunks")
+    time_interval: float = Field(default=1.0, title="Time Interval")
+    time_bin_multiplier: float = Field(
+        default=1.1, title="Time Bin Growth", description="1 keeps every time bin time_interval long"
+    )
+    fast_update_interval: float = Field(default=3.0, title="Intensity Update Interval (s)")
+    slow_update_interval: float = Field(default=180.0, title="Orientation Update Interval (s)")
+    persist_time_series: bool = Field(default=False, title="Keep Time Series on Disk")
+    memory_limit_mb: Optional[int] = Field(default=None, title="Address Space Limit (MB)")
+    cpu_time_limit_s: Optional[int] = Field(default=None, title="CPU Time Limit (s)")
+    nice: int = Field(default=0, title="Niceness Increment")
+
+    @model_validator(mode="after")
+    def fill_ipts_paths(self) -> "WorkflowConfig":
+        if self.output_path is None:
+            self.output_path = "/SNS/{}/IPTS-{:d}/shared/autoreduce/live_data/".format(self.instrument, self.ipts)
+        if self.calib_fname is None:
+            self.calib_fname = "/SNS/{}/IPTS-{:d}/shared/calibration/TOPAZ_2025A_AG_3-3BN.DetCal".format(
+                self.instrument, self.ipts
+            )
+        return self
+
+    @property
+    def is_replay(self) -> bool:
+        return bool(self.replay_file)
@@ -0,0 +1,163 @@
+"""Run several independent reduction workflows as separate processes.
+
+Each worker process owns one MantidWorkflow (and therefore its own Mantid framework
+and ADS), built from a WorkflowConfig: a different IPTS, or a replayed event file
+instead of live data. The workers share one scheduler: reprocessing workers need a
+slot of a shared semaphore for every reduction cycle, while live workers never wait,
+so the beamline view is not delayed by reprocessing jobs. Each worker gets its own
+resource limits.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import multiprocessing.process
+import multiprocessing.queues
+import multiprocessing.synchronize
+import os
+import queue
+import resource
+from typing import Dict, List, Optional, Tuple
+
+from .workflow_config import WorkflowConfig
+
+logger = logging.getLogger(__name__)
+
+
+def apply_resource_limits(config: WorkflowConfig) -> None:
+    """Limit the calling process' address space and CPU time, and lower its priority."""
+    if config.memory_limit_mb:
+        limit = config.memory_limit_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if config.cpu_time_limit_s:
+        resource.setrlimit(resource.RLIMIT_CPU, (config.cpu_time_limit_s, config.cpu_time_limit_s))
+    if config.nice:
+        os.nice(config.nice)
+
+
+def run_workflow(
+    config_data: dict,
+    slots: multiprocessing.synchronize.BoundedSemaphore,
+    results: "multiprocessing.queues.Queue[Tuple[str, dict]]",
+    stop: multiprocessing.synchronize.Event,
+) -> None:
+    """Worker process: reduce one experiment until stopped, posting snapshots to results.
+
+    A failed cycle is logged with its traceback and ends the worker with a non-zero
+    exit code, which the supervisor reports through status().
+    """
+    # spawned workers do not inherit the parent's logging configuration
+    logging.basicConfig(level=logging.INFO, format="%(processName)s %(levelname)s %(message)s")
+    config = WorkflowConfig(**config_data)
+    apply_resource_limits(config)
+    # Mantid is only imported in the worker, each process gets its own framework
+    from .temporal_analysis import MantidWorkflow
+
+    workflow = MantidWorkflow(config.time_interval)
+    workflow.apply_config(config)
+    workflow.start_live_data_collection_instances()
+    while not stop.is_set():
+        if config.is_replay:
+            slots.acquire()
+        try:
+            if workflow.orientation_update_due():
+                workflow.update_orientation()
+            workflow.update_intensity()
+            results.put((config.name, workflow.snapshot()))
+        except Exception:
+            logger.exception("workflow %s failed", config.name)
+            raise
+        finally:
+            if config.is_replay:
+                slots.release()
+        stop.wait(config.fast_update_interval)
+
+
+class WorkflowSupervisor:
+    """Start, watch and stop workflow worker processes sharing a cycle scheduler."""
+
+    def __init__(self, max_concurrent_cycles: int = 2) -> None:
+        # Mantid's framework is not fork-safe, so workers start from a fresh interpreter
+        self.context = multiprocessing.get_context("spawn")
+        self.slots = self.context.BoundedSemaphore(max_concurrent_cycles)
+        self.results = self.context.Queue()
+        self.workers: Dict[str, Tuple[multiprocessing.process.BaseProcess, multiprocessing.synchronize.Event]] = {}
+
+    def submit(self, config: WorkflowConfig) -> None:
+        if config.name in self.workers and self.workers[config.name][0].is_alive():
+            raise ValueError("a workflow named %s is already running" % config.name)
+        stop = self.context.Event()
+        process = self.context.Process(
+            target=run_workflow,
+            args=(config.model_dump(), self.slots, self.results, stop),
+            name="workflow-%s" % config.name,
+            daemon=True,
+        )
+        process.start()
+        self.workers[config.name] = (process, stop)
+        logger.info(
+            "started workflow %s IPTS %s %s pid %s",
+            config.name,
+            config.ipts,
+            "replay" if config.is_replay else "live",
+            process.pid,
+        )
+
+    def stop(self, name: Optional[str] = None, timeout: float = 30.0) -> None:
+        """Ask one (or every) worker to finish its cycle and exit; terminate it after timeout."""
+        names = list(self.workers) if name is None else [name]
+        for worker in names:
+            self.workers[worker][1].set()
+        for worker in names:
+            process, _ = self.workers.pop(worker)
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def poll(self) -> List[Tuple[str, dict]]:
+        """Return the snapshots posted since the last poll, without blocking."""
+        snapshots = []
+        while True:
+            try:
+                snapshots.append(self.results.get_nowait())
+            except queue.Empty:
+                return snapshots
+
+    def status(self) -> Dict[str, Optional[int]]:
+        """Exit code of every worker, None while it runs."""
+        return {name: process.exitcode for name, (process, _) in self.workers.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run several CrystalPilot reduction workflows side by side.")
+    parser.add_argument("configs", help="JSON file with a list of workflow configurations")
+    parser.add_argument("--max-concurrent-cycles", type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(processName)s %(levelname)s %(message)s")
+    with open(args.configs) as config_file:
+        configs = [WorkflowConfig(**item) for item in json.load(config_file)]
+
+    supervisor = WorkflowSupervisor(args.max_concurrent_cycles)
+    for config in configs:
+        supervisor.submit(config)
+    failed = set()
+    try:
+        while any(code is None for code in supervisor.status().values()):
+            for name, code in supervisor.status().items():
+                if code and name not in failed:
+                    failed.add(name)
+                    logger.error("workflow %s exited with code %s", name, code)
+            try:
+                name, snapshot = supervisor.results.get(timeout=5)
+            except queue.Empty:
+                continue
+            if snapshot["intensity_ratios"]:
+                logger.info("%s run %s I/sig %s", name, snapshot["run"], snapshot["intensity_ratios"][-1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        failed.update(name for name, code in supervisor.status().items() if code)
+        supervisor.stop()
+    if failed:
+        raise SystemExit("workflows failed: %s" % ", ".join(sorted(failed)))
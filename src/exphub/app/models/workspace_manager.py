@@ -0,0 +1,97 @@
+"""Lifecycle and memory accounting for the workspaces the live workflow keeps in the ADS."""
+
+import os
+import resource
+import threading
+from typing import Any, Callable, Dict, Iterable, Set, Union
+
+
+def resident_memory() -> int:
+    """Current resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # no procfs: fall back to the lifetime peak, which getrusage reports in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkspaceLifecycleManager:
+    """Free intermediate workspaces after their last consumer and report memory per cycle.
+
+    Each produced workspace is registered with the stages that still have to read it.
+    Once every consumer has run, the workspace is deleted from the ADS. Persistent
+    workspaces (the live accumulator, the published peaks) are only measured.
+    """
+
+    def __init__(self, ads: Any, delete_workspace: Callable[[str], None]) -> None:
+        self.ads = ads
+        self.delete_workspace = delete_workspace
+        self.pending: Dict[str, Set[str]] = {}
+        self.persistent: Set[str] = set()
+        self.sizes: Dict[str, int] = {}
+        self.cycle_peak_rss = 0
+        self.lock = threading.RLock()
+
+    def workspace_bytes(self, name: str) -> int:
+        if not self.ads.doesExist(name):
+            return 0
+        return int(self.ads[name].getMemorySize())
+
+    def sample(self) -> None:
+        self.cycle_peak_rss = max(self.cycle_peak_rss, resident_memory())
+
+    def produced(self, name: str, consumers: Iterable[str] = (), persistent: bool = False) -> None:
+        """Register a workspace just written to the ADS and the stages that will read it."""
+        with self.lock:
+            self.sizes[name] = self.workspace_bytes(name)
+            if persistent:
+                self.persistent.add(name)
+            else:
+                self.pending[name] = set(consumers)
+            self.sample()
+
+    def consumed(self, name: str, stage: str) -> None:
+        """Mark that a stage has read a workspace; the last consumer frees it."""
+        with self.lock:
+            self.sample()
+            consumers = self.pending.get(name)
+            if consumers is None:
+                return
+            consumers.discard(stage)
+            if not consumers:
+                self.release(name)
+
+    def release(self, name: str) -> None:
+        with self.lock:
+            self.pending.pop(name, None)
+            self.sizes.pop(name, None)
+            if self.ads.doesExist(name):
+                self.delete_workspace(name)
+
+    def release_all(self, extra: Iterable[str] = ()) -> None:
+        """Free every tracked intermediate, plus the named workspaces (used on a run change)."""
+        with self.lock:
+            for name in list(self.pending) + list(extra):
+                self.release(name)
+
+    def report(self, cycle: str) -> Dict[str, Union[str, float]]:
+        """Print and return the tracked workspace sizes and the peak RSS since the last report."""
+        with self.lock:
+            self.sample()
+            for name in self.persistent:
+                self.sizes[name] = self.workspace_bytes(name)
+            tracked_mb = sum(self.sizes.values()) / 2**20
+            peak_rss_mb = self.cycle_peak_rss / 2**20
+            report: Dict[str, Union[str, float]] = {
+                "cycle": cycle,
+                "tracked_workspace_mb": tracked_mb,
+                "peak_rss_mb": peak_rss_mb,
+            }
+            print(
+                "memory after %s cycle: peak RSS %.1f MB, tracked workspaces %.1f MB" % (cycle, peak_rss_mb, tracked_mb)
+            )
+            for name, size in sorted(self.sizes.items(), key=lambda item: -item[1]):
+                print("    %-28s %10.1f MB" % (name, size / 2**20))
+            self.cycle_peak_rss = resident_memory()
+            return report
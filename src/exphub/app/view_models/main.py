@@ -10,6 +10,7 @@ from ..models.angle_plan import AnglePlanModel
 from ..models.experiment_info import ExperimentInfoModel
 from ..models.eic_control import EICControlModel
 from ..models.newtabtemplate import NewTabTemplateModel
+from ..models.reduction_service import ReductionService
 
 #from ..models.plotly import PlotlyConfig
 #from pyvista import Plotter  # just for typing
@@ -21,6 +22,8 @@ import asyncio
 #from ..models.css_status import CSSStatusModel
 #from ..models.temporal_analysis import TemporalAnalysisModel    
 
+# temporal analysis fields that define the counting target when counting stops at it
+COUNTING_TARGET_FIELDS = {"prediction_model_type", "target_type", "target_value"}
 
 
 class MainViewModel:
@@ -37,11 +40,11 @@ class MainViewModel:
         # and/or process errors.
         self.model_bind = binding.new_bind(self.model, callback_after_update=self.change_callback)
 
-        self.experimentinfo_bind = binding.new_bind(self.model.experimentinfo, callback_after_update=self.change_callback)
+        self.experimentinfo_bind = binding.new_bind(self.model.experimentinfo, callback_after_update=self.update_experimentinfo)
         self.angleplan_bind = binding.new_bind(self.model.angleplan, callback_after_update=self.change_callback)
         self.eiccontrol_bind = binding.new_bind(self.model.eiccontrol, callback_after_update=self.change_callback)
         #self.temporalanalysis_bind = binding.new_bind(self.model.temporalanalysis, callback_after_update=self.change_callback)
-        self.temporalanalysis_bind = binding.new_bind(self.model.temporalanalysis, callback_after_update=self.update_temporalanalysis_figure)
+        self.temporalanalysis_bind = binding.new_bind(self.model.temporalanalysis, callback_after_update=self.update_temporalanalysis)
 
         #self.cssstatus_bind = binding.new_bind(self.model.cssstatus, callback_after_update=self.change_callback)
         self.cssstatus_bind = binding.new_bind(self.model.cssstatus, callback_after_update=self.update_cssstatus_figure)
@@ -57,6 +60,13 @@ class MainViewModel:
                                                 callback_after_update=self.update_newtabtemplate_figure)
         self.newtabtemplate_updatefig_bind = binding.new_bind()
 ######################################################################################################################################################
+        self.reduction_subscription = None
+        # browser clients connected to this view model; the last one leaving unsubscribes it
+        self.connected_clients = 0
+        # (data version, figure settings) of the figures this viewer shows
+        self.temporalanalysis_figure_key = None
+        # (data version, prediction model and target) of the last time-to-target estimate
+        self.time_to_target_key = None
 
         #self.pyvista_config = PyVistaConfig()
 
@@ -79,6 +89,36 @@ class MainViewModel:
         else:
             print(f"model fields updated: {results['updated']}")
 
+    def update_experimentinfo(self, results: Dict[str, Any]) -> None:
+        self.change_callback(results)
+        if not results["error"]:
+            experimentinfo = self.model.experimentinfo
+            mtd_workflow = self.model.temporalanalysis.mtd_workflow
+            mtd_workflow.set_point_group(experimentinfo.pointGroup, experimentinfo.centering)
+            # only the stages reading a changed parameter rerun on the next cycle
+            mtd_workflow.set_prediction_limits(
+                experimentinfo.pred_minWavelength,
+                experimentinfo.pred_maxWavelength,
+                experimentinfo.pred_minDSpacing,
+                experimentinfo.pred_maxDSpacing,
+            )
+            mtd_workflow.set_integration_radii(
+                experimentinfo.peakRadius, experimentinfo.bkg_inner_radius, experimentinfo.bkg_outer_radius
+            )
+            mtd_workflow.set_modulation(
+                [
+                    [experimentinfo.mod_vec_1_dh, experimentinfo.mod_vec_1_dk, experimentinfo.mod_vec_1_dl],
+                    [experimentinfo.mod_vec_2_dh, experimentinfo.mod_vec_2_dk, experimentinfo.mod_vec_2_dl],
+                    [experimentinfo.mod_vec_3_dh, experimentinfo.mod_vec_3_dk, experimentinfo.mod_vec_3_dl],
+                ],
+                experimentinfo.max_order,
+                bool(experimentinfo.cross_terms),
+                experimentinfo.sat_peak_radius,
+                experimentinfo.sat_peak_region_radius,
+                experimentinfo.sat_peak_inner_radius,
+                experimentinfo.sat_peak_outer_radius,
+            )
+
     def update_view(self) -> None:
         #self.model_bind.update_in_view(self.model)
         self.model.angleplan.load_ap(self.model.angleplan.plan_file)
@@ -123,40 +163,95 @@ class MainViewModel:
 
 
  
+    def update_temporalanalysis(self, results: Dict[str, Any]) -> None:
+        self.change_callback(results)
+        if not results["error"]:
+            # the counting target is one setting of the shared reduction: it changes only when this viewer
+            # edits it, never on a refresh, so a second viewer does not reset it
+            updated = {name.split(".")[-1] for name in results["updated"]}
+            temporalanalysis = self.model.temporalanalysis
+            if "stop_at_target" in updated or (temporalanalysis.stop_at_target and updated & COUNTING_TARGET_FIELDS):
+                temporalanalysis.apply_counting_target()
+        self.update_temporalanalysis_figure()
+
     def update_temporalanalysis_figure(self, _: Any = None) -> None:
-        self.temporalanalysis_bind.update_in_view(self.model.temporalanalysis)
+        temporalanalysis = self.model.temporalanalysis
+        self.sync_update_intervals()
+        reduction_service = temporalanalysis.get_reduction_service()
+        self.update_time_to_target(reduction_service.version)
+        self.temporalanalysis_bind.update_in_view(temporalanalysis)
         #self.temporalanalysis_updatefig_bind.update_in_view(self.model.temporalanalysis.get_figure_intensity(),self.model.temporalanalysis.get_figure_uncertainty())
-        self.temporalanalysis_updatefigure_intensity_bind.update_in_view(self.model.temporalanalysis.get_figure_intensity())
-        self.temporalanalysis_updatefigure_uncertainty_bind.update_in_view(self.model.temporalanalysis.get_figure_uncertainty())
+        # figures are built once per data version and settings, whatever the number of viewers,
+        # and not pushed again to a viewer that already shows them
+        figure_key = (reduction_service.version,) + temporalanalysis.figure_settings()
+        if figure_key == self.temporalanalysis_figure_key:
+            return
+        self.temporalanalysis_updatefigure_intensity_bind.update_in_view(
+            reduction_service.cached(("intensity",) + figure_key[1:], temporalanalysis.get_figure_intensity)
+        )
+        self.temporalanalysis_updatefigure_uncertainty_bind.update_in_view(
+            reduction_service.cached(("uncertainty",) + figure_key[1:], temporalanalysis.get_figure_uncertainty)
+        )
+        self.temporalanalysis_figure_key = figure_key
         #time.sleep(7)
 
+    def update_time_to_target(self, version: int) -> None:
+        """Re-estimate the time to the counting target when the data or the target changed, and share it with the angle plan."""
+        temporalanalysis = self.model.temporalanalysis
+        key = (version,) + temporalanalysis.time_to_target_settings()
+        if key == self.time_to_target_key:
+            return
+        self.model.angleplan.set_time_to_target(temporalanalysis.update_time_to_target())
+        self.angleplan_bind.update_in_view(self.model.angleplan)
+        self.time_to_target_key = key
+
     async def auto_update_temporalanalysis_figure(self) -> None:
         while True:
             self.update_temporalanalysis_figure()
             await asyncio.sleep(1)
 
     def create_auto_update_temporalanalysis_figure(self) -> None:
-        self.model.temporalanalysis.start_reading_live_mtd_data()
-        asyncio.create_task(self.get_live_mtd_data()) 
-        #asyncio.create_task(self.auto_update_temporalanalysis_figure()) 
-
-
-    async def get_live_mtd_data(self) -> None:
-        while True:
-            print("============================================================================================")
-            print("get_live_mtd_data")
-            try:
-                self.model.temporalanalysis.mtd_workflow.live_data_reduction()
-                print("get_live_mtd_data done")
-                print("============================================================================================")
-                self.update_temporalanalysis_figure()
-                print("=====================update temporal done=======================================================================")
-            except Exception as e:
-                print(e)
+        # one reduction per instrument: later clicks (or other viewers) only subscribe to it
+        reduction_service = self.model.temporalanalysis.get_reduction_service()
+        if self.reduction_subscription is None:
+            self.reduction_subscription = reduction_service.subscribe(
+                self.on_reduction_snapshot, asyncio.get_event_loop()
+            )
+        self.sync_update_intervals()
+        if not reduction_service.start():
+            print("live reduction already running, subscribed to its updates")
+
+    def on_client_connected(self, **_: Any) -> None:
+        self.connected_clients += 1
+
+    def on_client_exited(self, **_: Any) -> None:
+        """Stop receiving snapshots once no browser shows this view model any more."""
+        self.connected_clients = max(self.connected_clients - 1, 0)
+        if self.connected_clients == 0:
+            self.unsubscribe_reduction()
+
+    def on_server_exited(self, **_: Any) -> None:
+        self.unsubscribe_reduction()
+        ReductionService.stop_all()
+
+    def unsubscribe_reduction(self) -> None:
+        if self.reduction_subscription is not None:
+            self.model.temporalanalysis.get_reduction_service().unsubscribe(self.reduction_subscription)
+            self.reduction_subscription = None
+
+    def zoom_temporalanalysis_figure(self, plot: str, relayout: Dict[str, Any]) -> None:
+        """Rebuild a plot's history at full resolution inside the range the user zoomed to."""
+        if self.model.temporalanalysis.set_time_range(plot, relayout):
             self.update_temporalanalysis_figure()
-            await asyncio.sleep(10)
-        
 
+    def sync_update_intervals(self) -> None:
+        mtd_workflow = self.model.temporalanalysis.mtd_workflow
+        mtd_workflow.fast_update_interval = self.model.temporalanalysis.fast_update_interval
+        mtd_workflow.slow_update_interval = self.model.temporalanalysis.slow_update_interval
+
+    def on_reduction_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Called on this viewer's event loop after every intensity cycle of the shared reduction."""
+        self.update_temporalanalysis_figure()
 
     def update_newtabtemplate_figure(self, _: Any = None) -> None:
         self.newtabtemplate_bind.update_in_view(self.model.newtabtemplate)
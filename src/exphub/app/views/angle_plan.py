@@ -118,6 +118,7 @@ class AnglePlanView:
 
 
         with GridLayout(columns=1):
+            vuetify.VCardText("{{ model_angleplan.time_to_target_text }}", v_if="model_angleplan.time_to_target_text")
             vuetify.VBanner(
                     v_if="model_eiccontrol.eic_submission_success",
                     text="Submission Successful.",
@@ -0,0 +1,119 @@
+"""Plotly figure that is sent to the browser as deltas.
+
+A full figure update sends every point of every trace over the websocket, so the
+cost of a refresh grows with the length of the history. IncrementalFigure remembers
+what the browser already has. Traces whose old points are unchanged are extended
+with their new points only. Traces that changed are replaced: the prediction line
+and its band, and any history whose earlier points moved, for example when
+decimation picks other points or the open time bin is rewritten. The whole figure
+is only sent again when the layout or the number of traces changes. The browser
+applies a delta by rebuilding the figure data from the arrays it already holds, so
+Plotly.react redraws without a full download.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import plotly.graph_objects as go
+from trame.widgets import client, plotly
+
+# the point arrays of a trace; everything else is its style
+POINTS = ("x", "y")
+
+
+def _style(trace: Dict[str, Any]) -> str:
+    return json.dumps({key: value for key, value in trace.items() if key not in POINTS}, sort_keys=True, default=str)
+
+
+def _serialize(figure: go.Figure) -> Dict[str, Any]:
+    """Serialized figure with the points of its traces as plain lists.
+
+    Plotly serializes numpy arrays as base64 typed arrays, which the browser cannot extend
+    with concat, so the points are sent as lists whatever the figure was built from.
+    """
+    data = plotly.Figure.to_data(figure)
+    for trace, source in zip(data["data"], figure.data, strict=True):
+        for key in POINTS:
+            if source[key] is not None:
+                trace[key] = np.asarray(source[key]).tolist()
+    return data
+
+
+def _points(trace: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    return {key: np.asarray(trace[key]) for key in POINTS if key in trace}
+
+
+class IncrementalFigure:
+    """A trame plotly.Figure plus the client trigger that applies extend/replace deltas to it."""
+
+    def __init__(self, name: str, **kwargs: Any) -> None:
+        self.key = "%s_figure" % name
+        self.figure = plotly.Figure(state_variable_name=self.key, **kwargs)
+        # the browser rebuilds its own copy; nothing is sent back to the server
+        self.figure.state.client_only(self.key)
+        self.triggers = client.ClientTriggers(
+            ref="%s_triggers" % name,
+            delta=(
+                "{0} = {{layout: {0}.layout, data: {0}.data.map((trace, i) => $event.replace[i] || "
+                "($event.extend[i] ? {{...trace, ...Object.fromEntries(Object.entries($event.extend[i]).map("
+                "([key, points]) => [key, Array.from(trace[key]).concat(points)]))}} : trace))}}"
+            ).format(self.key),
+        )
+        self.layout: Optional[str] = None
+        # style and points of every trace the browser holds
+        self.traces: List[Dict[str, Any]] = []
+
+    def update(self, figure: go.Figure) -> int:
+        """Bring the browser's figure up to date; returns the number of points sent."""
+        data = _serialize(figure)
+        layout = json.dumps(data["layout"], sort_keys=True, default=str)
+        traces = data["data"]
+        if layout != self.layout or len(traces) != len(self.traces):
+            return self.replace_all(data, layout)
+
+        extend: Dict[str, Dict[str, list]] = {}
+        replace: Dict[str, Dict[str, Any]] = {}
+        points = 0
+        for i, trace in enumerate(traces):
+            sent, current = self.traces[i], self._sent(trace)
+            unchanged_prefix = (
+                sent["style"] == current["style"]
+                and sent["points"].keys() == current["points"].keys()
+                and all(
+                    len(sent["points"][key]) <= len(values)
+                    and np.array_equal(values[: len(sent["points"][key])], sent["points"][key])
+                    for key, values in current["points"].items()
+                )
+            )
+            if unchanged_prefix:
+                new = {key: trace[key][len(sent["points"][key]) :] for key in current["points"]}
+                if any(new.values()):
+                    extend[str(i)] = new
+                    points += max(len(values) for values in new.values())
+            else:
+                replace[str(i)] = trace
+                points += self._length(trace)
+            self.traces[i] = current
+
+        if extend or replace:
+            self.figure.state.flush()
+            self.triggers.call("delta", {"extend": extend, "replace": replace})
+        return points
+
+    def replace_all(self, data: Dict[str, Any], layout: str) -> int:
+        self.figure.state[self.key] = data
+        # the browser's copy may differ from the last value pushed by the server
+        self.figure.state.dirty(self.key)
+        self.figure.state.flush()
+        self.layout = layout
+        self.traces = [self._sent(trace) for trace in data["data"]]
+        return sum(self._length(trace) for trace in data["data"])
+
+    @staticmethod
+    def _length(trace: Dict[str, Any]) -> int:
+        return max((len(trace[key]) for key in POINTS if key in trace), default=0)
+
+    @staticmethod
+    def _sent(trace: Dict[str, Any]) -> Dict[str, Any]:
+        return {"style": _style(trace), "points": _points(trace)}
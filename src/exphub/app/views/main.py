@@ -25,6 +25,10 @@ class MainApp(ThemedApp):
         self.server.state.trame__title = "CrystalPilot"
         self.view_models = create_viewmodels(binding)
         self.view_model: MainViewModel = self.view_models["main"]
+        # the shared reduction drops this viewer when its browsers leave, and stops with the server
+        self.server.controller.on_client_connected.add(self.view_model.on_client_connected)
+        self.server.controller.on_client_exited.add(self.view_model.on_client_exited)
+        self.server.controller.on_server_exited.add(self.view_model.on_server_exited)
         self.create_ui()
 
     def create_ui(self) -> None:
@@ -12,6 +12,8 @@ from trame.widgets import html
 from trame.widgets import plotly
 import hashlib
 
+from .incremental_figure import IncrementalFigure
+
 def temporal_data_analysis():
     # Dummy data generation for the plot
     x_data = list(range(10))
@@ -33,8 +35,9 @@ class TemporalAnalysisView:
         #with vuetify.VContainer(fluid=True, classes="pa-5"):
         #        vuetify.VCardTitle("Temporal Analysis"),
         #        vuetify.VCardText("Content for Temporal Analysis tab goes here."),
-        with GridLayout(columns=1, classes="mb-2"):
+        with GridLayout(columns=2, classes="mb-2"):
             InputField(v_model="model_temporalanalysis.prediction_model_type", items="model_temporalanalysis.prediction_model_type_options", type="select")
+            InputField(v_model="model_temporalanalysis.confidence_band_type", items="model_temporalanalysis.confidence_band_type_options", type="select")
         #with GridLayout(columns=4, classes="mb-2"):
             #InputField(v_model="model_cssstatus.plot_type", items="model_cssstatus.plot_type_options", type="select")
             #InputField(v_model="model_cssstatus.x_axis", items="model_cssstatus.axis_options", type="select")
@@ -49,22 +52,38 @@ class TemporalAnalysisView:
             InputField(
                 v_model="model_temporalanalysis.time_interval",
             )
+        with GridLayout(columns=2):
+            InputField(v_model="model_temporalanalysis.fast_update_interval")
+            InputField(v_model="model_temporalanalysis.slow_update_interval")
+        with GridLayout(columns=1):
+            InputField(v_model="model_temporalanalysis.plot_point_budget")
+        with GridLayout(columns=3):
+            InputField(v_model="model_temporalanalysis.target_type", items="model_temporalanalysis.target_type_options", type="select")
+            InputField(v_model="model_temporalanalysis.target_value")
+            InputField(v_model="model_temporalanalysis.stop_at_target", type="checkbox")
+        vuetify.VCardText("{{ model_temporalanalysis.time_to_target_text }}")
         with GridLayout(columns=2, classes="mb-2"):
             with HBoxLayout(halign="center", height="50vh"):
                 vuetify.VCardTitle("Prediction of Intensity"),
-                self.figure_intensity = plotly.Figure()
+                # history points are appended in the browser, only the prediction is replaced
+                self.figure_intensity = IncrementalFigure(
+                    "temporal_intensity",
+                    relayout=(self.view_model.zoom_temporalanalysis_figure, "['intensity', $event]"),
+                )
             with HBoxLayout(halign="center", height="50vh"):
                 vuetify.VCardTitle("Prediction of Uncertainty"),
-                self.figure_uncertainty = plotly.Figure()
+                self.figure_uncertainty = IncrementalFigure(
+                    "temporal_uncertainty",
+                    relayout=(self.view_model.zoom_temporalanalysis_figure, "['uncertainty', $event]"),
+                )
             
         vuetify.VBtn("Auto Update", click=self.view_model.create_auto_update_temporalanalysis_figure)
 
 
     def update_figure_intensity(self, figure_intensity: go.Figure) -> None:
-        self.figure_intensity.update(figure_intensity)
-        self.figure_intensity.state.flush()
+        points = self.figure_intensity.update(figure_intensity)
         print("============================================================================================")
-        print("update_figure_intensity")
+        print("update_figure_intensity,", points, "points sent")
         print("============================================================================================")
         #print("Currently plotted data:", self.figure_intensity.data)
         #print("Currently plotted data:", self.figure_intensity.layout)
@@ -78,10 +97,9 @@ class TemporalAnalysisView:
         #print(er, "update_figure")
         #self.figure.state.flush()  # 
     def update_figure_uncertainty(self,figure_uncertainty:go.Figure) -> None:
-        self.figure_uncertainty.update(figure_uncertainty)
-        self.figure_uncertainty.state.flush()
+        points = self.figure_uncertainty.update(figure_uncertainty)
         print("============================================================================================")
-        print("update_figure_uncertainty")
+        print("update_figure_uncertainty,", points, "points sent")
         print("============================================================================================")
         #print("Currently plotted data:", self.figure.data)
         #print("Currently plotted data:", self.figure.layout)
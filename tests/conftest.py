@@ -0,0 +1,87 @@
+"""Shared fixtures: a fake Mantid, so the workflow modules are tested without a Mantid install."""
+
+import sys
+import types
+from typing import Any, Callable, Iterator, List, Tuple
+
+import pytest
+
+# modules that bind Mantid names at import; they are imported again against the fake
+MANTID_MODULES = ("exphub.app.models.temporal_analysis", "exphub.app.models.run_transition")
+
+
+class FakeADS(dict):
+    """Analysis data service: workspaces by name."""
+
+    def doesExist(self, name: str) -> bool:  # noqa: N802
+        return name in self
+
+
+class FakeV3D(tuple):
+    """Mantid's V3D as a plain (x, y, z) tuple."""
+
+    def __new__(cls, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> "FakeV3D":
+        return super().__new__(cls, (x, y, z))
+
+
+class FakeObserver:
+    """AnalysisDataServiceObserver without the ADS: handles are called by the test."""
+
+    def observeAdd(self, on: bool) -> None:  # noqa: N802
+        self.observing_add = on
+
+    def observeReplace(self, on: bool) -> None:  # noqa: N802
+        self.observing_replace = on
+
+    def observeRename(self, on: bool) -> None:  # noqa: N802
+        self.observing_rename = on
+
+    def observeAll(self, on: bool) -> None:  # noqa: N802
+        self.observing_add = self.observing_replace = self.observing_rename = on
+
+
+class FakeSimpleAPI(types.ModuleType):
+    """mantid.simpleapi whose algorithms only record (name, properties) in calls."""
+
+    def __init__(self) -> None:
+        super().__init__("mantid.simpleapi")
+        self.mtd = FakeADS()
+        self.calls: List[Tuple[str, dict]] = []
+
+    def DeleteWorkspace(self, name: str) -> None:  # noqa: N802
+        self.calls.append(("DeleteWorkspace", {"Workspace": name}))
+        self.mtd.pop(name, None)
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        """Any other algorithm: a recorder of its properties."""
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def algorithm(**properties: Any) -> None:
+            self.calls.append((name, properties))
+
+        return algorithm
+
+    def called(self, name: str) -> List[dict]:
+        """Properties of every call of one algorithm."""
+        return [properties for algorithm, properties in self.calls if algorithm == name]
+
+
+@pytest.fixture
+def fake_mantid(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeSimpleAPI]:
+    simpleapi = FakeSimpleAPI()
+    api = types.ModuleType("mantid.api")
+    api.AnalysisDataServiceObserver = FakeObserver  # type: ignore[attr-defined]
+    api.AlgorithmManager = types.SimpleNamespace(runningInstancesOf=lambda name: [])  # type: ignore[attr-defined]
+    kernel = types.ModuleType("mantid.kernel")
+    kernel.V3D = FakeV3D  # type: ignore[attr-defined]
+    mantid = types.ModuleType("mantid")
+    for name, module in (("simpleapi", simpleapi), ("api", api), ("kernel", kernel)):
+        setattr(mantid, name, module)
+        monkeypatch.setitem(sys.modules, "mantid." + name, module)
+    monkeypatch.setitem(sys.modules, "mantid", mantid)
+    for name in MANTID_MODULES:
+        # restored (or removed) after the test, so no module keeps the fake
+        monkeypatch.setitem(sys.modules, name, None)
+        del sys.modules[name]
+    yield simpleapi
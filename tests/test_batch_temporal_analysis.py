@@ -0,0 +1,11 @@
+"""Test package for the offline temporal analysis time steps."""
+
+import numpy as np
+
+from exphub.app.models.batch_temporal_analysis import time_edges
+
+
+def test_linear_and_log_time_edges_end_at_the_run_duration() -> None:
+    assert np.allclose(time_edges(10.5, 2.0), [2, 4, 6, 8, 10, 10.5])
+    assert np.allclose(time_edges(100.0, 1.0, multiplier=10.0), [1, 10, 100])
+    assert np.allclose(time_edges(0.5, 1.0), [0.5])
@@ -0,0 +1,92 @@
+"""Test package for the incremental proton charge and monitor accounting."""
+
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from exphub.app.models.beam_accounting import BeamAccounting
+
+PULSE = 100_000_000
+# 1e10 pC, 0.01 C per pulse
+PULSE_CHARGE = 1e10
+
+
+class FakeTime:
+    """Mantid DateAndTime in ns."""
+
+    def __init__(self, ns: int) -> None:
+        self.ns = ns
+
+    def totalNanoseconds(self) -> int:  # noqa: N802
+        return self.ns
+
+
+class FakeLog:
+    """proton_charge log of equal pulses at the given times in ns."""
+
+    def __init__(self, times: Iterable[int]) -> None:
+        self.times = list(times)
+
+    def size(self) -> int:
+        return len(self.times)
+
+    def nthValue(self, i: int) -> float:  # noqa: N802
+        return PULSE_CHARGE
+
+    def nthTime(self, i: int) -> FakeTime:  # noqa: N802
+        return FakeTime(self.times[i])
+
+
+class FakeRun:
+    """A run started at 0 with a proton_charge log of equal pulses at the given times in ns."""
+
+    def __init__(self, times: Iterable[int]) -> None:
+        self.log = FakeLog(times)
+
+    def hasProperty(self, name: str) -> bool:  # noqa: N802
+        return name == "proton_charge"
+
+    def getProperty(self, name: str) -> FakeLog:  # noqa: N802
+        return self.log
+
+    def startTime(self) -> FakeTime:  # noqa: N802
+        return FakeTime(0)
+
+
+class FakeMonitor:
+    """Monitor workspace with one spectrum of counts over 0-2000 us."""
+
+    def __init__(self, counts: Sequence[float]) -> None:
+        self.counts = np.asarray(counts, dtype=float)
+
+    def readX(self, index: int) -> np.ndarray:  # noqa: N802
+        return np.linspace(0.0, 2000.0, len(self.counts) + 1)
+
+    def readY(self, index: int) -> np.ndarray:  # noqa: N802
+        return self.counts
+
+
+def test_charge_accounting_across_a_beam_pause() -> None:
+    accounting = BeamAccounting(400.0, 1600.0)
+    # 10 s of beam at 10 Hz, then a 20 s pause without pulses, then 10 s of beam again
+    before_pause = [k * PULSE for k in range(1, 101)]
+    after_pause = [k * PULSE for k in range(301, 401)]
+
+    assert np.isclose(accounting.update_proton_charge(FakeRun(before_pause)), 1.0)
+    assert accounting.update_monitor(FakeMonitor([5, 1, 1, 1, 5])) == (3.0, 3.0)
+    assert np.isclose(accounting.record_interval(10.0)[2], 1.0)
+
+    # during the pause the log has no new pulses, so no charge or monitor counts are added
+    assert np.isclose(accounting.update_proton_charge(FakeRun(before_pause)), 1.0)
+    assert accounting.update_monitor(FakeMonitor([9, 1, 1, 1, 9])) == (3.0, 0.0)
+    assert accounting.record_interval(30.0)[1:] == (0.0, 0.0)
+
+    # the listener trimmed the start of the log; only the new pulses are read
+    trimmed = before_pause[50:] + after_pause
+    assert np.isclose(accounting.update_proton_charge(FakeRun(trimmed)), 2.0)
+    assert accounting.num_pulses == 200
+    assert np.isclose(accounting.record_interval(40.0)[2], 1.0)
+
+    assert accounting.charge_between(10.05, 30.05) == 0.0
+    assert np.isclose(accounting.charge_between(5.05, 35.05), 1.0)
+    assert [interval[0] for interval in accounting.intervals] == [10.0, 30.0, 40.0]
@@ -0,0 +1,64 @@
+"""Test package for the cancellation of live reduction cycles."""
+
+import sys
+import types
+from typing import List
+
+import pytest
+
+from exphub.app.models.cancellation import CancelToken, CycleCancelledError, cancel_running_algorithms
+from exphub.app.models.reduction_graph import ReductionGraph
+
+
+class FakeAlgorithm:
+    """A running algorithm with its input and output properties."""
+
+    def __init__(self, **properties: str) -> None:
+        self.properties = properties
+        self.cancelled = False
+
+    def getPropertyValue(self, name: str) -> str:  # noqa: N802
+        if name not in self.properties:
+            raise RuntimeError("Unknown property search object " + name)
+        return self.properties[name]
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+def test_a_cycle_cancelled_mid_way_stops_at_the_next_stage() -> None:
+    calls: List[str] = []
+    token = CancelToken()
+
+    def integrate() -> None:
+        calls.append("integration")
+        # a parameter change arrives while integration runs
+        token.cancel("radii changed")
+
+    graph = ReductionGraph()
+    graph.add_stage("load_config", ("events",), lambda: calls.append("load_config"))
+    graph.add_stage("integration", ("load_config",), integrate)
+    graph.add_stage("statistics", ("integration",), lambda: calls.append("statistics"))
+    graph.set_input("events", 1)
+
+    with pytest.raises(CycleCancelledError, match="radii changed"):
+        graph.run(token=token)
+    assert calls == ["load_config", "integration"] and token.cancelled
+    # the stage that never ran stays dirty and runs in the next cycle with a fresh token
+    assert graph.run(token=CancelToken()) == ["statistics"]
+
+
+def test_only_the_algorithms_of_the_cycle_are_cancelled(monkeypatch: pytest.MonkeyPatch) -> None:
+    integrate = FakeAlgorithm(InputWorkspace="live_event_ws_peak", PeaksWorkspace="live_predict_peaks_ws")
+    other_path = FakeAlgorithm(InputWorkspace="live_event_ws_ub", OutputWorkspace="peak_search_chunk_ws")
+    binning = FakeAlgorithm(InputWorkspace="timestep_event_ws_md", OutputWorkspace="timestep_HKL_ws")
+    running = {"IntegrateEllipsoids": [integrate], "FilterByTime": [other_path], "BinMD": [binning]}
+
+    api = types.ModuleType("mantid.api")
+    manager = types.SimpleNamespace(runningInstancesOf=lambda name: running.get(name, []))
+    monkeypatch.setattr(api, "AlgorithmManager", manager, raising=False)
+    monkeypatch.setitem(sys.modules, "mantid", types.ModuleType("mantid"))
+    monkeypatch.setitem(sys.modules, "mantid.api", api)
+
+    assert cancel_running_algorithms(["live_event_ws_peak", "timestep_HKL_ws"]) == 2
+    assert integrate.cancelled and binning.cancelled and not other_path.cancelled
@@ -0,0 +1,23 @@
+"""Test package for the plot decimation."""
+
+import numpy as np
+
+from exphub.app.models.decimation import decimate
+
+
+def test_decimation_keeps_extremes_and_refines_on_zoom() -> None:
+    x = np.arange(100000, dtype=float)
+    y = np.sin(x / 500.0)
+    y[12345] = 10.0
+    y[54321] = -10.0
+
+    dx, dy = decimate(x, y, 1000)
+    assert len(dx) <= 1002
+    assert dy.max() == 10.0 and dy.min() == -10.0
+    assert dx[0] == 0 and dx[-1] == x[-1]
+
+    zx, zy = decimate(x, y, 1000, x_range=[1000.0, 1500.0])
+    assert np.array_equal(zx, x[999:1502])
+
+    short_x, short_y = decimate([0.0, 1.0], [2.0, 3.0], 1000)
+    assert list(short_y) == [2.0, 3.0]
@@ -0,0 +1,76 @@
+"""Test package for the goniometer orientation segments."""
+
+from typing import Dict, List, Tuple
+
+from exphub.app.models.goniometer_tracker import GoniometerTracker
+
+SECOND = 1_000_000_000
+
+
+class FakeTime:
+    """Mantid DateAndTime in ns."""
+
+    def __init__(self, ns: int) -> None:
+        self.ns = ns
+
+    def totalNanoseconds(self) -> int:  # noqa: N802
+        return self.ns
+
+
+class FakeLog:
+    """Time series log of (time in ns, value) entries."""
+
+    def __init__(self, entries: List[Tuple[int, float]]) -> None:
+        self.entries = entries
+
+    def size(self) -> int:
+        return len(self.entries)
+
+    def nthValue(self, i: int) -> float:  # noqa: N802
+        return self.entries[i][1]
+
+    def nthTime(self, i: int) -> FakeTime:  # noqa: N802
+        return FakeTime(self.entries[i][0])
+
+
+class FakeRun:
+    """A run with omega/chi/phi logs of (time in s, angle) entries, started at 0 and ending at end s."""
+
+    def __init__(self, logs: Dict[str, List[Tuple[float, float]]], end: float) -> None:
+        self.logs = {
+            name: FakeLog([(int(t * SECOND), angle) for t, angle in entries]) for name, entries in logs.items()
+        }
+        self.end = end
+
+    def hasProperty(self, name: str) -> bool:  # noqa: N802
+        return name in self.logs
+
+    def getProperty(self, name: str) -> FakeLog:  # noqa: N802
+        return self.logs[name]
+
+    def startTime(self) -> FakeTime:  # noqa: N802
+        return FakeTime(0)
+
+    def endTime(self) -> FakeTime:  # noqa: N802
+        return FakeTime(int(self.end * SECOND))
+
+
+def test_a_move_starts_a_segment_and_no_move_does_not() -> None:
+    tracker = GoniometerTracker()
+    logs = {"omega": [(0.0, 10.0)], "chi": [(0.0, 45.0)], "phi": [(0.0, 0.0)]}
+    assert not tracker.update(FakeRun(logs, end=50.0))
+    assert not tracker.update(FakeRun(logs, end=80.0))
+    assert tracker.segment == 0
+
+    logs["phi"].append((120.0, 30.0))
+    assert tracker.update(FakeRun(logs, end=150.0))
+    assert tracker.segment == 1 and abs(tracker.segment_starts[1] - 120.0) < 1e-9
+    assert tracker.segment_of(119.0) == 0 and tracker.segment_of(121.0) == 1
+
+
+def test_a_missing_log_starts_a_segment_at_the_end_of_the_data() -> None:
+    tracker = GoniometerTracker()
+    tracker.update(FakeRun({"omega": [(0.0, 10.0)], "chi": [(0.0, 45.0)], "phi": [(0.0, 0.0)]}, end=50.0))
+    # the phi log is gone: the only changed axis has no time
+    assert tracker.update(FakeRun({"omega": [(0.0, 10.0)], "chi": [(0.0, 45.0)]}, end=90.0))
+    assert tracker.angles == (10.0, 45.0, None) and abs(tracker.segment_starts[-1] - 90.0) < 1e-9
@@ -0,0 +1,56 @@
+"""Test package for the delta-updated plotly figure."""
+
+import numpy as np
+import plotly.graph_objects as go
+from numpy.typing import ArrayLike
+from trame.app import get_server
+from trame.widgets import html
+from trame_client.ui.core import AbstractLayout
+
+from exphub.app.views.incremental_figure import IncrementalFigure
+
+
+def figure(history_x: ArrayLike, history_y: ArrayLike, prediction_y: float = 1.0) -> go.Figure:
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=[10, 20], y=[prediction_y, prediction_y], name="Prediction Line"))
+    fig.add_trace(go.Scatter(x=history_x, y=history_y, name="History Data"))
+    return fig
+
+
+def test_extends_unchanged_histories_and_replaces_changed_ones() -> None:
+    server = get_server("test_incremental_figure", client_type="vue3")
+    deltas = []
+    with AbstractLayout(server, html.Div(trame_server=server)):
+        incremental = IncrementalFigure("history")
+    incremental.triggers.call = lambda event, delta: deltas.append(delta)
+
+    assert incremental.update(figure([0, 1, 2], [5, 6, 7])) == 5
+    assert not deltas
+
+    # new points only: the history is extended, the unchanged prediction is not sent
+    assert incremental.update(figure([0, 1, 2, 3], [5, 6, 7, 8])) == 1
+    assert deltas[-1] == {"extend": {"1": {"x": [3], "y": [8]}}, "replace": {}}
+
+    # an earlier point moved (re-decimated or a rewritten time bin) while the last one did not
+    assert incremental.update(figure([0, 1, 2, 3, 4], [5, 9, 7, 8, 9], prediction_y=2.0)) == 7
+    assert set(deltas[-1]["replace"]) == {"0", "1"} and not deltas[-1]["extend"]
+
+    assert incremental.update(figure([0, 1, 2, 3, 4], [5, 9, 7, 8, 9], prediction_y=2.0)) == 0
+    assert len(deltas) == 2
+
+
+def test_numpy_histories_are_sent_as_lists() -> None:
+    server = get_server("test_incremental_figure_numpy", client_type="vue3")
+    deltas = []
+    with AbstractLayout(server, html.Div(trame_server=server)):
+        incremental = IncrementalFigure("numpy_history")
+    incremental.triggers.call = lambda event, delta: deltas.append(delta)
+
+    assert incremental.update(figure(np.arange(3.0), np.array([5.0, 6.0, 7.0]))) == 5
+    # plotly would send base64 typed arrays, which the browser cannot concat
+    assert server.state["numpy_history_figure"]["data"][1]["x"] == [0.0, 1.0, 2.0]
+
+    assert incremental.update(figure(np.arange(5.0), np.array([5.0, 6.0, 7.0, 8.0, 9.0]))) == 2
+    assert deltas[-1] == {"extend": {"1": {"x": [3.0, 4.0], "y": [8.0, 9.0]}}, "replace": {}}
+    assert incremental.update(figure(np.arange(5.0), np.array([5.0, 0.0, 7.0, 8.0, 9.0]))) == 5
+    assert deltas[-1]["replace"]["1"]["y"] == [5.0, 0.0, 7.0, 8.0, 9.0]
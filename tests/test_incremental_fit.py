@@ -0,0 +1,51 @@
+"""Test package for the running history fits."""
+
+import numpy as np
+
+from exphub.app.models.incremental_fit import HistoryFit, bootstrap_band, inverse_sqrt
+
+
+def test_running_fit_matches_least_squares_and_follows_history_resets() -> None:
+    rng = np.random.default_rng(1)
+    times = list(np.arange(1.0, 41.0))
+    values = list(3.0 / np.sqrt(times) + rng.normal(0, 0.01, len(times)))
+
+    fit = HistoryFit(inverse_sqrt)
+    for size in (5, 20, 40):
+        fit.sync(times[:size], values[:size])
+    slope, intercept = fit.fit.coefficients()
+    expected = np.polyfit(1 / np.sqrt(times), values, 1)
+    assert np.allclose([slope, intercept], expected)
+
+    lower, upper = fit.band([50.0, 100.0])
+    assert np.all(lower < fit.predict([50.0, 100.0])) and np.all(upper > fit.predict([50.0, 100.0]))
+
+    # a new run restarts the history, the fit is rebuilt from it; 1/√t skips t = 0
+    fit.sync([0.0, 1.0, 4.0], [5.0, 4.0, 3.0])
+    assert fit.fit.n == 2
+    assert np.isclose(fit.predict([16.0])[0], 2.5)
+
+    linear = HistoryFit()
+    linear.sync([0.0, 1.0], [5.0, 4.0])
+    linear.sync([0.0, 1.0, 2.0], [5.0, 4.0, 3.0])
+    assert linear.fit.n == 3 and np.isclose(linear.predict([4.0])[0], 1.0)
+
+
+def test_bootstrap_band_agrees_with_analytic_band() -> None:
+    rng = np.random.default_rng(2)
+    times = np.arange(1.0, 201.0)
+    values = 0.5 * times + 3.0 + rng.normal(0, 2.0, len(times))
+    fit = HistoryFit(num_resamples=400)
+    for size in (50, 120, 200):
+        fit.sync(list(times[:size]), list(values[:size]))
+    assert fit.bootstrap is not None
+    # the resampled sums are the sums of the points, on average
+    assert np.allclose(fit.bootstrap.sums[:, 0].mean(), len(times), rtol=0.05)
+
+    x = np.array([200.0, 300.0, 400.0])
+    resampled = fit.resampled(x)
+    assert resampled is not None
+    lower, upper = bootstrap_band(resampled)
+    analytic_lower, analytic_upper = fit.band(x)
+    assert np.all(lower < fit.predict(x)) and np.all(upper > fit.predict(x))
+    assert np.allclose(upper - lower, analytic_upper - analytic_lower, rtol=0.3)
@@ -0,0 +1,39 @@
+"""Test package for the incremental merging statistics."""
+
+import numpy as np
+
+from exphub.app.models.merging_statistics import IncrementalMergingStatistics, SymmetryEquivalenceIndex
+
+# 2/m with the unique axis along b
+OPERATIONS_2_M = np.array([np.eye(3), np.diag([-1, 1, -1]), -np.eye(3), np.diag([1, -1, 1])], dtype=int)
+
+
+def test_equivalent_reflections_share_unique_id() -> None:
+    index = SymmetryEquivalenceIndex(OPERATIONS_2_M, max_index=10)
+    ids = index.lookup(np.array([[1, 2, 3], [-1, 2, -3], [-1, -2, -3], [1, -2, 3], [1, 2, -3]]))
+    assert len(set(ids[:4])) == 1
+    assert ids[4] != ids[0]
+
+
+def test_centering_conditions() -> None:
+    hkl = np.array([[1, 1, 0], [1, 0, 0], [2, 0, 0], [1, 1, 1], [1, 2, 1]])
+    assert list(SymmetryEquivalenceIndex(OPERATIONS_2_M, "F", 4).allowed(hkl)) == [False, False, True, True, False]
+    assert list(SymmetryEquivalenceIndex(OPERATIONS_2_M, "I", 4).allowed(hkl)) == [True, False, True, False, True]
+    assert SymmetryEquivalenceIndex(OPERATIONS_2_M, "P", 4).allowed(hkl).all()
+
+
+def test_incremental_update_matches_full_merge() -> None:
+    rng = np.random.default_rng(0)
+    hkl = rng.integers(-4, 5, (500, 3))
+    intensity = rng.uniform(10, 100, 500)
+    keys = np.arange(500)
+    merging = IncrementalMergingStatistics(SymmetryEquivalenceIndex(OPERATIONS_2_M, max_index=10))
+    merging.update(keys, hkl, intensity, np.sqrt(intensity))
+
+    intensity[:20] *= 2
+    assert merging.update(keys, hkl, intensity, np.sqrt(intensity)) == 20
+
+    full = IncrementalMergingStatistics(SymmetryEquivalenceIndex(OPERATIONS_2_M, max_index=10))
+    full.update(keys, hkl, intensity, np.sqrt(intensity))
+    for name, value in full.statistics().items():
+        assert np.isclose(merging.statistics()[name], value)
@@ -0,0 +1,44 @@
+"""Test package for the sparse peak x interval matrix."""
+
+import numpy as np
+
+from exphub.app.models.peak_matrix import PeakIntervalMatrix
+
+
+def test_reductions_match_per_interval_numpy() -> None:
+    rng = np.random.default_rng(1)
+    matrix = PeakIntervalMatrix((3.0, 5.0, 10.0), (10.0, 50.0, 90.0), capacity=8)
+    recorded = []
+    for interval in range(6):
+        ids = rng.choice(40, size=rng.integers(10, 30), replace=False)
+        intensity = rng.uniform(0, 200, len(ids))
+        sigma = rng.uniform(1, 20, len(ids))
+        matrix.add_interval(10.0 * (interval + 1), ids, intensity, sigma)
+        recorded.append((ids, intensity / sigma))
+
+    fractions = matrix.fraction_above()
+    percentiles = matrix.percentiles()
+    for interval, (_ids, ratio) in enumerate(recorded):
+        assert np.allclose(fractions[:, interval], [np.mean(ratio > level) for level in (3.0, 5.0, 10.0)])
+        assert np.allclose(percentiles[:, interval], np.percentile(ratio, [10.0, 50.0, 90.0]))
+
+    peak = int(recorded[0][0][0])
+    curve = matrix.convergence([peak, 999])
+    assert np.isnan(curve[1]).all()
+    history = matrix.history_of(peak)
+    assert np.allclose(curve[0][np.isfinite(curve[0])], history[:, 1] / history[:, 2])
+    assert np.isclose(matrix.matrix("variance")[peak, 0], history[0, 2] ** 2)
+
+
+def test_oldest_intervals_are_dropped_at_the_cap_and_summaries_kept() -> None:
+    matrix = PeakIntervalMatrix((3.0,), (50.0,), capacity=4, max_entries=8)
+    for interval in range(5):
+        matrix.add_interval(float(interval), [0, 1, 2], [10.0 * (interval + 1)] * 3, [10.0] * 3)
+
+    # a quarter of the cap is dropped at once, in whole intervals
+    assert matrix.nnz <= 8 and matrix.first_interval == 3
+    assert np.allclose(matrix.history_of(1)[:, 0], [3.0, 4.0])
+    assert np.isnan(matrix.convergence([1])[0, :3]).all()
+    assert np.allclose(matrix.percentiles()[0], [1.0, 2.0, 3.0, 4.0, 5.0])
+    assert np.allclose(matrix.fraction_above()[0], [0.0, 0.0, 0.0, 1.0, 1.0])
+    assert list(matrix.peaks_per_interval()) == [3] * 5
@@ -0,0 +1,27 @@
+"""Test package for the persistent peak ids."""
+
+import numpy as np
+
+from exphub.app.models.peak_registry import PeakRegistry
+
+
+def test_ids_survive_reordering_and_drift() -> None:
+    registry = PeakRegistry(tolerance=0.05)
+    q_sample = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    assert np.array_equal(registry.match(q_sample), [0, 1, 2])
+
+    # re-predicted in another order, slightly drifted, with one new peak
+    drifted = np.array([[0.0, 0.0, 1.02], [2.0, 0.0, 0.0], [1.03, 0.0, 0.0]])
+    assert np.array_equal(registry.match(drifted), [2, 3, 0])
+    # the stored centroids moved: a peak drifting further is still followed, from its new position
+    assert np.array_equal(registry.match([[1.07, 0.0, 0.0], [0.0, 0.0, 1.06]]), [0, 2])
+    assert np.array_equal(registry.match([[1.0, 0.0, 0.0]]), [4])
+    assert len(registry) == 5
+
+
+def test_two_peaks_claiming_one_id_keep_the_closest() -> None:
+    registry = PeakRegistry(tolerance=0.05)
+    registry.match([[1.0, 1.0, 1.0]])
+    ids = registry.match([[1.03, 1.0, 1.0], [1.01, 1.0, 1.0]])
+    assert ids[1] == 0 and ids[0] == 1
+    assert np.allclose(registry.q_sample[0], [1.01, 1.0, 1.0])
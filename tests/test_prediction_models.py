@@ -0,0 +1,61 @@
+"""Test package for the prediction model registry."""
+
+import numpy as np
+import pytest
+
+from exphub.app.models.prediction_models import (
+    PREDICTION_MODELS,
+    PredictionModel,
+    SaturationModel,
+    create_prediction_model,
+)
+
+
+def test_registry_and_saturation_fit() -> None:
+    assert {"Poisson Model", "Linear Interpolation", "Saturation Fit"} <= set(PREDICTION_MODELS)
+    with pytest.raises(ValueError):
+        create_prediction_model("Spline", "intensity")
+    with pytest.raises(TypeError):
+        PredictionModel("intensity")  # type: ignore[abstract]
+
+    # I/σ of counting statistics with a systematic floor: 1/(I/σ)² = 4/t + 0.01
+    times = np.arange(1.0, 201.0)
+    isigma = 1.0 / np.sqrt(4.0 / times + 0.01)
+    model = create_prediction_model("Saturation Fit", "intensity")
+    assert isinstance(model, SaturationModel)
+    model.update(times[:50], isigma[:50], version=1)
+    model.update(times, isigma, version=2)
+    assert np.isclose(model.limit(), 10.0)
+    assert np.allclose(model.predict([400.0, 1e6]), 1.0 / np.sqrt(4.0 / np.array([400.0, 1e6]) + 0.01))
+    # an already fitted data version is not refitted
+    model.update(times[:10], isigma[:10], version=2)
+    assert model.history.num_points == len(times)
+
+
+def test_poisson_uncertainty_goes_through_origin() -> None:
+    times = np.r_[0.0, np.arange(1.0, 101.0)]
+    uncertainty = np.r_[0.0, 30.0 / np.sqrt(times[1:])]
+    model = create_prediction_model("Poisson Model", "uncertainty")
+    model.update(times, uncertainty)
+    assert np.allclose(model.predict([400.0]), 1.5)
+    lower, upper = model.band([400.0])
+    assert np.allclose(lower, 1.5) and np.allclose(upper, 1.5)
+
+    rate = create_prediction_model("Poisson Model", "intensity")
+    rate.update([0.0, 10.0, 20.0], [0.0, 4.0, 5.0])
+    lower, upper = rate.band([20.0, 80.0])
+    assert np.allclose(rate.predict([80.0]), 5.0)
+    assert np.all(upper - lower > 0) and (upper - lower)[1] < (upper - lower)[0]
+
+
+def test_bootstrap_band_is_cached_per_data_version() -> None:
+    times = np.arange(1.0, 101.0)
+    uncertainty = 30.0 / np.sqrt(times) * (1 + 0.05 * np.sin(times))
+    model = create_prediction_model("Saturation Fit", "uncertainty")
+    model.update(times, uncertainty, version=3)
+    x = np.linspace(100.0, 2100.0, 100)
+    band = model.confidence_band(x, "Bootstrap")
+    assert model.confidence_band(x, "Bootstrap") is band
+    lower, upper = band
+    assert np.all(lower <= upper) and np.all(np.isfinite(lower))
+    assert model.confidence_band(x, "Analytic") is not band
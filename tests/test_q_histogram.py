@@ -0,0 +1,21 @@
+"""Test package for the coarse Q histogram peak search."""
+
+import numpy as np
+
+from exphub.app.models.q_histogram import CoarseQHistogram
+
+
+def test_candidates_are_found_in_chunked_histogram() -> None:
+    histogram = CoarseQHistogram(max_q=6.0, bins=60)
+    rng = np.random.default_rng(1)
+    peaks = np.array([[1.05, -2.05, 0.35], [-3.15, 0.45, 2.25]])
+    edges = np.linspace(-6.0, 6.0, 61)
+    for _ in range(3):
+        events = np.vstack([rng.normal(q, 0.03, (200, 3)) for q in peaks] + [rng.uniform(-6, 6, (2000, 3))])
+        chunk, _ = np.histogramdd(events, bins=(edges, edges, edges))
+        histogram.add(chunk)
+
+    candidates = histogram.find_candidates(density_threshold_factor=100)
+    assert len(candidates) == 2
+    distance = np.linalg.norm(candidates[:, None, :] - peaks[None, :, :], axis=2)
+    assert np.all(distance.min(axis=0) < histogram.bin_width)
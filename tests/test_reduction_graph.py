@@ -0,0 +1,28 @@
+"""Test package for the reduction stage graph."""
+
+from typing import List
+
+from exphub.app.models.reduction_graph import ReductionGraph
+
+
+def test_only_dirty_stages_rerun() -> None:
+    calls: List[str] = []
+
+    def peak_search() -> str:
+        calls.append("peak_search")
+        return "same UB"
+
+    graph = ReductionGraph()
+    graph.add_stage("peak_search", ("events",), peak_search)
+    graph.add_stage("prediction", ("peak_search", "limits"), lambda: calls.append("prediction"))
+    graph.set_input("events", 1)
+    graph.set_input("limits", (0.5, 11))
+
+    assert graph.run() == ["peak_search", "prediction"]
+    assert graph.run() == []
+    # new events but the same UB: prediction is not dirty
+    graph.set_input("events", 2)
+    assert graph.run() == ["peak_search"]
+    graph.set_input("limits", (0.6, 11))
+    assert graph.run() == ["prediction"]
+    assert calls == ["peak_search", "prediction", "peak_search", "prediction"]
@@ -0,0 +1,100 @@
+"""Test package for the shared live reduction service."""
+
+import logging
+from typing import List
+
+import pytest
+
+from exphub.app.models.reduction_service import ReductionService
+
+
+class FakeWorkflow:
+    """Workflow whose cycles only count themselves."""
+
+    fast_update_interval = 0.01
+
+    def __init__(self) -> None:
+        self.starts = 0
+        self.stops = 0
+        self.cycles = 0
+
+    def start_live_data_collection_instances(self) -> None:
+        self.starts += 1
+
+    def stop_live_data_collection_instances(self) -> None:
+        self.stops += 1
+
+    def orientation_update_due(self) -> bool:
+        return False
+
+    def update_intensity(self) -> None:
+        self.cycles += 1
+        if self.cycles == 1:
+            raise RuntimeError("integration failed")
+
+    def snapshot(self) -> dict:
+        return {"data_version": self.cycles}
+
+
+def test_viewers_share_one_pipeline_and_one_build_per_snapshot() -> None:
+    workflow = FakeWorkflow()
+    service = ReductionService("TEST", workflow)
+    received = []
+    service.subscribe(lambda snapshot: received.append(("a", snapshot["version"])))
+    service.subscribe(lambda snapshot: received.append(("b", snapshot["version"])))
+
+    # the loops are not started here, only the start bookkeeping is exercised
+    service.started = True
+    assert not service.start()
+    assert workflow.starts == 0
+
+    service.publish({"measure_times": [1.0]})
+    assert received == [("a", 1), ("b", 1)]
+
+    builds: List[int] = []
+
+    def build() -> int:
+        builds.append(1)
+        return len(builds)
+
+    for _ in range(3):
+        service.cached("intensity", build)
+    assert builds == [1]
+
+    # a cycle without new results is not published and keeps the cached figures
+    assert service.publish({"data_version": 7})
+    assert not service.publish({"data_version": 7})
+    assert received[-2:] == [("a", 7), ("b", 7)]
+    service.cached("intensity", build)
+    service.cached("intensity", build)
+    assert builds == [1, 1]
+    # the workflow is only built for the first viewer of an instrument
+    created: List[int] = []
+
+    def create() -> FakeWorkflow:
+        created.append(1)
+        return workflow
+
+    service = ReductionService.for_instrument("TEST-2", create)
+    assert ReductionService.for_instrument("TEST-2", create) is service
+    assert service.workflow is workflow and created == [1]
+
+
+def test_stop_joins_the_loops_and_stops_live_data(caplog: pytest.LogCaptureFixture) -> None:
+    workflow = FakeWorkflow()
+    service = ReductionService("TEST-STOP", workflow)
+    received = []
+    service.subscribe(lambda snapshot: received.append(snapshot["version"]))
+    with caplog.at_level(logging.ERROR):
+        assert service.start()
+        while not received:
+            service.stop_event.wait(0.01)
+        threads = list(service.threads)
+        service.stop()
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert not service.started and workflow.stops == 1
+    # the failed first cycle is logged with its traceback and the loop carries on
+    assert "integration failed" in caplog.text and "Traceback" in caplog.text
+    service.stop()
+    assert workflow.stops == 1
@@ -0,0 +1,39 @@
+"""Test package for the run start/stop detection of the live workspace."""
+
+import importlib
+import types
+from typing import List, Tuple
+
+
+class FakeWorkspace:
+    """Live event workspace of one run."""
+
+    def __init__(self, run: int) -> None:
+        self.run = run
+
+    def getRunNumber(self) -> int:  # noqa: N802
+        return self.run
+
+
+def test_rollover_archives_the_renamed_run_and_starts_the_next_once(fake_mantid: types.ModuleType) -> None:
+    run_transition = importlib.import_module("exphub.app.models.run_transition")
+    started: List[int] = []
+    stopped: List[Tuple[int, str]] = []
+    monitor = run_transition.RunTransitionMonitor(
+        "live_event_ws", 100, started.append, lambda run, name: stopped.append((run, name))
+    )
+    # chunks of the running run replace the workspace without a transition
+    monitor.replaceHandle("live_event_ws", FakeWorkspace(100))
+    monitor.renameHandle("live_peaks_ws", "live_peaks_ws_100")
+    assert started == [] and stopped == []
+
+    monitor.renameHandle("live_event_ws", "live_event_ws_100")
+    monitor.addHandle("live_event_ws", FakeWorkspace(101))
+    monitor.replaceHandle("live_event_ws", FakeWorkspace(101))
+    assert stopped == [(100, "live_event_ws_100")] and started == [101]
+    assert monitor.current_run == 101
+    assert monitor.archived_workspace(100) == "live_event_ws_100"
+    # a run the monitor did not see end falls back to the listener's naming
+    assert monitor.archived_workspace(99) == "live_event_ws_99"
+    monitor.stop()
+    assert not monitor.observing_rename
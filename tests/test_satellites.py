@@ -0,0 +1,18 @@
+"""Test package for the satellite peak generation."""
+
+import numpy as np
+
+from exphub.app.models.satellites import satellite_hkl, satellite_offsets
+
+
+def test_satellite_offsets_and_resolution_filter() -> None:
+    offsets, orders = satellite_offsets(["0.5,0,0", "0,0,0", "0,0.25,0"], 1)
+    assert len(offsets) == 4
+    assert len(satellite_offsets(["0.5,0,0", "0,0,0", "0,0.25,0"], 1, cross_terms=True)[0]) == 8
+
+    offsets, orders = satellite_offsets(["0.5,0,0", "0,0,0", "0,0,0"], 1)
+    hkl, parent, order = satellite_hkl(np.array([[1, 0, 0], [2, 0, 0]]), offsets, orders, np.eye(3) * 0.1, 4.5, 20)
+    # 1.5 is shared by both parents, 0.5 (d = 20) and 2.5 (d = 4) are kept or dropped by d-spacing
+    np.testing.assert_allclose(hkl, [[0.5, 0, 0], [1.5, 0, 0]])
+    np.testing.assert_array_equal(parent, [[1, 0, 0], [1, 0, 0]])
+    np.testing.assert_array_equal(order, [[-1, 0, 0], [1, 0, 0]])
@@ -0,0 +1,98 @@
+"""Test package for the live Mantid workflow, run against the fake Mantid of conftest."""
+
+import importlib
+import types
+from typing import List
+
+import numpy as np
+import pytest
+
+
+class FakeEventWorkspace:
+    """Live event workspace with its monitor workspace."""
+
+    def __init__(self) -> None:
+        self.monitor_ws = "monitors"
+
+    def getMonitorWorkspace(self) -> str:  # noqa: N802
+        return self.monitor_ws
+
+    def setMonitorWorkspace(self, monitor_ws: str) -> None:  # noqa: N802
+        self.monitor_ws = monitor_ws
+
+
+def test_the_shared_workflow_is_built_for_the_first_viewer(
+    fake_mantid: types.ModuleType, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    temporal_analysis = importlib.import_module("exphub.app.models.temporal_analysis")
+    # importing the module (as every supervisor worker does) builds no workflow
+    assert "initializing mtd workflow" not in capsys.readouterr().out
+    monkeypatch.setattr(temporal_analysis.ReductionService, "_services", {})
+
+    workflow = temporal_analysis.TemporalAnalysisModel(time_interval=5.0).mtd_workflow
+    assert workflow.time_interval == 5.0 and workflow.time_bins.time_interval == 5.0
+    assert temporal_analysis.TemporalAnalysisModel().mtd_workflow is workflow
+
+
+def test_event_window_trims_in_quarter_window_steps(fake_mantid: types.ModuleType) -> None:
+    temporal_analysis = importlib.import_module("exphub.app.models.temporal_analysis")
+    workflow = temporal_analysis.MantidWorkflow(1.0)
+    events = FakeEventWorkspace()
+    fake_mantid.mtd["live_event_ws"] = events
+    workflow.event_window = 100.0
+    for measure_time in (90.0, 110.0, 130.0, 140.0, 160.0):
+        workflow.measure_time = measure_time
+        workflow.apply_event_window()
+
+    # at 110 s and 140 s the window moved by less than a quarter, so the events were not copied
+    assert [call["StartTime"] for call in fake_mantid.called("FilterByTime")] == [30.0, 60.0]
+    assert workflow.event_window_start == 60.0 and events.monitor_ws == "monitors"
+
+
+def test_counting_target_stops_each_orientation_once(fake_mantid: types.ModuleType) -> None:
+    temporal_analysis = importlib.import_module("exphub.app.models.temporal_analysis")
+    workflow = temporal_analysis.MantidWorkflow(1.0)
+    stopped: List[str] = []
+    workflow.clear_data_after_data_saturation = stopped.append
+    workflow.rsigs = [20.0, 8.0]
+    assert not workflow.check_counting_target()
+
+    workflow.set_counting_target(10.0)
+    # several viewers or cycles asking again do not stop the same orientation twice
+    assert workflow.check_counting_target() and not workflow.check_counting_target()
+    assert workflow.orientation_converged() and len(stopped) == 1
+
+    workflow.goniometer_tracker.segment_starts.append(100.0)
+    assert not workflow.orientation_converged()
+    workflow.set_counting_target(10.0, "poisson")
+    assert not workflow.check_counting_target()
+    workflow.temporal_poisson_uncertainty = [9.0]
+    assert workflow.check_counting_target() and len(stopped) == 2
+
+
+def test_a_viewer_sets_the_shared_counting_target(
+    fake_mantid: types.ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    temporal_analysis = importlib.import_module("exphub.app.models.temporal_analysis")
+    monkeypatch.setattr(temporal_analysis.ReductionService, "_services", {})
+    viewer = temporal_analysis.TemporalAnalysisModel(target_type="I/sigma", target_value=20.0, stop_at_target=True)
+    other = temporal_analysis.TemporalAnalysisModel()
+
+    viewer.apply_counting_target()
+    # another viewer refreshing its estimate leaves the shared target alone
+    other.update_time_to_target()
+    series = temporal_analysis.PREDICTION_MODELS[viewer.prediction_model_type].series
+    assert other.mtd_workflow.counting_target == (5.0, series)
+    viewer.stop_at_target = False
+    viewer.apply_counting_target()
+    assert other.mtd_workflow.counting_target is None
+
+
+def test_peak_search_restarts_with_the_goniometer_segment(fake_mantid: types.ModuleType) -> None:
+    temporal_analysis = importlib.import_module("exphub.app.models.temporal_analysis")
+    workflow = temporal_analysis.MantidWorkflow(1.0)
+    workflow.coarse_q_histogram.add(np.ones_like(workflow.coarse_q_histogram.signal))
+    workflow.goniometer_tracker.segment_starts.append(120.0)
+    workflow.reset_peak_search()
+    assert workflow.peak_search_segment == 1 and workflow.peak_search_time == 120.0
+    assert workflow.coarse_q_histogram.chunks == 0 and not workflow.coarse_q_histogram.signal.any()
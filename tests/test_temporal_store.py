@@ -0,0 +1,41 @@
+"""Test package for the per-peak time series store."""
+
+import pathlib
+
+import numpy as np
+
+from exphub.app.models.temporal_store import TemporalCubeStore
+
+
+def test_store_doubles_its_capacity_and_reopens_after_restart(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "live_1_peak_3")
+    store = TemporalCubeStore((3, 3, 3), path, chunk_rows=4)
+    for i in range(10):
+        store.append(float(i + 1), np.full((3, 3, 3), float(i)), segment=0 if i < 6 else 1)
+    store.flush()
+    assert len(store) == 10 and store.capacity == 16
+    assert np.array_equal(store.center_counts(), np.arange(10.0))
+    assert not store.view().flags.writeable
+
+    cumulative = store.cumulative_counts()[:, 1, 1, 1]
+    assert cumulative[5] == 15.0 and cumulative[6] == 6.0 and cumulative[9] == 30.0
+
+    reopened = TemporalCubeStore((3, 3, 3), path, chunk_rows=4)
+    assert len(reopened) == 10
+    assert np.array_equal(reopened.view("times"), np.arange(1.0, 11.0))
+
+    in_memory = TemporalCubeStore((2,))
+    in_memory.append(1.0, np.ones(2))
+    assert in_memory.view().shape == (1, 2)
+
+
+def test_cumulative_sums_restart_at_a_segment_boundary() -> None:
+    store = TemporalCubeStore((3,))
+    for stop, segment in [(10.0, 0), (20.0, 0), (30.0, 1), (50.0, 1), (60.0, 0)]:
+        store.append(stop, np.array([1.0, stop, 1.0]), segment=segment, variances=np.full(3, 2.0))
+    center = store.cumulative_counts(center=True)
+    assert np.array_equal(center, [10.0, 30.0, 30.0, 80.0, 60.0])
+    # returning to an earlier angle is a new segment run as well
+    assert np.array_equal(store.cumulative_counts("variances", center=True), [2.0, 4.0, 2.0, 4.0, 2.0])
+    assert np.array_equal(store.cumulative_counts()[:, 1], center)
+    assert np.array_equal(store.segment_elapsed(), [10.0, 20.0, 10.0, 30.0, 10.0])
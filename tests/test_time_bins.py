@@ -0,0 +1,43 @@
+"""Test package for the hierarchical time bins."""
+
+import numpy as np
+import pytest
+
+from exphub.app.models.temporal_store import TemporalCubeStore
+from exphub.app.models.time_bins import HierarchicalTimeBins
+
+
+def test_bins_are_fine_at_the_start_and_logarithmic_later() -> None:
+    bins = HierarchicalTimeBins(1.0, multiplier=1.1, head_bins=60)
+    assert bins.bin_of(59.5) == 59
+    bins.bin_of(36000.0)
+    # ten hours of 1 s intervals in well under 200 bins
+    assert len(bins.edges) < 200
+    assert np.allclose(np.diff(bins.edges[:61]), 1.0)
+
+    uniform = HierarchicalTimeBins(2.0, multiplier=1.0)
+    assert uniform.split(3.0, 8.5) == [(1, 3.0, 4.0), (2, 4.0, 6.0), (3, 6.0, 8.0), (4, 8.0, 8.5)]
+
+
+def test_merged_slices_equal_one_slice() -> None:
+    bins = HierarchicalTimeBins(1.0, multiplier=2.0, head_bins=2)
+    store = TemporalCubeStore((1,))
+    rng = np.random.default_rng(0)
+    events = np.sort(rng.uniform(0, 20, 500))
+    for start, stop in [(0.0, 2.5), (2.5, 3.2), (3.2, 11.0), (11.0, 20.0)]:
+        for index, slice_start, slice_stop in bins.split(start, stop):
+            counts = np.array([np.count_nonzero((events >= slice_start) & (events < slice_stop))], dtype=float)
+            if not len(store) or slice_start == bins.bounds(index)[0]:
+                store.append(slice_stop, counts)
+            else:
+                store.merge_last(slice_stop, counts)
+    edges = np.r_[0.0, store.view("times")]
+    assert np.array_equal(store.view()[:, 0], np.histogram(events, edges)[0])
+    assert np.array_equal(store.view("variances"), store.view())
+
+
+def test_non_numeric_interval_fails_clearly() -> None:
+    with pytest.raises(TypeError, match="must be numbers"):
+        HierarchicalTimeBins(object())  # type: ignore[arg-type]
+    with pytest.raises(ValueError, match="positive"):
+        HierarchicalTimeBins(float("nan"))
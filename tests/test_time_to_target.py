@@ -0,0 +1,23 @@
+"""Test package for the time-to-target estimator."""
+
+import numpy as np
+
+from exphub.app.models.prediction_models import create_prediction_model
+from exphub.app.models.time_to_target import estimate_time_to_target, time_to_reach
+
+
+def test_remaining_time_and_charge_from_the_poisson_fit() -> None:
+    times = np.arange(1.0, 101.0)
+    uncertainty = 30.0 / np.sqrt(times)
+    model = create_prediction_model("Poisson Model", "uncertainty")
+    model.update(times, uncertainty)
+
+    # 30 / sqrt(t) = 1 at t = 900 s, 800 s after the last point
+    estimate = estimate_time_to_target(model, times, uncertainty, target=1.0, charge_rate=2e-6)
+    assert np.isclose(estimate["remaining_time"], 800.0, rtol=1e-3)
+    assert np.isclose(estimate["remaining_charge"], 1.6e-3, rtol=1e-3)
+    assert estimate["remaining_time_95"] >= estimate["remaining_time"] and not estimate["reached"]
+
+    assert estimate_time_to_target(model, times, uncertainty, target=5.0, charge_rate=2e-6)["reached"]
+    # a floor above the target is never reached
+    assert time_to_reach(lambda t: 2.0 + 30.0 / np.sqrt(t), 100.0, 1.0) == np.inf
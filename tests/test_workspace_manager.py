@@ -0,0 +1,46 @@
+"""Test package for the workspace lifecycle manager."""
+
+from exphub.app.models.workspace_manager import WorkspaceLifecycleManager
+
+
+class FakeWorkspace:
+    """Workspace of a given size in bytes."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+
+    def getMemorySize(self) -> int:  # noqa: N802
+        return self.size
+
+
+class FakeADS(dict):
+    """Analysis data service: workspaces by name."""
+
+    def doesExist(self, name: str) -> bool:  # noqa: N802
+        return name in self
+
+
+def test_a_workspace_is_freed_after_its_last_consumer() -> None:
+    ads = FakeADS(live_event_ws_ub=FakeWorkspace(3 * 2**20), live_predict_peaks_ws=FakeWorkspace(2**20))
+    manager = WorkspaceLifecycleManager(ads, ads.pop)
+    manager.produced("live_event_ws_ub", consumers=("convert_to_md", "integrate_found_peaks"))
+    manager.produced("live_predict_peaks_ws", persistent=True)
+
+    manager.consumed("live_event_ws_ub", "convert_to_md")
+    # a repeated or unknown consumer does not free it early
+    manager.consumed("live_event_ws_ub", "convert_to_md")
+    manager.consumed("live_event_ws_ub", "predict")
+    assert ads.doesExist("live_event_ws_ub")
+    assert manager.report("orientation")["tracked_workspace_mb"] == 4.0
+
+    manager.consumed("live_event_ws_ub", "integrate_found_peaks")
+    assert not ads.doesExist("live_event_ws_ub") and "live_event_ws_ub" not in manager.pending
+    assert manager.report("orientation")["tracked_workspace_mb"] == 1.0
+
+    # persistent workspaces are only measured, and freed by name on a run change
+    manager.consumed("live_predict_peaks_ws", "integrate")
+    assert ads.doesExist("live_predict_peaks_ws")
+    ads["timestep_event_ws"] = FakeWorkspace(10)
+    manager.produced("timestep_event_ws", consumers=("convert_to_md",))
+    manager.release_all(extra=("live_predict_peaks_ws",))
+    assert not ads and not manager.pending